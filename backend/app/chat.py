@@ -1,197 +1,359 @@
 import os, re
-import json
-import numpy as np
-from datetime import datetime, timedelta
-import pytz
-import faiss
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain_community.vectorstores import FAISS
-from uuid import uuid4
-from langchain_core.documents import Document
+from threading import Lock
+from contextlib import nullcontext
+from datetime import datetime
+from langchain_core.prompts import format_document
+from langchain.chains.conversational_retrieval.base import _get_chat_history
 #from sklearn.metrics.pairwise import cosine_similarity
 from .extract_texts import logger
-from .tokens import count_tokens, count_tokens_in_chat_history
-from langchain_huggingface import HuggingFaceEmbeddings
-import faiss
-from langchain_community.docstore.in_memory import InMemoryDocstore
-
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
-index = faiss.IndexFlatL2(len(embeddings.embed_query("hello world")))
-
-vector_store_1 = FAISS(
-    embedding_function=embeddings,
-    index=index,
-    docstore=InMemoryDocstore(),
-    index_to_docstore_id={},
+from .tokens import count_tokens, count_tokens_batch, count_tokens_in_chat_history
+from .semantic_cache import SemanticCache
+from .streaming import stream_chain_answer, drain_stream
+from .concurrency import llm_limiter, ServerBusy
+from .embedding_service import get_embedder
+from .chat_log import ChatLog, read_tail
+from .sessions import create_session_store
+from .chat_writer import ChatTurnWriter
+from .condense import QuestionCondenser
+from .supabase_reader import iter_table_rows, SUPABASE_PAGE_SIZE
+from .single_flight import SingleFlight, normalize_question
+
+QA_CACHE_PATH = os.getenv("QA_CACHE_PATH", "qa_cache_index")
+CHAT_HISTORY_PATH = os.getenv("CHAT_HISTORY_PATH", "chat_history.jsonl")
+# Turns read back from the end of the chat log at startup
+CHAT_HISTORY_TAIL = int(os.getenv("CHAT_HISTORY_TAIL", "1000"))
+embeddings = get_embedder("qa_cache")
+
+qa_cache = SemanticCache(
+    embeddings,
+    path=QA_CACHE_PATH,
+    similarity_threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+    ann_min_size=int(os.getenv("SEMANTIC_CACHE_ANN_MIN_SIZE", "5000")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "50000")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS")) if os.getenv("SEMANTIC_CACHE_TTL_SECONDS") else None,
 )
+
+chat_log = ChatLog(CHAT_HISTORY_PATH)
+# Recent turns per user (keyed by session id, defaulting to the email)
+session_store = create_session_store()
+SESSION_END_MESSAGE = "Session data successfully saved. Please refresh to start a new session."
+condenser = QuestionCondenser()
+# Identical in-flight questions share one retrieval + answer call
+answer_flights = SingleFlight()
+
+def append_to_chat_log(question, answer, **fields):
+    """Append one answered turn to the local chat log."""
+    try:
+        chat_log.append(question, answer, **fields)
+    except Exception as e:
+        logger.error(f"Error appending to local chat log: {e}")
+
+def add_to_qa_cache(question, answer):
+    """Embed a single answered question once and store it in the Q&A cache."""
+    try:
+        qa_cache.add(question, answer)
+    except Exception as e:
+        logger.error(f"Error adding question to Q&A cache: {e}")
+
+def seed_qa_cache(chat_history):
+    """Populate an empty Q&A cache from existing chat history (one-time migration)."""
+    try:
+        # Old logs recorded "stop" turns; the command must never be answered from the cache
+        qa_cache.seed((question, answer) for question, answer in chat_history if not is_stop_command(question))
+    except Exception as e:
+        logger.error(f"Error seeding Q&A cache: {e}")
+
 email_regex = re.compile(r"^\d{2}f\d{7}@ds\.study\.iitm\.ac\.in$")
 
 def is_valid_email(email):
     """Validate email format."""
     return email_regex.match(email) is not None or email == "nitin@ee.iitm.ac.in" or email == "lalitmach22@gmail.com"
 
-def save_session_to_supabase(supabase, email, name, chat_history):
-    """Save the chat session to Supabase."""
-    ist = pytz.timezone("Asia/Kolkata")
-    timestamp = datetime.now(ist).strftime("%Y-%m-%d %H:%M")
-    
-    data_list = []
-    for question, answer in chat_history:
-        data = {
-            "email": email,
-            "name": name if name else None,
-            "question": question,
-            "answer": answer,
-            "timestamp": timestamp,
-        }
-        data_list.append(data)
-    try:
-        response = supabase.table("chat_sessions_2").insert(data_list).execute()
-        if response:
-            logger.info("Session data saved to Supabase.")
-            return True
-        else:
-            logger.error(f"Error saving session data to Supabase: {response}")
-            return False
-    except Exception as e:
-        logger.error(f"Exception occurred while saving session data to Supabase: {e}")
-        return False
+_chat_writers = {}
+_chat_writers_lock = Lock()
+
+def get_chat_writer(supabase):
+    """Return the background writer persisting turns through this Supabase client, starting it on first use."""
+    with _chat_writers_lock:
+        if id(supabase) not in _chat_writers:
+            _chat_writers[id(supabase)] = ChatTurnWriter(supabase).start()
+        return _chat_writers[id(supabase)]
 
-def get_chat_history_from_supabase(supabase):
-    """Retrieve all chat history from Supabase and return as a list of (question, answer) tuples."""
+def iter_chat_history_from_supabase(supabase, since=None, page_size=SUPABASE_PAGE_SIZE):
+    """Stream (question, answer) tuples from Supabase page by page, optionally only turns at or after ``since``."""
     try:
-        response = supabase.table("chat_sessions_2").select("question, answer").execute()
-        if response.data and isinstance(response.data, list):
-            chat_history = [(entry["question"], entry["answer"]) for entry in response.data]
-            logger.info(f"Retrieved {len(chat_history)} chat history entries from Supabase.")
-            return chat_history
-        else:
-            logger.warning("No chat history found in Supabase or data is not in expected format.")
-            return []
+        rows = iter_table_rows(supabase, "chat_sessions_2", columns="question, answer", page_size=page_size,
+                               since=since, since_column="timestamp")
+        for entry in rows:
+            yield entry["question"], entry["answer"]
     except Exception as e:
         logger.error(f"Exception occurred while retrieving chat history from Supabase: {e}")
-        return []
 
-def save_chat_history_to_local(path, chat_history):
-    """Save updated chat history to local file."""
+def get_chat_history_from_supabase(supabase, since=None):
+    """Retrieve chat history from Supabase and return as a list of (question, answer) tuples."""
+    chat_history = list(iter_chat_history_from_supabase(supabase, since=since))
+    if chat_history:
+        logger.info(f"Retrieved {len(chat_history)} chat history entries from Supabase.")
+    else:
+        logger.warning("No chat history found in Supabase.")
+    return chat_history
+
+def load_chat_history_from_local(path, limit=CHAT_HISTORY_TAIL):
+    """Load the last ``limit`` turns from the local chat log as (question, answer) pairs."""
     try:
-        with open(path, 'w') as f:
-            json.dump(chat_history, f)
-        logger.info("Chat history saved to local storage.")
+        chat_history = [(entry["question"], entry["answer"]) for entry in read_tail(path, limit)]
     except Exception as e:
-        logger.error(f"Error saving chat history to local file: {e}")
-def load_chat_history_from_local(path):
-    """Load chat history from local file if it exists, otherwise return empty list."""
-    if os.path.exists(path):
-        try:
-            with open(path, 'r') as f:
-                chat_history = json.load(f)
-                logger.info(f"Loaded {len(chat_history)} chat history entries from local storage.")
-                return chat_history
-        except Exception as e:
-            logger.error(f"Error loading chat history from local file: {e}")
-            return []
+        logger.error(f"Error loading chat history from local file: {e}")
+        return []
+    if chat_history:
+        logger.info(f"Loaded {len(chat_history)} chat history entries from local storage.")
     else:
         logger.info("No local chat history found. Starting a new session.")
-        return []
+    return chat_history
 
 def get_limited_chat_history(chat_history, limit=5):
     """Limit chat history to the last 'limit' number of entries."""
     return chat_history[-limit:]
 
 
-def find_similar_question_faiss(user_input, vector_store_1, embeddings, k = 4, 
-                                fetch_k = 5, lambda_mult = 0.5, filter = None,  
-                                similarity_threshold = 0.9):
-    """Find similar questions using FAISS-based vector search with maximal marginal relevance and score filtering."""
-    user_input_embedding = embeddings.embed_query(user_input)
-    results_with_scores = vector_store_1.max_marginal_relevance_search_with_score_by_vector(
-        embedding=user_input_embedding,
-        k=k,
-        fetch_k=fetch_k,
-        lambda_mult=lambda_mult,
-        filter=filter
-    )
-    filtered_results = [
-        (result[0].page_content.split("Answer:")[1].strip(), result[1])
-        for result in results_with_scores
-        if result[1] >= similarity_threshold
-    ]
-    
-    if filtered_results:
-        logger.info(f"Found {len(filtered_results)} similar questions with similarity score >= {similarity_threshold}.")
-        best_match = filtered_results  
-        logger.info(f"Found best similar answer with similarity score: {best_match}")
-        return best_match
-    else:
-        logger.info(f"No similar questions found with similarity score >= {similarity_threshold}.")
-        return None 
+def prepare_chain_inputs(user_input, chat_history):
+    """Build the retrieval chain inputs for a question and count the history tokens sent with it."""
+    limited_chat_history = get_limited_chat_history(chat_history, limit=5)
+
+    limited_chat_history_tuples = [tuple(pair) for pair in limited_chat_history]
+    tokens_count = count_tokens_in_chat_history(limited_chat_history_tuples)
+    return {"question": user_input, "chat_history": limited_chat_history_tuples}, tokens_count
+
+def count_prompt_tokens(retrieval_chain, user_input, include_context=True, chat_history=()):
+    """Count the tokens the chain would send to the LLM for a question, without calling the LLM.
+
+    Counts the question-condensing prompt (only sent when the condenser needs the LLM) and
+    the answer prompt with the retrieved context stuffed in. Retrieval embeds the
+    question; pass ``include_context=False`` to skip it and count the prompt alone.
+    ``chat_history`` is the session's recent turns, as passed to the chain.
+    Returns a dict with the per-part and total token counts.
+    """
+    inputs, history_tokens = prepare_chain_inputs(user_input, list(chat_history))
+    condense_prompt = ""
+    if condenser.needs_llm(user_input, inputs["chat_history"]):
+        get_chat_history = retrieval_chain.get_chat_history or _get_chat_history
+        condense_prompt = retrieval_chain.question_generator.prompt.format(
+            chat_history=get_chat_history(inputs["chat_history"]), question=user_input)
+
+    combine_chain = retrieval_chain.combine_docs_chain
+    documents = retrieval_chain.retriever.invoke(user_input) if include_context else []
+    context = combine_chain.document_separator.join(
+        format_document(document, combine_chain.document_prompt) for document in documents)
+    answer_prompt = combine_chain.llm_chain.prompt.format_prompt(
+        **{combine_chain.document_variable_name: context, "question": user_input}).to_string()
+    (question_tokens, context_tokens, condense_tokens, answer_tokens), _ = count_tokens_batch(
+        [user_input, context, condense_prompt, answer_prompt])
+    return {
+        "question_tokens": question_tokens,
+        "history_tokens": history_tokens,
+        "context_tokens": context_tokens,
+        "context_documents": len(documents),
+        "condense_prompt_tokens": condense_tokens,
+        "answer_prompt_tokens": answer_tokens,
+        "total_tokens": condense_tokens + answer_tokens,
+    }
+
+def lookup_cached_answer(user_input):
+    """Return a cached answer for a similar question, or None.
 
-def process_user_input(supabase, retrieval_chain, email, name, user_input, chat_history, start_time=None):
+    The cache is shared by every session, so callers pass the standalone
+    (condensed) question: a bare follow-up like "can you explain that?" must
+    never match another conversation's turn.
+    """
+    # Lookups embed only the incoming question; cached answers were embedded once on append.
+    try:
+        cached = qa_cache.lookup(user_input)
+    except Exception as e:
+        logger.error(f"Error looking up Q&A cache: {e}")
+        return None
+    if cached:
+        answer, score = cached
+        logger.info(f"Answered from Q&A cache (similarity {score:.3f}); skipping LLM call.")
+        return answer
+    return None
+
+def is_stop_command(user_input):
+    """True if the user asked to end the session."""
+    return user_input.strip().lower() == "stop"
+
+def end_session(session_id, elapsed_time):
+    """End the session on "stop" without calling the LLM or touching the Q&A cache."""
+    session_store.clear(session_id)
+    logger.info(f"Session ended after {elapsed_time}; its turns are already queued for Supabase.")
+    return SESSION_END_MESSAGE, 0
+
+def record_answer(supabase, email, name, user_input, answer, session_id, tokens_count, cache_question=None):
+    """Run the bookkeeping for an answer and return the (message, tokens_count) to send back.
+
+    The answer is added to the Q&A cache under ``cache_question`` when one is
+    given; answers served from the cache pass None and report 0 tokens.
+    """
+    session_store.append(session_id, user_input, answer)
+    # Persisted to Supabase in the background, so every turn is kept without paying insert latency here
+    get_chat_writer(supabase).enqueue(email, name, user_input, answer)
+    if cache_question is not None:
+        add_to_qa_cache(cache_question, answer)
+    append_to_chat_log(user_input, answer, email=email, session_id=session_id)
+    logger.info(f"Chatbot response: {answer}")
+    if cache_question is None:
+        return answer, 0
+    tokens_count += count_tokens(user_input)
+    logger.info(f"Number of tokens sent to API: {tokens_count}")
+    return answer, tokens_count
+
+def condense_question(retrieval_chain, inputs):
+    """Make the question standalone, holding an LLM slot only if that needs the LLM."""
+    needs_llm = condenser.needs_llm(inputs["question"], inputs["chat_history"])
+    with llm_limiter.slot() if needs_llm else nullcontext():
+        return condenser.rewrite_inputs(retrieval_chain, inputs)
+
+async def acondense_question(retrieval_chain, inputs):
+    """Async variant of condense_question."""
+    needs_llm = condenser.needs_llm(inputs["question"], inputs["chat_history"])
+    async with llm_limiter.aslot() if needs_llm else nullcontext():
+        return await condenser.arewrite_inputs(retrieval_chain, inputs)
+
+def answer_key(retrieval_chain, inputs):
+    """Identify an answer by its normalized standalone question and the index snapshot it is retrieved from."""
+    return normalize_question(inputs["question"]), getattr(retrieval_chain.retriever, "generation", None)
+
+def invoke_chain(retrieval_chain, inputs):
+    """Answer standalone chain inputs, joining an identical in-flight call instead of starting another."""
+    def invoke():
+        with llm_limiter.slot():
+            return retrieval_chain.invoke(inputs)
+    return answer_flights.do(answer_key(retrieval_chain, inputs), invoke)
+
+async def ainvoke_chain(retrieval_chain, inputs):
+    """Async variant of invoke_chain."""
+    async def invoke():
+        async with llm_limiter.aslot():
+            return await retrieval_chain.ainvoke(inputs)
+    return await answer_flights.ado(answer_key(retrieval_chain, inputs), invoke)
+
+def process_user_input(supabase, retrieval_chain, email, name, user_input, session_id, start_time=None):
     """Process the user's input and return the chatbot's response."""
-    chat_history_1 = []
-    
     logger.info(f"Processing user input: {user_input} and type of user input is {type(user_input)}")      
     if start_time is None:
         start_time = datetime.now()
 
     current_time = datetime.now()
     elapsed_time = current_time - start_time  
-    documents = [
-        Document(
-            page_content=f"Question: {question}\nAnswer: {answer}",
-            metadata={"source": "chat_history"}
-        )
-        for question, answer in chat_history
-    ]
-    logger.info(f"Created  documents type is{type(documents)}")
-      
-    uuids = [str(uuid4()) for _ in range(len(documents))]
+    if is_stop_command(user_input):
+        return end_session(session_id, elapsed_time)
     try:
-        vector_store_1.add_documents(documents=documents, ids=uuids)
-        logger.info(f"Documents added to vector store. and lenght of documents added is {len(documents)}")
-        logger.info(f"Vector store contains {vector_store_1.index.ntotal} vectors.")
-    except Exception as e:
-        logger.error(f"Error adding documents to vector store: {e}")
-        return "An error occurred while processing your input.", 0
-    results = find_similar_question_faiss(user_input, vector_store_1, embeddings, k = 1, 
-                                fetch_k = 5, lambda_mult = 0.5, filter = None,  
-                                similarity_threshold = 0.95)
-    if results:    
-        logger.info(f"Answer to similar question is {results}and type is {type(results)} and number of similar questions are {len(results)}")
-    
-    if results and len(chat_history )> 50:
-        logger.info(f"Found answer to similar question: {results}")
-        chat_history_1.append((user_input, results))
-        return results, 0
-    vector_store_1.delete(ids=uuids)  
-    try:
-        limited_chat_history = get_limited_chat_history(chat_history_1, limit=5)
-        #limited_chat_history = get_limited_chat_history(chat_history, limit=5)
-
-        limited_chat_history_tuples = [tuple(pair) for pair in limited_chat_history]
-        tokens_count = count_tokens_in_chat_history(limited_chat_history_tuples)
-        response = retrieval_chain.invoke({"question": user_input, "chat_history": limited_chat_history_tuples})
+        inputs, tokens_count = prepare_chain_inputs(user_input, session_store.get(session_id))
+        inputs = condense_question(retrieval_chain, inputs)
+        cached_answer = lookup_cached_answer(inputs["question"])
+        if cached_answer:
+            return record_answer(supabase, email, name, user_input, cached_answer, session_id, 0)
+        response = invoke_chain(retrieval_chain, inputs)
         
         logger.info(f"Response type is {type(response)}")
         answer = response["answer"]
-        chat_history.append((user_input, answer))
-        chat_history_1.append((user_input, answer))
-        save_chat_history_to_local(r'D:\BDM2\backend\app\chat_history.json', chat_history)            
-        logger.info(f"Chatbot response: {answer}")
-        tokens_count += count_tokens(user_input)
-        logger.info(f"Number of tokens sent to API: {tokens_count}")
-
-        if not user_input.lower() == "stop" or elapsed_time > timedelta(minutes=30):
-            return answer , tokens_count
-        if user_input.lower() == "stop" or elapsed_time > timedelta(minutes=30):
-            save_session_to_supabase(supabase, email, name, chat_history)
-            logger.info("Session data successfully saved to Supabase.")
-            end_message = "Session data successfully saved. Please refresh to start a new session."
-            chat_history.clear()
-            chat_history_1.clear()
-            logger.info("Chat history cleared after session end.")
-            return end_message, tokens_count  
+        return record_answer(supabase, email, name, user_input, answer, session_id, tokens_count, inputs["question"])
+    except ServerBusy:
+        raise
     except Exception as e:
         logger.error(f"Exception occurred while processing user input: {e}")
-        return "An error occurred while processing your input. Please try again.", 0
\ No newline at end of file
+        return "An error occurred while processing your input. Please try again.", 0
+
+async def aprocess_user_input(supabase, retrieval_chain, email, name, user_input, session_id, start_time=None):
+    """Async variant of process_user_input: waits for an LLM slot and awaits the chain without blocking the loop.
+
+    Raises ServerBusy when the LLM queue is full so the caller can answer with a retry hint.
+    """
+    logger.info(f"Processing user input: {user_input}")
+    if start_time is None:
+        start_time = datetime.now()
+    elapsed_time = datetime.now() - start_time
+    if is_stop_command(user_input):
+        return end_session(session_id, elapsed_time)
+    try:
+        inputs, tokens_count = prepare_chain_inputs(user_input, session_store.get(session_id))
+        inputs = await acondense_question(retrieval_chain, inputs)
+        cached_answer = lookup_cached_answer(inputs["question"])
+        if cached_answer:
+            return record_answer(supabase, email, name, user_input, cached_answer, session_id, 0)
+        response = await ainvoke_chain(retrieval_chain, inputs)
+        return record_answer(supabase, email, name, user_input, response["answer"], session_id, tokens_count,
+                             inputs["question"])
+    except ServerBusy:
+        raise
+    except Exception as e:
+        logger.error(f"Exception occurred while processing user input: {e}")
+        return "An error occurred while processing your input. Please try again.", 0
+
+def stream_user_input(supabase, retrieval_chain, email, name, user_input, session_id, start_time=None):
+    """Process the user's input, yielding ("token", text) events as the answer is generated.
+
+    Ends with a ("done", {"answer", "tokens_count"}) event once the usual
+    bookkeeping has run, or an ("error", {"message"}) event. An LLM slot is
+    taken before the first event, so ServerBusy surfaces on the first ``next()``.
+    Followers of an identical in-flight question get the answer as a single token.
+    If the client disconnects (the generator is closed) mid-answer, the answer
+    is still finished inside the LLM slot and recorded.
+    """
+    logger.info(f"Streaming answer for user input: {user_input}")
+    if start_time is None:
+        start_time = datetime.now()
+    elapsed_time = datetime.now() - start_time
+    if is_stop_command(user_input):
+        message, tokens_count = end_session(session_id, elapsed_time)
+        yield "token", message
+        yield "done", {"answer": message, "tokens_count": tokens_count}
+        return
+    disconnected = False
+    try:
+        inputs, tokens_count = prepare_chain_inputs(user_input, session_store.get(session_id))
+        inputs = condense_question(retrieval_chain, inputs)
+        cached_answer = lookup_cached_answer(inputs["question"])
+        if cached_answer:
+            answer, tokens_count = record_answer(supabase, email, name, user_input, cached_answer, session_id, 0)
+            yield "token", answer
+            yield "done", {"answer": answer, "tokens_count": tokens_count}
+            return
+        key = answer_key(retrieval_chain, inputs)
+        flight, is_leader = answer_flights.begin(key)
+        if not is_leader:
+            # An identical question is already being answered; wait for it and send the answer in one piece.
+            response = flight.result()
+            yield "token", response["answer"]
+        else:
+            try:
+                with llm_limiter.slot():
+                    stream = stream_chain_answer(retrieval_chain, inputs)
+                    while True:
+                        try:
+                            token = next(stream)
+                        except StopIteration as stop:
+                            response = stop.value
+                            break
+                        try:
+                            yield "token", token
+                        except GeneratorExit:
+                            # The client went away but the chain keeps calling the LLM on its worker thread;
+                            # finish it while holding the slot so the limiter counts it, and record the turn.
+                            logger.info("Client disconnected mid-stream; finishing the answer before releasing the LLM slot.")
+                            disconnected = True
+                            response = drain_stream(stream)
+                            break
+            except BaseException as e:
+                answer_flights.finish(key, flight, error=e if isinstance(e, Exception) else RuntimeError("Stream closed."))
+                raise
+            answer_flights.finish(key, flight, response)
+        answer, tokens_count = record_answer(supabase, email, name, user_input, response["answer"],
+                                             session_id, tokens_count, inputs["question"])
+        if not disconnected:
+            yield "done", {"answer": answer, "tokens_count": tokens_count}
+    except ServerBusy:
+        raise
+    except Exception as e:
+        logger.error(f"Exception occurred while streaming user input: {e}")
+        if not disconnected:
+            yield "error", {"message": "An error occurred while processing your input. Please try again."}
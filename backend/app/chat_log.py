@@ -0,0 +1,188 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from threading import Lock
+from uuid import uuid4
+from .extract_texts import logger
+try:
+    import fcntl
+except ImportError:  # Windows: a single process owns the log
+    fcntl = None
+
+CHAT_LOG_FSYNC_EVERY = int(os.getenv("CHAT_LOG_FSYNC_EVERY", "32"))
+CHAT_LOG_FSYNC_INTERVAL_SECONDS = float(os.getenv("CHAT_LOG_FSYNC_INTERVAL_SECONDS", "1"))
+CHAT_LOG_COMPACT_BYTES = int(os.getenv("CHAT_LOG_COMPACT_BYTES", str(64 * 1024 * 1024)))
+CHAT_LOG_KEEP_ENTRIES = int(os.getenv("CHAT_LOG_KEEP_ENTRIES", "10000"))
+TAIL_BLOCK_BYTES = 64 * 1024
+
+
+def _parse_lines(lines):
+    entries = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            # A torn final line from a crash mid-write; everything before it is intact.
+            logger.warning(f"Skipping unreadable chat log line: {line[:60]!r}")
+    return entries
+
+
+def read_tail(path, limit):
+    """Return the last ``limit`` entries of a JSONL log, reading backwards from the end of the file."""
+    if limit <= 0 or not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= limit:
+            step = min(TAIL_BLOCK_BYTES, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode("utf-8").splitlines()
+    if position > 0:
+        lines = lines[1:]  # first line may be cut mid-way by the block boundary
+    return _parse_lines(lines)[-limit:]
+
+
+class ChatLog:
+    """Append-only JSONL log of chat turns.
+
+    Each turn is a single ``O_APPEND`` write, so appends are O(1) and safe across
+    threads and processes. fsync is batched (every ``fsync_every`` appends or
+    ``fsync_interval`` seconds). Once the file grows past ``compact_bytes`` it is
+    rewritten atomically with only the last ``keep_entries`` turns. Appends hold
+    a shared lock on ``<path>.lock`` and compaction an exclusive one, so no
+    process appends between a compaction's read and its replace.
+    """
+
+    def __init__(self, path, fsync_every=CHAT_LOG_FSYNC_EVERY, fsync_interval=CHAT_LOG_FSYNC_INTERVAL_SECONDS,
+                 compact_bytes=CHAT_LOG_COMPACT_BYTES, keep_entries=CHAT_LOG_KEEP_ENTRIES):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self.keep_entries = keep_entries
+        self.lock_path = f"{path}.lock"
+        self._lock = Lock()
+        self._fd = None
+        self._lock_fd = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._migrate_json_array()
+
+    def _migrate_json_array(self):
+        """Convert a chat history file written by the old whole-file JSON format into JSONL."""
+        try:
+            with open(self.path, "r") as f:
+                if f.read(1) != "[":
+                    return
+                f.seek(0)
+                history = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        with self._file_lock(exclusive=True):
+            self._rewrite([{"question": question, "answer": answer} for question, answer in history])
+        logger.info(f"Migrated {len(history)} chat history entries in {self.path} to JSONL.")
+
+    @contextmanager
+    def _file_lock(self, exclusive=False):
+        """Lock shared by every process using this log: shared for appends, exclusive for rewrites."""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_fd is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _rewrite(self, entries):
+        tmp_path = f"{self.path}.{uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _open(self):
+        # Reopen when another process compacted (replaced) the file under us.
+        if self._fd is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            os.close(self._fd)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, question, answer, **fields):
+        """Append one turn (plus any extra JSON-serializable ``fields``)."""
+        line = json.dumps({"question": question, "answer": answer, "ts": time.time(), **fields}) + "\n"
+        with self._lock:
+            with self._file_lock():
+                self._open()
+                os.write(self._fd, line.encode("utf-8"))
+                size = os.fstat(self._fd).st_size
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+            if size > self.compact_bytes:
+                self._compact(force=False)
+
+    def _sync(self):
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _compact(self, force=True):
+        with self._file_lock(exclusive=True):
+            if not force and os.path.getsize(self.path) <= self.compact_bytes:
+                return  # another process compacted it while we waited for the lock
+            entries = read_tail(self.path, self.keep_entries)
+            self._rewrite(entries)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._unsynced = 0
+        logger.info(f"Compacted chat log {self.path} to the last {len(entries)} entries.")
+
+    def compact(self):
+        """Rewrite the log keeping only the last ``keep_entries`` turns."""
+        with self._lock:
+            self._sync()
+            self._compact()
+
+    def tail(self, limit):
+        """Return the last ``limit`` logged entries as dicts, oldest first."""
+        return read_tail(self.path, limit)
+
+    def flush(self):
+        """fsync any appends not yet on disk."""
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        """Flush and close the log file."""
+        with self._lock:
+            self._sync()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
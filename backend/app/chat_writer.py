@@ -0,0 +1,189 @@
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from threading import Condition, Lock, Thread
+from uuid import uuid4
+import pytz
+from .extract_texts import logger
+
+CHAT_SESSIONS_TABLE = "chat_sessions_2"
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "50"))
+CHAT_WRITE_FLUSH_SECONDS = float(os.getenv("CHAT_WRITE_FLUSH_SECONDS", "2"))
+CHAT_WRITE_MAX_QUEUE = int(os.getenv("CHAT_WRITE_MAX_QUEUE", "10000"))
+CHAT_WRITE_RETRIES = int(os.getenv("CHAT_WRITE_RETRIES", "3"))
+CHAT_WRITE_BACKOFF_SECONDS = float(os.getenv("CHAT_WRITE_BACKOFF_SECONDS", "0.5"))
+# Turn ids remembered to drop re-enqueued turns that were already written
+DEDUPE_WINDOW = 10000
+# PostgREST codes for an unknown column and for an ON CONFLICT without a matching unique constraint
+MISSING_TURN_ID_ERRORS = ("PGRST204", "42703", "42P10")
+
+
+def is_missing_turn_id_error(error):
+    """True if a write failed because the table lacks the unique ``turn_id`` column."""
+    message = str(error)
+    return any(code in message for code in MISSING_TURN_ID_ERRORS) or "turn_id" in message
+
+
+class ChatTurnWriter:
+    """Write-behind queue persisting chat turns to Supabase in batches.
+
+    Turns are queued on the request path and inserted by a background thread
+    once ``batch_size`` are waiting or ``flush_interval`` seconds have passed.
+    Failed batches are retried with backoff and stay queued if every attempt
+    fails. Each turn gets a ``turn_id`` once, at enqueue time, and is upserted
+    on it, so retrying a batch whose insert committed but timed out writes no
+    duplicates (see ``migrations/001_chat_sessions_turn_id.sql``). Tables
+    without the column fall back to plain inserts. :meth:`close` flushes what
+    is left.
+    """
+
+    def __init__(self, client, table=CHAT_SESSIONS_TABLE, batch_size=CHAT_WRITE_BATCH_SIZE,
+                 flush_interval=CHAT_WRITE_FLUSH_SECONDS, max_queue=CHAT_WRITE_MAX_QUEUE,
+                 retries=CHAT_WRITE_RETRIES, backoff=CHAT_WRITE_BACKOFF_SECONDS):
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = deque()
+        self._queued_ids = set()
+        self._written_ids = OrderedDict()
+        self._condition = Condition()
+        self._write_lock = Lock()
+        self._worker = None
+        self._closed = False
+        self._upsert = True
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start the background flusher thread (idempotent)."""
+        with self._condition:
+            if self._worker is None:
+                self._worker = Thread(target=self._run, name="chat-writer", daemon=True)
+                self._worker.start()
+        return self
+
+    def enqueue(self, email, name, question, answer, turn_id=None):
+        """Queue one turn for persistence; returns False if it was a duplicate or the queue is full."""
+        ist = pytz.timezone("Asia/Kolkata")
+        timestamp = datetime.now(ist).strftime("%Y-%m-%d %H:%M")
+        turn_id = turn_id or str(uuid4())
+        row = {
+            "turn_id": turn_id,
+            "email": email,
+            "name": name if name else None,
+            "question": question,
+            "answer": answer,
+            "timestamp": timestamp,
+        }
+        with self._condition:
+            if turn_id in self._queued_ids or turn_id in self._written_ids:
+                self.duplicates += 1
+                return False
+            if len(self._queue) >= self.max_queue:
+                # The turn is still in the local chat log; only the Supabase copy is skipped.
+                self.dropped += 1
+                logger.error(f"Chat write queue full ({self.max_queue}); dropping turn for {email}.")
+                return False
+            self._queue.append((turn_id, row))
+            self._queued_ids.add(turn_id)
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if len(self._queue) < self.batch_size and not self._closed:
+                    self._condition.wait(self.flush_interval)
+                if self._closed:
+                    return
+            if not self._flush_batch():
+                # Supabase is failing; back off for a full interval before retrying the batch.
+                time.sleep(self.flush_interval)
+
+    def _write(self, rows):
+        table = self.client.table(self.table)
+        if not self._upsert:
+            return table.insert([{k: v for k, v in row.items() if k != "turn_id"} for row in rows]).execute()
+        try:
+            return table.upsert(rows, on_conflict="turn_id").execute()
+        except Exception as e:
+            if not is_missing_turn_id_error(e):
+                raise
+            logger.warning(f"{self.table} has no unique turn_id column ({e}); falling back to plain inserts. "
+                           "Apply migrations/001_chat_sessions_turn_id.sql to make retries idempotent.")
+            self._upsert = False
+            return self._write(rows)
+
+    def _insert_with_retry(self, rows):
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self._write(rows)
+                if response:
+                    return True
+                logger.error(f"Insert of {len(rows)} chat turns returned {response} (attempt {attempt}).")
+            except Exception as e:
+                logger.error(f"Insert of {len(rows)} chat turns failed (attempt {attempt}): {e}")
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+        return False
+
+    def _flush_batch(self):
+        """Write up to one batch; returns False if the batch could not be written."""
+        with self._write_lock:
+            with self._condition:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if not batch:
+                return True
+            if not self._insert_with_retry([row for _, row in batch]):
+                with self._condition:
+                    self._queue.extendleft(reversed(batch))
+                    self.failed_batches += 1
+                return False
+            with self._condition:
+                for turn_id, _ in batch:
+                    self._queued_ids.discard(turn_id)
+                    self._written_ids[turn_id] = True
+                while len(self._written_ids) > DEDUPE_WINDOW:
+                    self._written_ids.popitem(last=False)
+                self.written += len(batch)
+                self.batches += 1
+            logger.info(f"Saved {len(batch)} chat turns to Supabase.")
+            return True
+
+    def flush(self):
+        """Synchronously write everything queued; returns False if a batch still failed."""
+        while self._queue:
+            if not self._flush_batch():
+                return False
+        return True
+
+    def close(self):
+        """Stop the flusher thread and write any remaining turns."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._worker is not None:
+            self._worker.join(timeout=self.flush_interval + 1)
+        if not self.flush():
+            logger.error(f"{len(self._queue)} chat turns could not be saved to Supabase at shutdown.")
+
+    def stats(self):
+        """Report queue depth and write counters."""
+        with self._condition:
+            return {
+                "queued": len(self._queue),
+                "written": self.written,
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "duplicates": self.duplicates,
+                "dropped": self.dropped,
+            }
@@ -0,0 +1,52 @@
+import os
+from langchain_core.documents import Document
+from .extract_texts import logger, iter_hidden_documents, EXTRACTION_WORKERS
+from .embeddings import generate_hash
+from .tokens import get_encoding
+
+CHUNK_SIZE_TOKENS = int(os.getenv("CHUNK_SIZE_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+def split_text_by_tokens(text, chunk_size=CHUNK_SIZE_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS):
+    """Split text into windows of at most ``chunk_size`` tokens overlapping by ``chunk_overlap`` tokens."""
+    if chunk_overlap >= chunk_size:
+        raise ValueError("chunk_overlap must be smaller than chunk_size.")
+    encoding = get_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= chunk_size:
+        return [text] if text.strip() else []
+    step = chunk_size - chunk_overlap
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunks.append(encoding.decode(tokens[start:start + chunk_size]).strip())
+        if start + chunk_size >= len(tokens):
+            break
+    return [chunk for chunk in chunks if chunk]
+
+def chunk_sections(filename, sections, chunk_size=CHUNK_SIZE_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS):
+    """Turn the cleaned sections of one file into Documents with source/page metadata and stable chunk ids."""
+    documents = []
+    for section in sections:
+        for number, chunk in enumerate(split_text_by_tokens(section.text, chunk_size, chunk_overlap)):
+            chunk_id = generate_hash(f"{section.source}|{section.page}|{number}|{chunk}")
+            documents.append(Document(
+                page_content=chunk,
+                metadata={"file": filename, "source": section.source, "page": section.page,
+                          "chunk": number, "chunk_id": chunk_id},
+            ))
+    return documents
+
+def iter_document_chunks(directory, files=None, max_workers=EXTRACTION_WORKERS,
+                         chunk_size=CHUNK_SIZE_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS):
+    """Yield ``(filename, chunks)`` per extracted file, chunking each file as it arrives."""
+    for result in iter_hidden_documents(directory, files=files, max_workers=max_workers):
+        chunks = chunk_sections(result.filename, result.sections, chunk_size, chunk_overlap)
+        logger.info(f"Split {result.filename} into {len(chunks)} chunks.")
+        yield result.filename, chunks
+
+def load_document_chunks(directory, files=None, max_workers=EXTRACTION_WORKERS):
+    """Return the chunk Documents for all (or just ``files``) documents in a directory."""
+    documents = []
+    for _, chunks in iter_document_chunks(directory, files=files, max_workers=max_workers):
+        documents.extend(chunks)
+    return documents
@@ -0,0 +1,163 @@
+import os
+import asyncio
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from threading import Event, Lock
+from .extract_texts import logger
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+LLM_RETRY_AFTER_SECONDS = int(os.getenv("LLM_RETRY_AFTER_SECONDS", "2"))
+
+
+class ServerBusy(Exception):
+    """Raised when no LLM slot is available; ``retry_after`` is the suggested wait in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy, retry after {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class _ThreadWaiter:
+    def __init__(self):
+        self.event = Event()
+
+    def grant(self):
+        self.event.set()
+        return True
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def _set(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+    def grant(self):
+        try:
+            self.loop.call_soon_threadsafe(self._set)
+            return True
+        except RuntimeError:
+            # The waiter's event loop is gone; hand the slot to the next waiter.
+            return False
+
+
+class ConcurrencyLimiter:
+    """Bound concurrent LLM calls with a bounded FIFO wait queue.
+
+    At most ``max_concurrent`` callers hold a slot; up to ``max_waiting`` more
+    wait for one, for at most ``wait_timeout`` seconds. Anyone beyond that is
+    rejected immediately with :class:`ServerBusy`. Threads and coroutines (from
+    any event loop) share the same slots and queue.
+    """
+
+    def __init__(self, max_concurrent=LLM_MAX_CONCURRENCY, max_waiting=LLM_MAX_QUEUE,
+                 wait_timeout=LLM_QUEUE_TIMEOUT_SECONDS, retry_after=LLM_RETRY_AFTER_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self._lock = Lock()
+        self._active = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _enter_or_queue(self, waiter_factory):
+        """Take a free slot (returns None) or queue a new waiter (returns it); raises ServerBusy when full."""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                self.admitted += 1
+                return None
+            if len(self._waiters) >= self.max_waiting:
+                self.rejected += 1
+                logger.warning(f"LLM queue full ({self.max_waiting} waiting); rejecting request.")
+                raise ServerBusy(self.retry_after)
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter):
+        """Drop a waiter that gave up; returns False if it was granted a slot in the meantime."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            self.timeouts += 1
+            return True
+
+    def release(self):
+        """Free a slot, handing it straight to the oldest waiter if there is one."""
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._active -= 1
+                    return
+                waiter = self._waiters.popleft()
+                self.admitted += 1
+            if waiter.grant():
+                return
+
+    def acquire(self):
+        """Block until a slot is free; raises ServerBusy if the queue is full or the wait times out."""
+        waiter = self._enter_or_queue(_ThreadWaiter)
+        if waiter is None or waiter.event.wait(self.wait_timeout) or not self._abandon(waiter):
+            return
+        raise ServerBusy(self.retry_after)
+
+    async def aacquire(self):
+        """Async variant of :meth:`acquire`; waiting does not block the event loop."""
+        waiter = self._enter_or_queue(_AsyncWaiter)
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.wait_timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                raise ServerBusy(self.retry_after)
+        except BaseException:
+            # Cancelled (e.g. client went away): leave the queue, or give back a slot granted meanwhile.
+            if not self._abandon(waiter):
+                self.release()
+            raise
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of the ``with`` block."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Hold a slot for the duration of the ``async with`` block."""
+        await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """Report current load and how many requests were admitted, rejected or timed out."""
+        with self._lock:
+            return {
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_waiting": self.max_waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+
+
+llm_limiter = ConcurrencyLimiter()
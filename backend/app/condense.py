@@ -0,0 +1,115 @@
+import os
+import re
+import json
+from collections import OrderedDict
+from threading import Lock
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from .extract_texts import logger
+from .embeddings import generate_hash
+
+# "llm" condenses follow-ups with the chain's question generator, "heuristic" rewrites them locally
+CONDENSE_MODE = os.getenv("CONDENSE_MODE", "llm")
+CONDENSE_CACHE_SIZE = int(os.getenv("CONDENSE_CACHE_SIZE", "10000"))
+# Words that usually point back at an earlier turn
+FOLLOW_UP_WORDS = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|him|her|his|above|previous|earlier|"
+    r"same|former|latter|else|another|one|ones)\b", re.IGNORECASE)
+FOLLOW_UP_START = re.compile(r"^\s*(and|also|but|so|then|or|what about|how about|why not)\b", re.IGNORECASE)
+MIN_STANDALONE_WORDS = 4
+
+
+def is_standalone_question(question):
+    """Guess whether a question can be answered without the conversation before it."""
+    words = question.split()
+    return (len(words) >= MIN_STANDALONE_WORDS
+            and not FOLLOW_UP_START.search(question)
+            and not FOLLOW_UP_WORDS.search(question))
+
+
+def heuristic_rewrite(question, chat_history):
+    """Make a follow-up self-contained by attaching the previous question as context, without an LLM call."""
+    previous_question = chat_history[-1][0]
+    return f"{question.strip()} (following up on: {previous_question.strip()})"
+
+
+class QuestionCondenser:
+    """Decides how each question is made standalone before retrieval, avoiding the condense LLM call when possible.
+
+    Empty histories and questions that look standalone are used as-is, and
+    condensed questions are cached on a digest of the history window and the
+    question. In ``heuristic`` mode follow-ups are rewritten locally instead of
+    by the LLM. Every skipped LLM call is counted and logged.
+    """
+
+    def __init__(self, mode=CONDENSE_MODE, cache_size=CONDENSE_CACHE_SIZE):
+        self.mode = mode
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self.counts = {"empty_history": 0, "standalone": 0, "cache_hit": 0, "heuristic": 0, "llm": 0}
+
+    def _key(self, question, chat_history):
+        return generate_hash(json.dumps([question, [list(turn) for turn in chat_history]]))
+
+    def _plan(self, question, chat_history):
+        """Return (standalone question or None if the LLM is needed, reason, cache key)."""
+        if not chat_history:
+            return question, "empty_history", None
+        if is_standalone_question(question):
+            return question, "standalone", None
+        key = self._key(question, chat_history)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key], "cache_hit", key
+        if self.mode == "heuristic":
+            return heuristic_rewrite(question, chat_history), "heuristic", key
+        return None, "llm", key
+
+    def _record(self, reason, key=None, condensed=None):
+        with self._lock:
+            self.counts[reason] += 1
+            if key is not None and condensed is not None and reason in ("llm", "heuristic"):
+                self._cache[key] = condensed
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            saved = self.saved_calls()
+        if reason not in ("llm", "empty_history"):
+            logger.info(f"Skipped condense LLM call ({reason}); {saved} saved so far.")
+
+    def needs_llm(self, question, chat_history):
+        """True if condensing this question would call the LLM."""
+        return self._plan(question, chat_history)[0] is None
+
+    def _generator_inputs(self, retrieval_chain, question, chat_history):
+        get_chat_history = retrieval_chain.get_chat_history or _get_chat_history
+        return {"question": question, "chat_history": get_chat_history(chat_history)}
+
+    def rewrite_inputs(self, retrieval_chain, inputs):
+        """Return chain inputs with a standalone question and no history, so the chain skips its own condense step."""
+        question, reason, key = self._plan(inputs["question"], inputs["chat_history"])
+        if question is None:
+            generator = retrieval_chain.question_generator
+            question = generator.invoke(self._generator_inputs(retrieval_chain, inputs["question"],
+                                                                inputs["chat_history"]))[generator.output_key]
+        self._record(reason, key, question)
+        return {"question": question, "chat_history": []}
+
+    async def arewrite_inputs(self, retrieval_chain, inputs):
+        """Async variant of :meth:`rewrite_inputs`."""
+        question, reason, key = self._plan(inputs["question"], inputs["chat_history"])
+        if question is None:
+            generator = retrieval_chain.question_generator
+            question = (await generator.ainvoke(self._generator_inputs(retrieval_chain, inputs["question"],
+                                                                       inputs["chat_history"])))[generator.output_key]
+        self._record(reason, key, question)
+        return {"question": question, "chat_history": []}
+
+    def saved_calls(self):
+        """Condense LLM calls the chain would have made but that were answered without one."""
+        return self.counts["standalone"] + self.counts["cache_hit"] + self.counts["heuristic"]
+
+    def stats(self):
+        """Report how questions were made standalone and how many condense LLM calls were saved."""
+        with self._lock:
+            return dict(self.counts, saved_llm_calls=self.saved_calls(), cached=len(self._cache))
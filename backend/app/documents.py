@@ -1,42 +1,104 @@
 import os
+import json
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from .extract_texts import logger
+from .supabase_reader import iter_table_rows
 
-def generate_file_hash(filepath):
-    """Generate a SHA-256 hash for the content of a file."""
+FILE_MANIFEST_PATH = os.getenv("FILE_MANIFEST_PATH", "file_manifest.json")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def generate_file_hash(filepath, chunk_size=HASH_CHUNK_SIZE):
+    """Generate a SHA-256 hash for the content of a file, reading it in chunks."""
+    digest = hashlib.sha256()
     with open(filepath, "rb") as f:
-        file_content = f.read()
-    return hashlib.sha256(file_content).hexdigest()
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-def store_file_hashes_in_supabase(directory, supabase_client):
-    """Store filenames and their hashes in Supabase."""
+def load_file_manifest(path=FILE_MANIFEST_PATH):
+    """Load the local manifest of filename -> {size, mtime_ns, sha256}."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading file manifest from {path}: {e}")
+        return {}
+
+def save_file_manifest(manifest, path=FILE_MANIFEST_PATH):
+    """Atomically write the local file manifest."""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Error saving file manifest to {path}: {e}")
+
+def scan_directory(directory, manifest, max_workers=None):
+    """Return an updated manifest for the files in a directory.
+
+    Files whose size and mtime match the previous manifest keep their recorded
+    hash; the rest are hashed in parallel on a thread pool.
+    """
+    current = {}
+    to_hash = []
+    for entry in os.scandir(directory):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        previous = manifest.get(entry.name)
+        if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+            current[entry.name] = previous
+        else:
+            current[entry.name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            to_hash.append(entry.name)
+
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            paths = [os.path.join(directory, filename) for filename in to_hash]
+            for filename, file_hash in zip(to_hash, pool.map(generate_file_hash, paths)):
+                current[filename]["sha256"] = file_hash
+    logger.info(f"Scanned {len(current)} files; hashed {len(to_hash)} changed by size or mtime.")
+    return current
+
+def scan_file_hashes(directory, manifest_path=FILE_MANIFEST_PATH):
+    """Return {filename: sha256} for the files in a directory, re-hashing only files whose size or mtime changed."""
+    manifest = scan_directory(directory, load_file_manifest(manifest_path))
+    save_file_manifest(manifest, manifest_path)
+    return {filename: entry["sha256"] for filename, entry in manifest.items()}
+
+def sync_file_hashes_to_supabase(supabase_client, file_hashes):
+    """Upsert the hashes that differ from those stored in Supabase; returns the filenames written."""
     existing_hashes = load_file_hashes_from_supabase(supabase_client)
-    new_or_modified_files = []
-
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        if not os.path.isfile(filepath):
-            continue  
-
-        file_hash = generate_file_hash(filepath)
-        if filename not in existing_hashes or existing_hashes[filename] != file_hash:
-            new_or_modified_files.append((filename, file_hash))
-    for filename, file_hash in new_or_modified_files:
-        data = {"filename": filename, "hash": file_hash}
-        response = supabase_client.table("file_hashes").upsert(data).execute()
+    new_or_modified_files = [
+        (filename, file_hash)
+        for filename, file_hash in file_hashes.items()
+        if existing_hashes.get(filename) != file_hash
+    ]
+    if new_or_modified_files:
+        data = [{"filename": filename, "hash": file_hash} for filename, file_hash in new_or_modified_files]
+        response = supabase_client.table("file_hashes").upsert(data, on_conflict="filename").execute()
         if response:
-            logger.info(f"Stored hash for file: {filename}")
+            logger.info(f"Stored hashes for {len(data)} files.")
         else:
-            logger.error(f"Failed to store hash for file: {filename} | Response: {response}")
-    
+            logger.error(f"Failed to store hashes for {len(data)} files | Response: {response}")
+
     return [f[0] for f in new_or_modified_files]
 
+def store_file_hashes_in_supabase(directory, supabase_client, manifest_path=FILE_MANIFEST_PATH):
+    """Store filenames and their hashes in Supabase."""
+    return sync_file_hashes_to_supabase(supabase_client, scan_file_hashes(directory, manifest_path))
+
 def load_file_hashes_from_supabase(supabase_client):
     """Load filenames and their hashes from Supabase."""
-    response = supabase_client.table("file_hashes").select("*").execute()
-    if response:
-        logger.info("Successfully loaded file hashes from Supabase.")
-        return {item["filename"]: item["hash"] for item in response.data}
-    else:
-        logger.error(f"Failed to load file hashes from Supabase. | Response: {response}")
+    try:
+        rows = iter_table_rows(supabase_client, "file_hashes", columns="filename, hash", key="filename")
+        file_hashes = {item["filename"]: item["hash"] for item in rows}
+    except Exception as e:
+        logger.error(f"Failed to load file hashes from Supabase. | Error: {e}")
         return {}
+    logger.info("Successfully loaded file hashes from Supabase.")
+    return file_hashes
@@ -0,0 +1,157 @@
+import os
+import json
+from contextlib import contextmanager
+from threading import Lock
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from .extract_texts import logger
+from .embeddings import generate_hash
+try:
+    import fcntl
+except ImportError:  # Windows: a single process owns the cache
+    fcntl = None
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+
+
+class EmbeddingCache:
+    """Content-addressed on-disk embedding store for one model.
+
+    Vectors are appended as raw float32 rows to ``vectors.f32`` and read back
+    through a read-only memory map; ``index.tsv`` maps each text hash to its row.
+    Both files are append-only, so a write costs O(batch) regardless of size.
+    Appends hold an exclusive file lock and take their row numbers from the
+    file size, so worker processes can share one cache directory.
+    """
+
+    def __init__(self, directory, model_name):
+        self.model_name = model_name
+        self.path = os.path.join(directory, model_name.replace("/", "__"))
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.index_path = os.path.join(self.path, "index.tsv")
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self.lock_path = os.path.join(self.path, "lock")
+        self._lock = Lock()
+        self._rows = {}
+        self._dim = None
+        self._count = 0
+        self._index_offset = 0
+        self._mmap = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        try:
+            self._refresh()
+            logger.info(f"Loaded embedding cache for {self.model_name} with {len(self._rows)} vectors.")
+        except Exception as e:
+            logger.error(f"Error loading embedding cache from {self.path}: {e}")
+            self._rows, self._count, self._index_offset = {}, 0, 0
+
+    def _refresh(self):
+        """Catch up with rows appended since the files were last read, including by other processes."""
+        if self._dim is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path, "r") as f:
+                self._dim = json.load(f)["dim"]
+        self._count = os.path.getsize(self.vectors_path) // (4 * self._dim) if os.path.exists(self.vectors_path) else 0
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # A trailing line without a newline is still being written.
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.decode("utf-8").splitlines():
+            text_hash, _, row = line.partition("\t")
+            # Rows beyond the vector file come from an interrupted write.
+            if row and int(row) < self._count:
+                self._rows[text_hash] = int(row)
+        self._index_offset += len(complete)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared by every process appending to this cache."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _vectors(self):
+        if self._mmap is None or len(self._mmap) != self._count:
+            self._mmap = np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(self._count, self._dim))
+        return self._mmap
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get_many(self, hashes):
+        """Return a dict of hash -> vector for the hashes present in the cache."""
+        with self._lock:
+            found = [(h, self._rows[h]) for h in hashes if h in self._rows]
+            if not found:
+                return {}
+            vectors = self._vectors()
+            return {h: vectors[row].tolist() for h, row in found}
+
+    def put_many(self, hashes, vectors):
+        """Append vectors for hashes that are not cached yet."""
+        vectors = np.asarray(vectors, dtype="float32")
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump({"model": self.model_name, "dim": self._dim}, f)
+            new = [(h, v) for h, v in zip(hashes, vectors) if h not in self._rows]
+            if not new:
+                return
+            # Vectors are flushed before the index so the index never points past the data;
+            # a partial row left by an interrupted write is cut off first.
+            end = self._count * 4 * self._dim
+            if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > end:
+                os.truncate(self.vectors_path, end)
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.vstack([v for _, v in new]).tobytes())
+            with open(self.index_path, "ab") as f:
+                f.write("".join(f"{text_hash}\t{self._count + offset}\n"
+                                for offset, (text_hash, _) in enumerate(new)).encode("utf-8"))
+                self._index_offset = f.tell()
+            for offset, (text_hash, _) in enumerate(new):
+                self._rows[text_hash] = self._count + offset
+            self._count += len(new)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts missing from an :class:`EmbeddingCache` to the model."""
+
+    def __init__(self, embedder, cache):
+        self.embedder = embedder
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        """Embed texts, reusing cached vectors for unchanged content."""
+        texts = list(texts)
+        hashes = [generate_hash(text) for text in texts]
+        cached = self.cache.get_many(hashes)
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+        if missing:
+            vectors = self.embedder.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing.keys()), vectors)
+            cached.update(zip(missing.keys(), (list(map(float, v)) for v in vectors)))
+        logger.info(f"Embedded {len(missing)} of {len(texts)} texts ({len(texts) - len(missing)} from cache).")
+        return [cached[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text):
+        """Embed a query; queries are not cached."""
+        return self.embedder.embed_query(text)
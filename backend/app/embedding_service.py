@@ -0,0 +1,162 @@
+import os
+import time
+from collections import deque
+from threading import Condition, Lock, Thread
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from .extract_texts import logger
+from .embedding_cache import EmbeddingCache, CachedEmbeddings, EMBEDDING_CACHE_DIR
+
+# Model used for each purpose; purposes that resolve to the same model share one instance.
+EMBEDDING_MODELS = {
+    "documents": os.getenv("DOCUMENT_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+    "qa_cache": os.getenv("QA_CACHE_EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2"),
+}
+BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64"))
+
+_embedders = {}
+_embedders_lock = Lock()
+
+
+def load_huggingface_model(model_name):
+    """Load a sentence-transformers model through langchain's HuggingFace wrapper."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    start = time.perf_counter()
+    model = HuggingFaceEmbeddings(model_name=model_name)
+    logger.info(f"Loaded embedding model {model_name} in {time.perf_counter() - start:.2f}s.")
+    return model
+
+
+class BatchingEmbeddings(Embeddings):
+    """Lazily loaded embedding model that coalesces concurrent calls into batched forward passes.
+
+    Calls arriving within ``batch_window_ms`` of each other are concatenated (up
+    to ``max_batch_size`` texts) and embedded by a single worker thread. Calls
+    with more than ``max_batch_size`` texts (index rebuilds) are split into
+    slices on a bulk lane, and the worker only takes a bulk slice when no
+    smaller call is waiting, so queries never queue behind a whole rebuild.
+    """
+
+    def __init__(self, model_name, loader=load_huggingface_model,
+                 batch_window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._loader = loader
+        self._model = None
+        self._lock = Lock()
+        self._ready = Condition()
+        self._queries = deque()
+        self._bulk = deque()
+        self._worker = None
+        self.batches = 0
+
+    @property
+    def model(self):
+        """The underlying model, loaded on first use."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._loader(self.model_name)
+        return self._model
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = Thread(target=self._run, name=f"embedder-{self.model_name}", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while not self._queries and not self._bulk:
+                    self._ready.wait()
+                if self._queries:
+                    pending = self._take_queries()
+                else:
+                    texts, future = self._bulk.popleft()
+                    if not future.set_running_or_notify_cancel():
+                        continue  # an earlier slice of the same call failed
+                    pending = [(texts, future)]
+            self._embed_batch(pending)
+
+    def _take_queries(self):
+        """Coalesce the waiting small calls and those arriving within the batch window (lock held)."""
+        pending = [self._queries.popleft()]
+        size = len(pending[0][0])
+        deadline = time.monotonic() + self.batch_window
+        while size < self.max_batch_size:
+            if self._queries:
+                item = self._queries.popleft()
+                pending.append(item)
+                size += len(item[0])
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            self._ready.wait(timeout)
+        return pending
+
+    def _embed_batch(self, pending):
+        texts = [text for batch, _ in pending for text in batch]
+        try:
+            vectors = self.model.embed_documents(texts)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        if len(pending) > 1:
+            logger.debug(f"Embedded {len(texts)} texts from {len(pending)} calls in one batch.")
+        offset = 0
+        for batch, future in pending:
+            future.set_result(vectors[offset:offset + len(batch)])
+            offset += len(batch)
+
+    def embed_documents(self, texts):
+        """Embed a list of texts, sharing the forward pass with concurrent callers."""
+        texts = list(texts)
+        if not texts:
+            return []
+        self._ensure_worker()
+        if len(texts) <= self.max_batch_size:
+            future = Future()
+            with self._ready:
+                self._queries.append((texts, future))
+                self._ready.notify()
+            return future.result()
+        futures = []
+        with self._ready:
+            for start in range(0, len(texts), self.max_batch_size):
+                futures.append(Future())
+                self._bulk.append((texts[start:start + self.max_batch_size], futures[-1]))
+            self._ready.notify()
+        vectors = []
+        try:
+            for future in futures:
+                vectors.extend(future.result())
+        finally:
+            for future in futures:
+                future.cancel()
+        return vectors
+
+    def embed_query(self, text):
+        """Embed a single query text."""
+        return self.embed_documents([text])[0]
+
+
+def get_embedder(purpose):
+    """Return the shared embedder configured for ``purpose`` (e.g. "documents" or "qa_cache").
+
+    Document embeddings go through the on-disk embedding cache, so unchanged
+    texts are never re-embedded across restarts, rebuilds or Supabase syncs.
+    """
+    model_name = EMBEDDING_MODELS[purpose]
+    with _embedders_lock:
+        if model_name not in _embedders:
+            _embedders[model_name] = CachedEmbeddings(
+                BatchingEmbeddings(model_name), EmbeddingCache(EMBEDDING_CACHE_DIR, model_name)
+            )
+        return _embedders[model_name]
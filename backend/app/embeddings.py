@@ -1,37 +1,99 @@
+import time
 import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from .extract_texts import logger
+from .supabase_reader import iter_table_rows, SUPABASE_PAGE_SIZE
+
+# Hashes per `in_` lookup: 100 sha256 hex digests keep the GET query string near 7 KB,
+# well under common gateway URL limits
+HASH_LOOKUP_PAGE_SIZE = 100
 
 def generate_hash(text):
     """Generate a SHA-256 hash for the text."""
     return hashlib.sha256(text.encode()).hexdigest()
 
-def store_embeddings_in_supabase(supabase_client, cleaned_texts, embedder):
-    """Generate embeddings for cleaned text and store them in Supabase."""
-    
+def fetch_existing_hashes(supabase_client, hashes, page_size=HASH_LOOKUP_PAGE_SIZE, retries=3, backoff=0.5):
+    """Return the subset of hashes already stored in Supabase, querying them in pages with `in_`.
+
+    Each page is retried with exponential backoff; the error is raised once a page fails ``retries`` times.
+    """
+    existing = set()
+    for start in range(0, len(hashes), page_size):
+        page = hashes[start:start + page_size]
+        for attempt in range(1, retries + 1):
+            try:
+                response = supabase_client.table("embeddings").select("hash").in_("hash", page).execute()
+                break
+            except Exception as e:
+                logger.error(f"Lookup of {len(page)} hashes failed (attempt {attempt}): {e}")
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2 ** (attempt - 1))
+        existing.update(row["hash"] for row in response.data or [])
+    return existing
+
+def upsert_with_retry(supabase_client, table, rows, retries=3, backoff=0.5, on_conflict="hash"):
+    """Upsert a batch of rows, retrying with exponential backoff on failure."""
+    for attempt in range(1, retries + 1):
+        try:
+            response = supabase_client.table(table).upsert(rows, on_conflict=on_conflict).execute()
+            if response:
+                return True
+            logger.error(f"Upsert of {len(rows)} rows into {table} returned {response} (attempt {attempt}).")
+        except Exception as e:
+            logger.error(f"Upsert of {len(rows)} rows into {table} failed (attempt {attempt}): {e}")
+        if attempt < retries:
+            time.sleep(backoff * 2 ** (attempt - 1))
+    return False
+
+def store_embeddings_in_supabase(supabase_client, cleaned_texts, embedder, batch_size=100,
+                                 lookup_page_size=HASH_LOOKUP_PAGE_SIZE, max_workers=4, retries=3):
+    """Generate embeddings for cleaned text and store them in Supabase.
+
+    Existing hashes are fetched in one paginated query, only missing texts are
+    embedded (in batches of ``batch_size``) and each batch is upserted while the
+    next one is embedded, with at most ``max_workers`` uploads in flight.
+    Returns a progress/throughput report.
+    """
+    start = time.perf_counter()
+    texts_by_hash = {}
     for text in cleaned_texts:
-        text_hash = generate_hash(text)
-        response = supabase_client.table("embeddings").select("*").eq("hash", text_hash).execute()
-        if response.data:
-            logger.info(f"Embedding already exists for text: {text[:30]}...")
-            continue
-        embedding = embedder.embed_documents([text])[0]
-        data = {
-            "text": text,
-            "embedding": embedding,
-            "hash": text_hash
-        }
-        response = supabase_client.table("embeddings").insert(data).execute()
-        if response:
-            logger.info(f"Successfully stored embedding for text: {text[:30]}...")
-        else:
-            logger.error(f"Failed to store embedding for text: {text[:30]}... | Response: {response}")
-
-def load_embeddings_from_supabase(supabase_client):
-    """Load embeddings from Supabase."""
-    response = supabase_client.table("embeddings").select("*").execute()
-    if response.status_code == 200:
-        logger.info("Successfully loaded embeddings from Supabase.")
-        return response.data
-    else:
-        logger.error(f"Failed to load embeddings from Supabase. | Response: {response}")
-        return None
\ No newline at end of file
+        texts_by_hash.setdefault(generate_hash(text), text)
+    existing = fetch_existing_hashes(supabase_client, list(texts_by_hash), page_size=lookup_page_size,
+                                     retries=retries)
+    missing = [(h, t) for h, t in texts_by_hash.items() if h not in existing]
+    logger.info(f"{len(existing)} of {len(texts_by_hash)} embeddings already in Supabase; {len(missing)} to store.")
+
+    report = {"total": len(texts_by_hash), "existing": len(existing), "embedded": 0,
+              "stored": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = {}
+        for offset in range(0, len(missing), batch_size):
+            batch = missing[offset:offset + batch_size]
+            embeddings = embedder.embed_documents([text for _, text in batch])
+            report["embedded"] += len(batch)
+            rows = [
+                {"text": text, "embedding": list(embedding), "hash": text_hash}
+                for (text_hash, text), embedding in zip(batch, embeddings)
+            ]
+            if len(in_flight) >= max_workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report["stored" if future.result() else "failed"] += in_flight.pop(future)
+            in_flight[pool.submit(upsert_with_retry, supabase_client, "embeddings", rows, retries)] = len(rows)
+            logger.info(f"Embedded {report['embedded']}/{len(missing)} missing texts.")
+        for future in in_flight:
+            report["stored" if future.result() else "failed"] += in_flight[future]
+
+    report["seconds"] = time.perf_counter() - start
+    report["texts_per_second"] = report["total"] / report["seconds"] if report["seconds"] else 0.0
+    logger.info(
+        f"Stored {report['stored']} embeddings in Supabase ({report['failed']} failed, "
+        f"{report['existing']} skipped) in {report['seconds']:.2f}s "
+        f"({report['texts_per_second']:.1f} texts/s)."
+    )
+    return report
+
+def load_embeddings_from_supabase(supabase_client, columns="*", page_size=SUPABASE_PAGE_SIZE):
+    """Stream embedding rows from Supabase, one page at a time, keyed on their content hash."""
+    return iter_table_rows(supabase_client, "embeddings", columns=columns, key="hash", page_size=page_size)
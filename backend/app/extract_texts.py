@@ -4,10 +4,14 @@ import pandas as pd
 from docx import Document
 from pptx import Presentation
 import mimetypes
+from io import BytesIO, TextIOWrapper
 from zipfile import ZipFile
-from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
 import logging
-import shutil
+import time
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -41,64 +45,145 @@ def clean_text(text):
     text = text.strip()  
     return text
 
-def load_hidden_documents(directory, files =None):
-    """Load all supported file types from a directory and return their content."""
-    all_texts = []
-    files_to_process = files if files else os.listdir(directory)
-
-    for filename in os.listdir(directory):
-        file_path = os.path.join(directory, filename)
-        mime_type, _ = mimetypes.guess_type(file_path)
-
-        try:
-            if filename.endswith(".pdf"):
-                loader = PyPDFLoader(file_path)
-                pages = loader.load_and_split()
-                all_texts.extend([page.page_content for page in pages])
-                logger.info(f"Processed PDF file: {filename}")
-
-            elif filename.endswith(".docx"):
-                doc = Document(file_path)
-                text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                all_texts.append(text)
-                logger.info(f"Processed DOCX file: {filename}")
-
-            elif filename.endswith(".txt"):
-                with open(file_path, "r", encoding="utf-8") as file:
-                    all_texts.append(file.read())
-                logger.info(f"Processed TXT file: {filename}")
-
-            elif filename.endswith(".csv"):
-                csv_data = pd.read_csv(file_path)
-                text = csv_data.to_string(index=False)
-                all_texts.append(text)
-                logger.info(f"Processed CSV file: {filename}")
-
-            elif filename.endswith(".pptx"):
-                presentation = Presentation(file_path)
-                for slide in presentation.slides:
-                    slide_text = []
-                    for shape in slide.shapes:
-                        if shape.has_text_frame:
-                            slide_text.append(shape.text)
-                    all_texts.append("\n".join(slide_text))
-                logger.info(f"Processed PPTX file: {filename}")
-
-            elif filename.endswith(".zip"):
-                temp_dir = "temp_extracted"
-                try:
-                    with ZipFile(file_path, 'r') as zip_ref:
-                        zip_ref.extractall(temp_dir)
-                        all_texts.extend(load_hidden_documents(temp_dir))
-                finally:
-                    shutil.rmtree(temp_dir)  
-                logger.info(f"Processed ZIP file: {filename}")
-            elif mime_type and mime_type.startswith("text"):
-                with open(file_path, "r", encoding="utf-8") as file:
-                    all_texts.append(file.read())
-                logger.info(f"Processed text file: {filename}")
-
-        except Exception as e:
-            logger.error(f"Failed to process {filename}: {e}")
-    cleaned_texts = [clean_text(text) for text in all_texts]
-    return cleaned_texts
\ No newline at end of file
+Section = namedtuple("Section", ["source", "page", "text"])
+ExtractedFile = namedtuple("ExtractedFile", ["filename", "sections", "seconds"])
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "0")) or None
+# Extraction runs from the background refresher while other threads are live, so workers
+# must not be forked from this process; forkserver where available, spawn elsewhere.
+EXTRACTION_START_METHOD = os.getenv(
+    "EXTRACTION_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+)
+
+MAX_ZIP_MEMBER_BYTES = int(os.getenv("MAX_ZIP_MEMBER_BYTES", str(100 * 1024 * 1024)))
+MAX_ZIP_TOTAL_BYTES = int(os.getenv("MAX_ZIP_TOTAL_BYTES", str(500 * 1024 * 1024)))
+MAX_ZIP_DEPTH = int(os.getenv("MAX_ZIP_DEPTH", "3"))
+# Formats whose parsers need a seekable stream; ZIP members of these are buffered in memory.
+RANDOM_ACCESS_SUFFIXES = (".pdf", ".docx", ".pptx", ".zip")
+
+def extract_stream(filename, stream, depth=0):
+    """Extract raw text sections (one per page or slide where available) from a binary stream."""
+    mime_type, _ = mimetypes.guess_type(filename)
+    sections = []
+
+    if filename.endswith(".pdf"):
+        reader = PdfReader(stream)
+        sections.extend([Section(filename, number, page.extract_text() or "") for number, page in enumerate(reader.pages, 1)])
+        logger.info(f"Processed PDF file: {filename}")
+
+    elif filename.endswith(".docx"):
+        doc = Document(stream)
+        text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+        sections.append(Section(filename, None, text))
+        logger.info(f"Processed DOCX file: {filename}")
+
+    elif filename.endswith(".txt"):
+        sections.append(Section(filename, None, TextIOWrapper(stream, encoding="utf-8").read()))
+        logger.info(f"Processed TXT file: {filename}")
+
+    elif filename.endswith(".csv"):
+        csv_data = pd.read_csv(stream)
+        text = csv_data.to_string(index=False)
+        sections.append(Section(filename, None, text))
+        logger.info(f"Processed CSV file: {filename}")
+
+    elif filename.endswith(".pptx"):
+        presentation = Presentation(stream)
+        for number, slide in enumerate(presentation.slides, 1):
+            slide_text = []
+            for shape in slide.shapes:
+                if shape.has_text_frame:
+                    slide_text.append(shape.text)
+            sections.append(Section(filename, number, "\n".join(slide_text)))
+        logger.info(f"Processed PPTX file: {filename}")
+
+    elif filename.endswith(".zip"):
+        sections.extend(extract_zip(filename, stream, depth + 1))
+        logger.info(f"Processed ZIP file: {filename}")
+    elif mime_type and mime_type.startswith("text"):
+        sections.append(Section(filename, None, TextIOWrapper(stream, encoding="utf-8").read()))
+        logger.info(f"Processed text file: {filename}")
+    return sections
+
+def extract_zip(filename, stream, depth=1):
+    """Extract sections from every supported member of a ZIP archive without writing to disk.
+
+    Members are read straight from the archive; those needing random access are
+    buffered in memory up to ``MAX_ZIP_MEMBER_BYTES``. Archives nested deeper than
+    ``MAX_ZIP_DEPTH`` or members beyond ``MAX_ZIP_TOTAL_BYTES`` are skipped.
+    """
+    if depth > MAX_ZIP_DEPTH:
+        logger.warning(f"Skipping {filename}: ZIP nesting deeper than {MAX_ZIP_DEPTH}.")
+        return []
+    sections = []
+    budget = MAX_ZIP_TOTAL_BYTES
+    with ZipFile(stream) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+            member_name = f"{filename}/{info.filename}"
+            if info.file_size > min(MAX_ZIP_MEMBER_BYTES, budget):
+                logger.warning(f"Skipping {member_name}: {info.file_size} bytes exceeds the ZIP size cap.")
+                continue
+            budget -= info.file_size
+            try:
+                with archive.open(info) as member:
+                    if info.filename.endswith(RANDOM_ACCESS_SUFFIXES):
+                        data = member.read(MAX_ZIP_MEMBER_BYTES + 1)
+                        if len(data) > MAX_ZIP_MEMBER_BYTES:
+                            logger.warning(f"Skipping {member_name}: exceeds the ZIP size cap.")
+                            continue
+                        sections.extend(extract_stream(member_name, BytesIO(data), depth))
+                    else:
+                        sections.extend(extract_stream(member_name, member, depth))
+            except Exception as e:
+                logger.error(f"Failed to process {member_name}: {e}")
+    return sections
+
+def extract_file(file_path):
+    """Extract the raw text sections from a single supported file."""
+    with open(file_path, "rb") as f:
+        return extract_stream(os.path.basename(file_path), f)
+
+def extract_and_clean_file(file_path):
+    """Extract and clean one file, timing it; errors are logged and yield no sections."""
+    start = time.perf_counter()
+    filename = os.path.basename(file_path)
+    try:
+        sections = [section._replace(text=clean_text(section.text)) for section in extract_file(file_path)]
+    except Exception as e:
+        logger.error(f"Failed to process {filename}: {e}")
+        sections = []
+    return ExtractedFile(filename, sections, time.perf_counter() - start)
+
+def iter_hidden_documents(directory, files=None, max_workers=EXTRACTION_WORKERS):
+    """Yield an ExtractedFile per file as soon as it is parsed.
+
+    Only ``files`` are parsed when given; otherwise every file in the directory.
+    Files are parsed in a process pool unless ``max_workers`` is 1 or there is a
+    single file to parse, and are always yielded in filename order.
+    """
+    filenames = sorted(files) if files else sorted(os.listdir(directory))
+    paths = [os.path.join(directory, filename) for filename in filenames]
+    if max_workers == 1 or len(paths) <= 1:
+        results = map(extract_and_clean_file, paths)
+        for result in results:
+            logger.info(f"Extracted {len(result.sections)} sections from {result.filename} in {result.seconds:.2f}s")
+            yield result
+        return
+    context = multiprocessing.get_context(EXTRACTION_START_METHOD)
+    if EXTRACTION_START_METHOD == "forkserver":
+        # Workers fork from a server that already imported the parsers, not a fresh interpreter.
+        # The server resolves this module from the working directory or PYTHONPATH.
+        context.set_forkserver_preload([__name__])
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        for result in pool.map(extract_and_clean_file, paths):
+            logger.info(f"Extracted {len(result.sections)} sections from {result.filename} in {result.seconds:.2f}s")
+            yield result
+
+def load_hidden_documents(directory, files=None, max_workers=EXTRACTION_WORKERS):
+    """Load all supported file types from a directory (or just ``files``) and return their content."""
+    cleaned_texts = []
+    for result in iter_hidden_documents(directory, files=files, max_workers=max_workers):
+        cleaned_texts.extend(section.text for section in result.sections)
+    return cleaned_texts
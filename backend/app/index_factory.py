@@ -0,0 +1,146 @@
+import os
+import sys
+import math
+import time
+import numpy as np
+import faiss
+from .extract_texts import logger
+
+# One of flat, ivf_flat, ivf_pq, sq8, hnsw, or a raw faiss index_factory string
+VECTOR_INDEX_SPEC = os.getenv("VECTOR_INDEX_SPEC", "flat")
+TRAINING_SAMPLE_SIZE = int(os.getenv("VECTOR_INDEX_TRAINING_SAMPLE", "50000"))
+IVF_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_INDEX_EF_SEARCH", "64"))
+BENCHMARK_SPECS = ["flat", "ivf_flat", "ivf_pq", "sq8", "hnsw"]
+
+
+def _ivf_lists(num_vectors):
+    """Pick an IVF list count of about 4*sqrt(N), keeping at least 39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def _pq_params(dim, num_vectors):
+    """Pick PQ sub-quantizers dividing ``dim`` (about 4 dims each) and code bits the sample can train."""
+    m = max(d for d in range(1, dim + 1) if dim % d == 0 and d <= max(1, dim // 4))
+    nbits = max(1, min(8, int(math.log2(max(num_vectors // 39, 2)))))
+    return m, nbits
+
+
+def resolve_factory_string(spec, dim, num_vectors):
+    """Translate a symbolic index spec into a faiss index_factory string for this corpus size."""
+    spec_name = spec.lower()
+    if spec_name == "flat":
+        return "Flat"
+    if spec_name == "ivf_flat":
+        return f"IVF{_ivf_lists(num_vectors)},Flat"
+    if spec_name == "ivf_pq":
+        m, nbits = _pq_params(dim, num_vectors)
+        return f"IVF{_ivf_lists(num_vectors)},PQ{m}x{nbits}"
+    if spec_name == "sq8":
+        return "SQ8"
+    if spec_name == "hnsw":
+        return "HNSW32"
+    return spec
+
+
+def apply_search_params(index, config):
+    """Apply the persisted query-time parameters (IVF nprobe, HNSW efSearch) to an index."""
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = config.get("nprobe", IVF_NPROBE)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = config.get("ef_search", HNSW_EF_SEARCH)
+
+
+def removes_by_position(index):
+    """True if ``remove_ids`` compacts the index so later vectors shift down, as langchain's FAISS.delete assumes.
+
+    Only flat-code indexes (Flat, SQ, PQ) do; IVF and ID-mapped indexes keep
+    their labels and HNSW cannot remove at all, so those are tombstoned instead.
+    """
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlatCodes)
+
+
+def build_index(vectors, spec=VECTOR_INDEX_SPEC, sample_size=TRAINING_SAMPLE_SIZE, seed=0):
+    """Build and fill a faiss index for ``vectors``; returns ``(index, config)``.
+
+    Indexes that need training are trained on a random sample of at most
+    ``sample_size`` vectors. ``config`` records how the index was built and is
+    persisted in the vector store manifest.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    num_vectors, dim = vectors.shape
+    factory_string = resolve_factory_string(spec, dim, num_vectors)
+    index = faiss.index_factory(dim, factory_string, faiss.METRIC_L2)
+    trained_on = 0
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(num_vectors, min(sample_size, num_vectors), replace=False)]
+        index.train(sample)
+        trained_on = len(sample)
+    config = {"spec": spec, "factory_string": factory_string, "dim": dim, "trained_on": trained_on,
+              "nprobe": IVF_NPROBE, "ef_search": HNSW_EF_SEARCH}
+    apply_search_params(index, config)
+    index.add(vectors)
+    logger.info(f"Built {factory_string} index over {num_vectors} vectors (trained on {trained_on}).")
+    return index, config
+
+
+def evaluate_index_specs(vectors, queries, specs=BENCHMARK_SPECS, k=4):
+    """Compare index specs against the exact flat baseline.
+
+    Returns one row per spec with recall@k, mean query latency, serialized
+    index size and build time.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    _, truth = baseline.search(queries, k)
+
+    report = []
+    for spec in specs:
+        start = time.perf_counter()
+        index, config = build_index(vectors, spec)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        _, found = index.search(queries, k)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+        report.append({
+            "spec": spec,
+            "factory_string": config["factory_string"],
+            f"recall@{k}": float(recall),
+            "latency_ms": latency_ms,
+            "memory_bytes": len(faiss.serialize_index(index)),
+            "build_seconds": build_seconds,
+        })
+    return report
+
+
+def format_report(report):
+    """Render an evaluate_index_specs report as a plain-text table."""
+    recall_key = next(key for key in report[0] if key.startswith("recall@"))
+    lines = [f"{'spec':<10} {'factory':<18} {recall_key:>9} {'ms/query':>9} {'memory MB':>10} {'build s':>8}"]
+    for row in report:
+        lines.append(
+            f"{row['spec']:<10} {row['factory_string']:<18} {row[recall_key]:>9.3f} "
+            f"{row['latency_ms']:>9.3f} {row['memory_bytes'] / 1e6:>10.2f} {row['build_seconds']:>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Usage: python -m app.index_factory [vector_store_path] [num_queries]
+    from langchain_community.vectorstores import FAISS
+    from .vector_store import VECTOR_STORE_PATH, embedder
+
+    path = sys.argv[1] if len(sys.argv) > 1 else VECTOR_STORE_PATH
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    store = FAISS.load_local(path, embedder, allow_dangerous_deserialization=True)
+    texts = [store.docstore.search(doc_id).page_content for doc_id in store.index_to_docstore_id.values()]
+    corpus = np.array(embedder.embed_documents(texts), dtype="float32")
+    rng = np.random.default_rng(0)
+    queries = corpus[rng.choice(len(corpus), min(num_queries, len(corpus)), replace=False)]
+    queries = queries + rng.normal(scale=0.01 * corpus.std(), size=queries.shape).astype("float32")
+    print(format_report(evaluate_index_specs(corpus, queries)))
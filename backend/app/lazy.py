@@ -0,0 +1,55 @@
+import time
+from threading import Lock
+from .extract_texts import logger
+
+
+class LazyResource:
+    """A dependency created on first use (or by a warm-up thread) that reports its readiness.
+
+    ``get()`` builds the value once, thread-safely; a failed build is recorded
+    and retried on the next call. ``set()`` installs a ready-made value, e.g. a
+    fake in tests or benchmarks.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._ready = False
+        self._lock = Lock()
+        self.seconds = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def get(self):
+        """Return the value, creating it on first use."""
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    start = time.perf_counter()
+                    try:
+                        self._value = self._factory()
+                    except Exception as e:
+                        self.error = str(e)
+                        logger.error(f"Failed to initialize {self.name}: {e}")
+                        raise
+                    self.seconds = time.perf_counter() - start
+                    self.error = None
+                    self._ready = True
+                    logger.info(f"Initialized {self.name} in {self.seconds:.2f}s.")
+        return self._value
+
+    def set(self, value):
+        """Use ``value`` instead of calling the factory."""
+        with self._lock:
+            self._value = value
+            self._ready = True
+            self.seconds = 0.0
+            self.error = None
+
+    def status(self):
+        """Readiness report for health endpoints."""
+        return {"ready": self._ready, "seconds": self.seconds, "error": self.error}
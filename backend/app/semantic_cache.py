@@ -0,0 +1,319 @@
+import os
+import json
+import time
+from collections import OrderedDict
+from itertools import islice
+from threading import Condition, Lock, Thread
+from uuid import uuid4
+import numpy as np
+import faiss
+from .extract_texts import logger
+
+# Questions embedded per call when seeding from chat history
+SEED_BATCH_SIZE = 256
+
+
+def normalize(vectors):
+    """Return float32 row vectors scaled to unit length so inner product equals cosine similarity."""
+    vectors = np.asarray(vectors, dtype="float32")
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SemanticCache:
+    """Cosine-similarity cache of answered questions with LRU/TTL/size-bounded eviction.
+
+    Vectors are normalized and scored by inner product. The index is an exact
+    flat scan while small and switches to HNSW once it holds ``ann_min_size``
+    entries. Evicted entries are dropped from the lookup table immediately and
+    the index is rebuilt once they make up ``rebuild_ratio`` of it.
+
+    With a ``path``, new entries are persisted by a background thread every
+    ``persist_interval`` seconds, or sooner once ``persist_every`` are unsaved.
+    Each save writes a fresh vectors file and then atomically replaces
+    ``entries.json``, which names it, so readers never see a mismatched pair.
+    """
+
+    def __init__(self, embedder, path=None, similarity_threshold=0.9, ann_min_size=5000,
+                 max_entries=50000, ttl_seconds=None, hnsw_m=32, hnsw_ef_search=64,
+                 rebuild_ratio=0.2, persist_every=20, persist_interval=30):
+        self.embedder = embedder
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.ann_min_size = ann_min_size
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_search = hnsw_ef_search
+        self.rebuild_ratio = rebuild_ratio
+        self.persist_every = persist_every
+        self.persist_interval = persist_interval
+
+        self._lock = Lock()
+        self._entries = OrderedDict()  # id -> {"question", "answer", "created"}; order is LRU
+        self._vectors = {}             # id -> normalized float32 vector
+        self._next_id = 0
+        self._index = None
+        self._dim = None
+        self._stale = 0
+        self._unsaved = 0
+        self._save_lock = Lock()
+        self._saver_condition = Condition()
+        self._saver = None
+        self._closed = False
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "evictions": 0,
+                       "total_latency_ms": 0.0, "max_latency_ms": 0.0}
+        if path:
+            self.load(path)
+
+    def _new_index(self, ann):
+        if ann:
+            base = faiss.IndexHNSWFlat(self._dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            base.hnsw.efSearch = self.hnsw_ef_search
+        else:
+            base = faiss.IndexFlatIP(self._dim)
+        return faiss.IndexIDMap2(base)
+
+    def _rebuild_index(self):
+        """Rebuild the index from live vectors, choosing flat or HNSW by size."""
+        self._index = self._new_index(len(self._entries) >= self.ann_min_size)
+        self._stale = 0
+        if self._entries:
+            ids = np.fromiter(self._entries.keys(), dtype="int64", count=len(self._entries))
+            vectors = np.vstack([self._vectors[i] for i in ids])
+            self._index.add_with_ids(vectors, ids)
+        logger.info(f"Semantic cache index rebuilt ({self.index_type}) with {len(self._entries)} entries.")
+
+    @property
+    def index_type(self):
+        if self._index is None:
+            return None
+        return "hnsw" if isinstance(faiss.downcast_index(self._index.index), faiss.IndexHNSWFlat) else "flat"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, entry_id):
+        self._entries.pop(entry_id, None)
+        self._vectors.pop(entry_id, None)
+        self._stale += 1
+        self._stats["evictions"] += 1
+
+    def _is_expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry["created"] > self.ttl_seconds
+
+    def _evict(self, now):
+        """Drop expired entries and least recently used ones beyond ``max_entries``."""
+        if self.ttl_seconds is not None:
+            for entry_id in [i for i, e in self._entries.items() if self._is_expired(e, now)]:
+                self._drop(entry_id)
+        while self.max_entries and len(self._entries) > self.max_entries:
+            entry_id = next(iter(self._entries))
+            self._drop(entry_id)
+        total = self._index.ntotal if self._index is not None else 0
+        if total and self._stale / total >= self.rebuild_ratio:
+            self._rebuild_index()
+
+    def _insert(self, question, answer, vector, now):
+        """Insert one normalized vector; the caller holds the lock."""
+        if self._dim is None:
+            self._dim = vector.shape[1]
+            self._rebuild_index()
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = {"question": question, "answer": answer, "created": now}
+        self._vectors[entry_id] = vector[0]
+        self._index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+        if self.index_type == "flat" and len(self._entries) >= self.ann_min_size:
+            self._rebuild_index()
+        self._evict(now)
+        self._unsaved += 1
+
+    def add(self, question, answer):
+        """Embed a question once and store it together with its answer."""
+        vector = normalize(self.embedder.embed_query(question))
+        with self._lock:
+            self._insert(question, answer, vector, time.time())
+            should_save = self._unsaved >= self.persist_every
+        if self.path:
+            self._start_saver()
+            if should_save:
+                with self._saver_condition:
+                    self._saver_condition.notify()
+
+    def _start_saver(self):
+        with self._saver_condition:
+            if self._saver is None and not self._closed:
+                self._saver = Thread(target=self._run_saver, name="qa-cache-saver", daemon=True)
+                self._saver.start()
+
+    def _run_saver(self):
+        while True:
+            with self._saver_condition:
+                if self._unsaved < self.persist_every and not self._closed:
+                    self._saver_condition.wait(self.persist_interval)
+                if self._closed:
+                    return
+            if self._unsaved and not self.save():
+                with self._saver_condition:
+                    # Saving is failing; wait a full interval instead of retrying on every add.
+                    self._saver_condition.wait(self.persist_interval)
+
+    def close(self):
+        """Stop the background saver and persist anything unsaved."""
+        with self._saver_condition:
+            self._closed = True
+            self._saver_condition.notify()
+        if self._saver is not None:
+            self._saver.join(timeout=5)
+        if self.path and self._unsaved:
+            self.save()
+
+    def seed(self, chat_history, batch_size=SEED_BATCH_SIZE):
+        """Populate an empty cache from (question, answer) pairs, embedding ``batch_size`` questions per call.
+
+        ``chat_history`` may be any iterable, e.g. a paginated Supabase stream,
+        so only one batch is held in memory.
+        """
+        if self._entries:
+            return
+        pairs = iter(chat_history)
+        seeded = 0
+        while True:
+            batch = list(islice(pairs, batch_size))
+            if not batch:
+                break
+            vectors = normalize(self.embedder.embed_documents([question for question, _ in batch]))
+            now = time.time()
+            with self._lock:
+                for (question, answer), vector in zip(batch, vectors):
+                    self._insert(question, answer, vector.reshape(1, -1), now)
+            seeded += len(batch)
+        if not seeded:
+            return
+        logger.info(f"Seeded semantic cache with {seeded} entries from chat history.")
+        if self.path:
+            self.save()
+
+    def lookup(self, question, k=4):
+        """Return ``(answer, score)`` for the most similar cached question above the threshold, else None."""
+        start = time.perf_counter()
+        result = None
+        if self._entries:
+            query = normalize(self.embedder.embed_query(question))
+            now = time.time()
+            with self._lock:
+                scores, ids = self._index.search(query, min(k + self._stale, self._index.ntotal))
+                for score, entry_id in zip(scores[0], ids[0]):
+                    entry = self._entries.get(int(entry_id))
+                    if entry is None:
+                        continue  # evicted but not yet rebuilt out of the index
+                    if self._is_expired(entry, now):
+                        self._drop(int(entry_id))
+                        continue
+                    if score >= self.similarity_threshold:
+                        self._entries.move_to_end(int(entry_id))
+                        result = (entry["answer"], float(score))
+                    break
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats["hits" if result else "misses"] += 1
+            self._stats["total_latency_ms"] += latency_ms
+            self._stats["max_latency_ms"] = max(self._stats["max_latency_ms"], latency_ms)
+        if result:
+            logger.info(f"Semantic cache hit with similarity {result[1]:.3f} in {latency_ms:.2f} ms.")
+        else:
+            logger.info(f"Semantic cache miss (threshold {self.similarity_threshold}) in {latency_ms:.2f} ms.")
+        return result
+
+    def stats(self):
+        """Return hit-rate and lookup-latency counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["index_type"] = self.index_type
+        lookups = stats["lookups"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["avg_latency_ms"] = stats["total_latency_ms"] / lookups if lookups else 0.0
+        return stats
+
+    def save(self, path=None):
+        """Persist entries and their vectors; returns False if the save failed.
+
+        The index itself is rebuilt on load without re-embedding.
+        """
+        path = path or self.path
+        os.makedirs(path, exist_ok=True)
+        with self._save_lock:
+            with self._lock:
+                ids = list(self._entries.keys())
+                entries = [dict(self._entries[i], id=i) for i in ids]
+                vectors = np.vstack([self._vectors[i] for i in ids]) if ids else np.zeros((0, self._dim or 0), dtype="float32")
+                next_id = self._next_id
+                unsaved = self._unsaved
+                self._unsaved = 0
+            entries_path = os.path.join(path, "entries.json")
+            vectors_name = f"vectors-{uuid4().hex}.npy"
+            tmp_path = f"{entries_path}.{uuid4().hex}.tmp"
+            committed = False
+            try:
+                previous = self._vectors_name(entries_path)
+                with open(os.path.join(path, vectors_name), "wb") as f:
+                    np.save(f, vectors)
+                with open(tmp_path, "w") as f:
+                    json.dump({"next_id": next_id, "vectors": vectors_name, "entries": entries}, f)
+                # The entries file names its vectors file, so replacing it switches both at once
+                os.replace(tmp_path, entries_path)
+                committed = True
+                if previous and os.path.exists(os.path.join(path, previous)):
+                    os.remove(os.path.join(path, previous))
+                logger.info(f"Semantic cache saved with {len(entries)} entries to {path}.")
+                return True
+            except Exception as e:
+                if not committed:
+                    with self._lock:
+                        self._unsaved += unsaved
+                    for leftover in (tmp_path, os.path.join(path, vectors_name)):
+                        if os.path.exists(leftover):
+                            os.remove(leftover)
+                logger.error(f"Error saving semantic cache to {path}: {e}")
+                return committed
+
+    @staticmethod
+    def _vectors_name(entries_path):
+        """Vectors file referenced by a saved entries file (``vectors.npy`` for older saves), or None."""
+        try:
+            with open(entries_path, "r") as f:
+                return json.load(f).get("vectors", "vectors.npy")
+        except (OSError, ValueError):
+            return None
+
+    def load(self, path):
+        """Load entries and vectors saved by :meth:`save`, if present."""
+        entries_path = os.path.join(path, "entries.json")
+        if not os.path.exists(entries_path):
+            logger.info(f"No semantic cache found at {path}. Starting empty.")
+            return
+        try:
+            with open(entries_path, "r") as f:
+                data = json.load(f)
+            vectors = np.load(os.path.join(path, data.get("vectors", "vectors.npy")))
+            if len(vectors) != len(data["entries"]):
+                raise ValueError(f"{len(data['entries'])} entries but {len(vectors)} vectors")
+        except Exception as e:
+            logger.error(f"Error loading semantic cache from {path}: {e}")
+            return
+        with self._lock:
+            self._next_id = data["next_id"]
+            for entry, vector in zip(data["entries"], vectors):
+                entry_id = entry.pop("id")
+                self._entries[entry_id] = entry
+                self._vectors[entry_id] = vector
+            if len(vectors):
+                self._dim = vectors.shape[1]
+                self._rebuild_index()
+        logger.info(f"Loaded semantic cache with {len(self._entries)} entries from {path}.")
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+from collections import OrderedDict, deque
+from threading import Lock
+from .extract_texts import logger
+
+# Turns kept per session; older turns live only in the chat log and Supabase
+SESSION_WINDOW = int(os.getenv("SESSION_WINDOW", "20"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", str(2 * 60 * 60)))
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_KEY_PREFIX = "chat_session:"
+
+
+class InMemorySessionStore:
+    """Per-session bounded turn windows with LRU eviction of idle sessions.
+
+    Each session keeps at most ``window`` (question, answer) turns. Sessions
+    beyond ``max_sessions`` or untouched for ``idle_seconds`` are dropped,
+    least recently used first.
+    """
+
+    def __init__(self, window=SESSION_WINDOW, max_sessions=SESSION_MAX_SESSIONS, idle_seconds=SESSION_IDLE_SECONDS):
+        self.window = window
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = Lock()
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, (last_used, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - last_used < self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            logger.debug(f"Evicted idle session {session_id}.")
+
+    def get(self, session_id):
+        """Return the session's recent turns as a list of (question, answer) tuples."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            now = time.monotonic()
+            if now - session[0] >= self.idle_seconds:
+                del self._sessions[session_id]
+                return []
+            self._sessions[session_id] = (now, session[1])
+            self._sessions.move_to_end(session_id)
+            return list(session[1])
+
+    def append(self, session_id, question, answer):
+        """Add a turn to the session, creating it if needed."""
+        with self._lock:
+            now = time.monotonic()
+            _, turns = self._sessions.pop(session_id, (now, None))
+            if turns is None:
+                turns = deque(maxlen=self.window)
+            turns.append((question, answer))
+            self._sessions[session_id] = (now, turns)
+            self._evict(now)
+
+    def clear(self, session_id):
+        """Forget a session."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class RedisSessionStore:
+    """Session store backed by Redis lists, so every worker process sees the same sessions.
+
+    Each session is a list trimmed to ``window`` turns whose key expires after
+    ``idle_seconds`` without activity.
+    """
+
+    def __init__(self, client, window=SESSION_WINDOW, idle_seconds=SESSION_IDLE_SECONDS):
+        self.client = client
+        self.window = window
+        self.idle_seconds = int(idle_seconds)
+
+    def _key(self, session_id):
+        return f"{REDIS_KEY_PREFIX}{session_id}"
+
+    def get(self, session_id):
+        """Return the session's recent turns as a list of (question, answer) tuples."""
+        key = self._key(session_id)
+        pipe = self.client.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.expire(key, self.idle_seconds)
+        turns, _ = pipe.execute()
+        return [tuple(json.loads(turn)) for turn in turns]
+
+    def append(self, session_id, question, answer):
+        """Add a turn to the session, creating it if needed."""
+        key = self._key(session_id)
+        pipe = self.client.pipeline()
+        pipe.rpush(key, json.dumps([question, answer]))
+        pipe.ltrim(key, -self.window, -1)
+        pipe.expire(key, self.idle_seconds)
+        pipe.execute()
+
+    def clear(self, session_id):
+        """Forget a session."""
+        self.client.delete(self._key(session_id))
+
+
+def create_session_store(redis_url=REDIS_URL):
+    """Use Redis when ``REDIS_URL`` is set, otherwise an in-process store."""
+    if redis_url:
+        import redis
+        logger.info("Using Redis session store.")
+        return RedisSessionStore(redis.Redis.from_url(redis_url))
+    return InMemorySessionStore()
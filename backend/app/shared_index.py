@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import threading
+from collections.abc import Mapping
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from .extract_texts import logger
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+CURRENT_FILE = "CURRENT"
+KEEP_VERSIONS = 2
+# Memory-map flat codes (IndexFlat, HNSW storage, SQ, PQ) where this faiss build supports it
+MMAP_FLAGS = faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+class ReadOnlyDocstoreError(PermissionError):
+    """Raised when something tries to modify a shared, memory-mapped index."""
+
+
+class _SQLiteReader:
+    """One read-only SQLite connection over an exported docstore, shared by all threads.
+
+    The file is opened when the version is loaded, so requests keep working
+    after a newer export retires the version's directory.
+    """
+
+    def __init__(self, path):
+        self.uri = f"file:{path}?mode=ro&immutable=1"
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        self.fetchone("SELECT COUNT(*) FROM docs")
+
+    def fetchone(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+
+class SQLiteDocstore(Docstore):
+    """Read-only docstore backed by the SQLite file written by :func:`export_shared_index`."""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def search(self, search):
+        row = self.reader.fetchone("SELECT page_content, metadata FROM docs WHERE doc_id = ?", (search,))
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts):
+        raise ReadOnlyDocstoreError(f"Cannot add {len(texts)} documents: shared indexes are read-only.")
+
+    def delete(self, ids):
+        raise ReadOnlyDocstoreError(f"Cannot delete {len(ids)} documents: shared indexes are read-only.")
+
+
+class SQLiteIndexMapping(Mapping):
+    """Lazy faiss position -> docstore id mapping, standing in for FAISS.index_to_docstore_id."""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __getitem__(self, position):
+        row = self.reader.fetchone("SELECT doc_id FROM docs WHERE position = ?", (int(position),))
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self):
+        for (position,) in self.reader.fetchall("SELECT position FROM docs ORDER BY position"):
+            yield position
+
+    def __len__(self):
+        return self.reader.fetchone("SELECT COUNT(*) FROM docs")[0]
+
+
+def current_shared_version(root):
+    """Return the name of the latest exported version, or None."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def export_shared_index(vector_store, root):
+    """Write the store as a new read-only version (faiss index + SQLite docstore) and point CURRENT at it."""
+    version = f"v{time.time_ns()}"
+    version_path = os.path.join(root, version)
+    os.makedirs(version_path)
+    faiss.write_index(vector_store.index, os.path.join(version_path, INDEX_FILE))
+    connection = sqlite3.connect(os.path.join(version_path, DOCSTORE_FILE))
+    with connection:
+        connection.execute("CREATE TABLE docs (position INTEGER PRIMARY KEY, doc_id TEXT UNIQUE, page_content TEXT, metadata TEXT)")
+        connection.executemany(
+            "INSERT INTO docs VALUES (?, ?, ?, ?)",
+            (
+                (position, doc_id, document.page_content, json.dumps(document.metadata))
+                for position, doc_id in vector_store.index_to_docstore_id.items()
+                for document in [vector_store.docstore.search(doc_id)]
+            ),
+        )
+    connection.close()
+
+    tmp_path = os.path.join(root, f"{CURRENT_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+    logger.info(f"Exported shared index version {version} with {vector_store.index.ntotal} vectors.")
+
+    # Readers still serving an older version keep their open mmap and SQLite handles after unlink.
+    versions = sorted(name for name in os.listdir(root) if name.startswith("v"))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return version
+
+
+def load_shared_vector_store(root, embedder, version=None):
+    """Open an exported version (default: CURRENT) memory-mapped and read-only; returns (version, store)."""
+    version = version or current_shared_version(root)
+    if version is None:
+        return None, None
+    version_path = os.path.join(root, version)
+    start = time.perf_counter()
+    index = faiss.read_index(os.path.join(version_path, INDEX_FILE), MMAP_FLAGS)
+    reader = _SQLiteReader(os.path.join(version_path, DOCSTORE_FILE))
+    vector_store = FAISS(
+        embedding_function=embedder,
+        index=index,
+        docstore=SQLiteDocstore(reader),
+        index_to_docstore_id=SQLiteIndexMapping(reader),
+    )
+    logger.info(f"Opened shared index version {version} in {(time.perf_counter() - start) * 1000:.1f} ms.")
+    return version, vector_store
@@ -0,0 +1,79 @@
+import re
+import asyncio
+from concurrent.futures import Future
+from threading import Lock
+from .extract_texts import logger
+
+
+def normalize_question(question):
+    """Canonical form used to recognise identical questions (case, spacing and trailing punctuation)."""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one in-flight computation.
+
+    The first caller for a key (the leader) computes the result; callers that
+    arrive while it is running (followers) wait for and share that result or
+    exception. Works across threads and event loops.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def begin(self, key):
+        """Return (future, is_leader). A leader must call :meth:`finish` when done."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.followers += 1
+                saved = self.followers
+            else:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+                return future, True
+        logger.info(f"Joined in-flight answer for an identical question; {saved} LLM calls saved so far.")
+        return future, False
+
+    def finish(self, key, future, result=None, error=None):
+        """Publish the leader's result (or error) to followers and forget the key."""
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """Run ``fn()`` unless an identical call is in flight, in which case wait for its result."""
+        future, is_leader = self.begin(key)
+        if not is_leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("Leader was interrupted."))
+            raise
+        self.finish(key, future, result)
+        return result
+
+    async def ado(self, key, fn):
+        """Async variant of :meth:`do`; ``fn`` returns an awaitable."""
+        future, is_leader = self.begin(key)
+        if not is_leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("Leader was interrupted."))
+            raise
+        self.finish(key, future, result)
+        return result
+
+    def stats(self):
+        """Report computations run and LLM calls saved by joining in-flight ones."""
+        with self._lock:
+            return {"computed": self.leaders, "saved_llm_calls": self.followers, "in_flight": len(self._calls)}
@@ -0,0 +1,69 @@
+from queue import Queue
+from threading import Thread
+from langchain_core.callbacks import BaseCallbackHandler
+from .extract_texts import logger
+
+# Name of the chain whose LLM call produces the final answer in ConversationalRetrievalChain
+ANSWER_CHAIN_NAME = "StuffDocumentsChain"
+_DONE = object()
+
+
+class AnswerTokenHandler(BaseCallbackHandler):
+    """Forward tokens of the answer-generating LLM call to a queue.
+
+    Tokens from the question-condensing call are ignored: only LLM runs nested
+    under the documents-combining chain are forwarded.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self._answer_runs = set()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or ((serialized or {}).get("id") or [None])[-1]
+        if name == ANSWER_CHAIN_NAME or parent_run_id in self._answer_runs:
+            self._answer_runs.add(run_id)
+
+    def on_llm_new_token(self, token, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id in self._answer_runs and token:
+            self.queue.put(token)
+
+
+def stream_chain_answer(retrieval_chain, inputs):
+    """Run the chain on a worker thread, yielding answer tokens as the LLM emits them.
+
+    The final chain response is returned as the generator's return value
+    (``StopIteration.value``); chain errors are re-raised in the caller.
+    """
+    queue = Queue()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["response"] = retrieval_chain.invoke(inputs, config={"callbacks": [AnswerTokenHandler(queue)]})
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            queue.put(_DONE)
+
+    Thread(target=run, name="chain-stream", daemon=True).start()
+    streamed = 0
+    while True:
+        token = queue.get()
+        if token is _DONE:
+            break
+        streamed += 1
+        yield token
+    if "error" in outcome:
+        raise outcome["error"]
+    logger.info(f"Streamed {streamed} answer tokens.")
+    return outcome["response"]
+
+
+def drain_stream(stream):
+    """Wait for a stream_chain_answer generator to finish without forwarding its tokens; returns the response."""
+    while True:
+        try:
+            next(stream)
+        except StopIteration as stop:
+            return stop.value
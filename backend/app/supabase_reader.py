@@ -0,0 +1,37 @@
+import os
+from .extract_texts import logger
+
+SUPABASE_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
+
+def iter_table_rows(supabase_client, table, columns="*", key="id", page_size=SUPABASE_PAGE_SIZE,
+                    since=None, since_column="created_at"):
+    """Yield the rows of ``table`` page by page using keyset pagination on the unique column ``key``.
+
+    Each page is ``WHERE key > <last key seen> ORDER BY key LIMIT page_size``,
+    so every request is an index range scan and only one page is held in
+    memory. ``columns`` projects the selected columns (``key`` is always
+    included) and ``since`` keeps only rows whose ``since_column`` is at or
+    after it.
+    """
+    if columns != "*":
+        selected = [column.strip() for column in columns.split(",")]
+        if key not in selected:
+            selected.append(key)
+        columns = ", ".join(selected)
+    last_key = None
+    pages = rows_read = 0
+    while True:
+        query = supabase_client.table(table).select(columns)
+        if since is not None:
+            query = query.gte(since_column, since)
+        if last_key is not None:
+            query = query.gt(key, last_key)
+        rows = query.order(key).limit(page_size).execute().data or []
+        pages += 1
+        rows_read += len(rows)
+        yield from rows
+        if len(rows) < page_size:
+            break
+        last_key = rows[-1][key]
+    logger.info(f"Read {rows_read} rows from {table} in {pages} pages.")
@@ -1,23 +1,76 @@
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
 import tiktoken
 from .extract_texts import logger
 
+ENCODING_NAME = "cl100k_base"
+# Number of (question, answer) history entries whose token counts are memoized
+HISTORY_TOKEN_MEMO_SIZE = int(os.getenv("HISTORY_TOKEN_MEMO_SIZE", "10000"))
+
+_history_memo = OrderedDict()
+_history_memo_lock = Lock()
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    """Return the tiktoken encoding used for all token counting and chunking (loaded once)."""
+    return tiktoken.get_encoding(ENCODING_NAME)
+
 def count_tokens(text):
     try:
-        enc = tiktoken.get_encoding("cl100k_base")
+        enc = get_encoding()
         tokens = enc.encode(text)
         num_tokens = len(tokens)
-        logger.info(f"Text: {text[:30]}... | Tokens: {num_tokens}")
+        logger.debug(f"Text: {text[:30]}... | Tokens: {num_tokens}")
         return num_tokens
     except Exception as e:
         logger.error(f"Error counting tokens for text: {text[:30]}... | Error: {e}")
         return 0
-    
+
+def _encode_counts(texts):
+    return [len(tokens) for tokens in get_encoding().encode_batch(texts)] if texts else []
+
+def count_tokens_batch(texts):
+    """Count tokens for many texts in one encode_batch call; returns (per-text counts, total)."""
+    texts = list(texts)
+    try:
+        counts = _encode_counts(texts)
+    except Exception as e:
+        logger.error(f"Error counting tokens for {len(texts)} texts | Error: {e}")
+        counts = [0] * len(texts)
+    return counts, sum(counts)
+
 def count_tokens_in_chat_history(chat_history):
-    """Calculate the total number of tokens in the chat history."""
+    """Calculate the total number of tokens in the chat history.
+
+    Per-entry counts are memoized, so each (question, answer) pair is encoded
+    once and a growing history only costs the newly appended turns.
+    """
+    entries = [(question, answer) for question, answer in chat_history]
+    with _history_memo_lock:
+        missing = list(dict.fromkeys(entry for entry in entries if entry not in _history_memo))
+    if missing:
+        try:
+            counts = _encode_counts([text for entry in missing for text in entry])
+        except Exception as e:
+            logger.error(f"Error counting tokens in chat history | Error: {e}")
+            return 0
+        with _history_memo_lock:
+            for number, entry in enumerate(missing):
+                _history_memo[entry] = counts[2 * number] + counts[2 * number + 1]
+            while len(_history_memo) > HISTORY_TOKEN_MEMO_SIZE:
+                _history_memo.popitem(last=False)
+
     total_tokens = 0
-    
-    for question, answer in chat_history:
-        total_tokens += count_tokens(question)  # Count tokens in the question
-        total_tokens += count_tokens(answer)    # Count tokens in the answer
-    
-    return total_tokens
\ No newline at end of file
+    evicted = []
+    with _history_memo_lock:
+        for entry in entries:
+            if entry in _history_memo:
+                _history_memo.move_to_end(entry)
+                total_tokens += _history_memo[entry]
+            else:
+                evicted.append(entry)
+    # Only entries pushed out of the memo by concurrent callers are recounted here.
+    _, evicted_tokens = count_tokens_batch([text for entry in evicted for text in entry])
+    return total_tokens + evicted_tokens
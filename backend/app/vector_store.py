@@ -1,83 +1,344 @@
 import os
+import json
+import time
+from collections import namedtuple
 from .extract_texts import logger
-from threading import Lock
-from .documents import store_file_hashes_in_supabase
+from threading import Lock, Thread, Event
+from .documents import scan_file_hashes, sync_file_hashes_to_supabase
+from uuid import uuid4
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from .extract_texts import load_hidden_documents
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from .embedding_service import get_embedder
+from .chunking import iter_document_chunks
 from .embeddings import store_embeddings_in_supabase, load_embeddings_from_supabase
+from .index_factory import build_index, apply_search_params, removes_by_position, VECTOR_INDEX_SPEC
+from .shared_index import export_shared_index, load_shared_vector_store, current_shared_version
 
 
 VECTOR_STORE_PATH = "faiss_index"
-embedder = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-# In-memory storage for vector store and file modification times
+INDEX_MANIFEST_FILE = "manifest.json"
+# Compact the index once tombstoned vectors make up this fraction of it
+COMPACTION_TOMBSTONE_RATIO = float(os.getenv("COMPACTION_TOMBSTONE_RATIO", "0.2"))
+REFRESH_INTERVAL_SECONDS = float(os.getenv("VECTOR_STORE_REFRESH_SECONDS", "300"))
+# Export every published build as a memory-mappable, read-only version under SHARED_INDEX_PATH;
+# worker processes started with VECTOR_STORE_ROLE=reader open that instead of unpickling a copy.
+VECTOR_STORE_MMAP = os.getenv("VECTOR_STORE_MMAP", "0") == "1"
+SHARED_INDEX_PATH = os.getenv("SHARED_INDEX_PATH", f"{VECTOR_STORE_PATH}_shared")
+SHARED_INDEX_READER = os.getenv("VECTOR_STORE_ROLE", "builder") == "reader"
+embedder = get_embedder("documents")
+
+VectorStoreSnapshot = namedtuple("VectorStoreSnapshot", ["vector_store", "generation", "build_seconds", "built_at"])
+# In-memory storage for the current vector store snapshot. Readers only dereference
+# in_memory_store["snapshot"]; rebuilds publish a new snapshot with one assignment.
 in_memory_store = {
-    "vector_store": None,
-    "file_mod_times": None
+    "snapshot": None,
+    "shared_version": None,
 }
 
-# Thread lock for thread safety
+# Serializes rebuilds; readers never take it
 store_lock = Lock()
 
-def create_vector_store(document_texts):
-    """Create a FAISS vector store from the provided document texts."""
-    vector_store = FAISS.from_texts(document_texts, embedder)
+def create_vector_store(documents, manifest=None, spec=VECTOR_INDEX_SPEC):
+    """Create a FAISS vector store from chunk Documents (keyed by their chunk ids) or plain texts.
+
+    The faiss index is built by the configured index factory; its configuration
+    is recorded in ``manifest["index"]`` when a manifest is given.
+    """
+    if documents and isinstance(documents[0], str):
+        documents = [Document(page_content=text) for text in documents]
+        ids = [str(uuid4()) for _ in documents]
+    else:
+        ids = [doc.metadata["chunk_id"] for doc in documents]
+    vectors = embedder.embed_documents([doc.page_content for doc in documents])
+    index, config = build_index(vectors, spec)
+    vector_store = FAISS(
+        embedding_function=embedder,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, documents))),
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+    if manifest is not None:
+        manifest["index"] = config
     logger.info("Vector store created successfully.")
     return vector_store
 
-def load_or_build_vector_store(directory, supabase_client):
-    """Load the existing vector store if available, otherwise build a new one."""
-    # Check for new or modified files
-    new_or_modified_files = store_file_hashes_in_supabase(directory, supabase_client)
-    logger.info(f"Found {len(new_or_modified_files)} new or modified files.")
+def load_index_manifest(path=VECTOR_STORE_PATH):
+    """Load the manifest mapping each source file to its chunk ids, plus tombstoned ids."""
+    manifest_path = os.path.join(path, INDEX_MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading index manifest from {manifest_path}: {e}")
+        return None
+
+def save_vector_store(vector_store, manifest, path=VECTOR_STORE_PATH):
+    """Save the vector store together with its manifest."""
+    vector_store.save_local(path)
+    with open(os.path.join(path, INDEX_MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f)
+
+def is_live_chunk(metadata):
+    """Retriever filter that hides tombstoned chunks still present in the index."""
+    return not metadata.get("deleted")
+
+def remove_chunks(vector_store, manifest, chunk_ids):
+    """Delete chunk vectors, tombstoning them when the index cannot remove ids by position."""
+    stored_ids = set(vector_store.index_to_docstore_id.values())
+    chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in stored_ids]
+    if not chunk_ids:
+        return
+    if removes_by_position(vector_store.index):
+        vector_store.delete(ids=chunk_ids)
+        return
+    logger.info(f"Index keeps labels on removal; tombstoning {len(chunk_ids)} chunks.")
+    for chunk_id in chunk_ids:
+        vector_store.docstore.search(chunk_id).metadata["deleted"] = True
+    manifest["tombstones"].extend(chunk_ids)
+
+def compact_vector_store(vector_store, manifest):
+    """Rebuild the index from live chunks only, dropping tombstoned vectors."""
+    live_documents = [
+        document for document in (
+            vector_store.docstore.search(doc_id) for doc_id in vector_store.index_to_docstore_id.values()
+        )
+        if is_live_chunk(document.metadata)
+    ]
+    logger.info(f"Compacting vector store: {len(manifest['tombstones'])} tombstones, {len(live_documents)} live chunks.")
+    manifest["tombstones"] = []
+    return create_vector_store(live_documents, manifest)
+
+def build_vector_store(directory):
+    """Build a new vector store and manifest from every document in the directory."""
+    documents = []
+    manifest = {"files": {}, "tombstones": []}
+    for filename, chunks in iter_document_chunks(directory):
+        documents.extend(chunks)
+        manifest["files"][filename] = [chunk.metadata["chunk_id"] for chunk in chunks]
+    if not documents:
+        return None, manifest
+    return create_vector_store(documents, manifest), manifest
+
+def revive_chunks(vector_store, manifest, chunks):
+    """Reuse stored vectors for chunks whose ids (content hashes) are already indexed; returns the rest.
+
+    A tombstoned chunk that comes back unchanged is un-deleted in place instead
+    of being re-embedded, so modified files never force a rebuild.
+    """
+    stored_ids = set(vector_store.index_to_docstore_id.values())
+    revived = set()
+    new_chunks = []
+    for chunk in chunks:
+        chunk_id = chunk.metadata["chunk_id"]
+        if chunk_id not in stored_ids:
+            new_chunks.append(chunk)
+            continue
+        document = vector_store.docstore.search(chunk_id)
+        document.metadata.clear()
+        document.metadata.update(chunk.metadata)
+        revived.add(chunk_id)
+    if revived:
+        manifest["tombstones"] = [chunk_id for chunk_id in manifest["tombstones"] if chunk_id not in revived]
+    return new_chunks
+
+def update_vector_store(vector_store, manifest, directory, changed_files, deleted_files):
+    """Replace the chunks of changed files and purge deleted files, compacting when tombstones pile up."""
+    for filename in deleted_files:
+        remove_chunks(vector_store, manifest, manifest["files"].pop(filename, []))
+        logger.info(f"Removed chunks of deleted file: {filename}")
+    for filename, chunks in iter_document_chunks(directory, files=sorted(changed_files)):
+        chunk_ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+        kept = set(chunk_ids)
+        remove_chunks(vector_store, manifest, [chunk_id for chunk_id in manifest["files"].pop(filename, [])
+                                               if chunk_id not in kept])
+        new_chunks = revive_chunks(vector_store, manifest, chunks)
+        if new_chunks:
+            vector_store.add_documents(new_chunks, ids=[chunk.metadata["chunk_id"] for chunk in new_chunks])
+        manifest["files"][filename] = chunk_ids
+        logger.info(f"Replaced chunks of {filename}: {len(new_chunks)} new, {len(chunks) - len(new_chunks)} unchanged.")
+    if manifest["tombstones"] and len(manifest["tombstones"]) / max(vector_store.index.ntotal, 1) >= COMPACTION_TOMBSTONE_RATIO:
+        vector_store = compact_vector_store(vector_store, manifest)
+    return vector_store
+
+def load_or_build_vector_store(directory, supabase_client, current=None):
+    """Load the existing vector store if available, otherwise build a new one.
+
+    When ``current`` (the store being served) is given and nothing changed, it is
+    returned as is; otherwise a separate copy is loaded from disk and updated, so
+    the store being served is never mutated. Changes are detected against the
+    file hashes recorded in the index manifest, so an update that fails is
+    retried on the next call; Supabase only learns a file's hash once it is indexed.
+    """
+    file_hashes = scan_file_hashes(directory)
 
-    # Check if there's an existing vector store
-    if os.path.exists(VECTOR_STORE_PATH):
+    # Check if there's an existing vector store with a manifest of its chunks
+    manifest = load_index_manifest()
+    if manifest is not None and manifest.get("index", {}).get("spec") != VECTOR_INDEX_SPEC:
+        logger.info(f"Index spec changed to {VECTOR_INDEX_SPEC}; rebuilding the vector store.")
+        manifest = None
+    if manifest is not None and "hashes" not in manifest:
+        logger.info("Index manifest predates file hashes; rebuilding the vector store.")
+        manifest = None
+    if manifest is not None:
+        # Files missing from the manifest were never indexed, e.g. after an interrupted update.
+        changed_files = {filename for filename, file_hash in file_hashes.items()
+                         if manifest["hashes"].get(filename) != file_hash}
+        deleted_files = set(manifest["files"]) - set(file_hashes)
+        logger.info(f"Found {len(changed_files)} new or modified and {len(deleted_files)} deleted files.")
+        if current is not None and not changed_files and not deleted_files:
+            logger.info("No new files. Using existing vector store.")
+            sync_file_hashes_to_supabase(supabase_client, file_hashes)
+            return current
+
+    if os.path.exists(VECTOR_STORE_PATH) and manifest is not None:
         logger.info("Loading existing vector store...")
         vector_store = FAISS.load_local(VECTOR_STORE_PATH, embedder, allow_dangerous_deserialization=True)
+        apply_search_params(vector_store.index, manifest["index"])
     else:
         vector_store = None
 
-    # Case 1: New or modified files exist and vector store exists
-    if new_or_modified_files and vector_store:
-        logger.info("Building vector store for new files and merging with existing store...")
-        document_texts = load_hidden_documents(directory, files=new_or_modified_files)
-        if not document_texts:
-            logger.warning("No content found in new or modified files.")
-            return vector_store  # Return the existing vector store
-        new_vector_store = FAISS.from_texts(document_texts, embedder)
-        vector_store.merge_from(new_vector_store)
-
-    # Case 2: No new files, but an existing vector store exists
-    elif not new_or_modified_files and vector_store:
-        logger.info("No new files. Using existing vector store.")
-        return vector_store
-
-    # Case 3: New files exist and no vector store, OR no new files and no vector store
-    elif (new_or_modified_files and not vector_store) or (not new_or_modified_files and not vector_store):
+    if vector_store is None:
         logger.info("Building new vector store from all documents.")
-        document_texts = load_hidden_documents(directory)
-        if not document_texts:
+        vector_store, manifest = build_vector_store(directory)
+        if vector_store is None:
             logger.warning("No documents found in the directory to build a vector store.")
             return None
-        vector_store = create_vector_store(document_texts)
+        manifest["hashes"] = {filename: file_hashes[filename] for filename in manifest["files"] if filename in file_hashes}
+    else:
+        if not changed_files and not deleted_files:
+            logger.info("No new files. Using existing vector store.")
+            sync_file_hashes_to_supabase(supabase_client, file_hashes)
+            return vector_store
+        logger.info(f"Updating vector store: {len(changed_files)} changed, {len(deleted_files)} deleted files.")
+        vector_store = update_vector_store(vector_store, manifest, directory, changed_files, deleted_files)
+        for filename in deleted_files:
+            manifest["hashes"].pop(filename, None)
+        manifest["hashes"].update((filename, file_hashes[filename]) for filename in changed_files)
 
-    # Save the updated or newly created vector store
-    vector_store.save_local(VECTOR_STORE_PATH)
+    # Save the updated or newly created vector store, then record the indexed hashes in Supabase
+    save_vector_store(vector_store, manifest)
     logger.info("Vector store updated and saved.")
+    sync_file_hashes_to_supabase(supabase_client, file_hashes)
     return vector_store
 
+def get_snapshot():
+    """Return the VectorStoreSnapshot currently being served, or None."""
+    return in_memory_store["snapshot"]
+
+def get_vector_store():
+    """Return the vector store currently being served, or None."""
+    snapshot = in_memory_store["snapshot"]
+    return snapshot.vector_store if snapshot else None
+
+def publish_vector_store(vector_store, build_seconds):
+    """Swap a new vector store in with a single reference assignment and return its snapshot."""
+    previous = in_memory_store["snapshot"]
+    snapshot = VectorStoreSnapshot(
+        vector_store=vector_store,
+        generation=previous.generation + 1 if previous else 1,
+        build_seconds=build_seconds,
+        built_at=time.time(),
+    )
+    in_memory_store["snapshot"] = snapshot
+    logger.info(f"Published vector store generation {snapshot.generation} (built in {build_seconds:.2f}s).")
+    return snapshot
+
+def load_saved_vector_store(path=VECTOR_STORE_PATH):
+    """Publish the vector store saved on disk without any change detection; returns None if there is none."""
+    manifest = load_index_manifest(path)
+    if not os.path.exists(path) or manifest is None:
+        return None
+    with store_lock:
+        start = time.perf_counter()
+        vector_store = FAISS.load_local(path, embedder, allow_dangerous_deserialization=True)
+        apply_search_params(vector_store.index, manifest.get("index", {}))
+        publish_vector_store(vector_store, time.perf_counter() - start)
+        if VECTOR_STORE_MMAP and current_shared_version(SHARED_INDEX_PATH) is None:
+            export_shared_index(vector_store, SHARED_INDEX_PATH)
+    return vector_store
+
+def refresh_shared_vector_store(root=SHARED_INDEX_PATH):
+    """Publish the latest shared (memory-mapped) index version if it differs from the one being served."""
+    version = current_shared_version(root)
+    if version is None or version == in_memory_store["shared_version"]:
+        return get_vector_store()
+    with store_lock:
+        start = time.perf_counter()
+        version, vector_store = load_shared_vector_store(root, embedder, version)
+        publish_vector_store(vector_store, time.perf_counter() - start)
+        in_memory_store["shared_version"] = version
+    return vector_store
+
+def start_shared_index_watcher(interval=REFRESH_INTERVAL_SECONDS, root=SHARED_INDEX_PATH):
+    """Poll for new shared index versions every ``interval`` seconds on a daemon thread; returns its stop event."""
+    stop_event = Event()
+
+    def run():
+        while not stop_event.wait(interval):
+            try:
+                refresh_shared_vector_store(root)
+            except Exception as e:
+                logger.error(f"Refreshing shared vector store failed: {e}")
+
+    Thread(target=run, name="shared-index-watcher", daemon=True).start()
+    return stop_event
+
 def reload_vector_store_if_needed(directory, supabase_client):
-    """Reload the vector store if any files in the directory have changed."""
-    with store_lock:  # Ensure thread safety
-        vector_store = load_or_build_vector_store(directory, supabase_client)
+    """Reload the vector store if any files in the directory have changed.
+
+    The new store is built off to the side; requests keep using the previous
+    snapshot until it is published.
+    """
+    with store_lock:  # Only one rebuild at a time
+        current = get_vector_store()
+        start = time.perf_counter()
+        vector_store = load_or_build_vector_store(directory, supabase_client, current=current)
         if not vector_store:
-            if in_memory_store.get("vector_store") is None:
+            if current is None:
                 logger.error("Failed to load or build vector store. No vector store available.")
                 return None
             logger.info("Using existing in-memory vector store.")
-        else:
-            in_memory_store["vector_store"] = vector_store
-            logger.info("Vector store reloaded and stored in memory.")
-    
-    return in_memory_store.get("vector_store", None)
\ No newline at end of file
+        elif vector_store is not current:
+            publish_vector_store(vector_store, time.perf_counter() - start)
+            if VECTOR_STORE_MMAP:
+                export_shared_index(vector_store, SHARED_INDEX_PATH)
+
+    return get_vector_store()
+
+def start_background_refresher(directory, supabase_client, interval=REFRESH_INTERVAL_SECONDS):
+    """Refresh the vector store every ``interval`` seconds on a daemon thread; returns its stop event."""
+    stop_event = Event()
+
+    def run():
+        while True:
+            try:
+                reload_vector_store_if_needed(directory, supabase_client)
+            except Exception as e:
+                logger.error(f"Background vector store refresh failed: {e}")
+            if stop_event.wait(interval):
+                return
+
+    Thread(target=run, name="vector-store-refresher", daemon=True).start()
+    logger.info(f"Started background vector store refresher (every {interval:.0f}s).")
+    return stop_event
+
+class SnapshotRetriever(BaseRetriever):
+    """Retriever that searches whichever vector store snapshot is current at query time."""
+
+    search_kwargs: dict = {}
+
+    @property
+    def generation(self):
+        """Generation of the snapshot queries are currently served from, or None before the first one."""
+        snapshot = get_snapshot()
+        return snapshot.generation if snapshot else None
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        vector_store = get_vector_store()
+        if vector_store is None:
+            return []
+        return vector_store.similarity_search(query, **self.search_kwargs)
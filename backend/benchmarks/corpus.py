@@ -0,0 +1,73 @@
+import os
+import random
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "sa", "tor", "vel", "da", "pi", "qu", "zen", "ba", "no", "ti", "gra", "fe"]
+
+
+def make_vocabulary(size=2000, seed=7):
+    """Deterministic list of distinct pseudo-words used by the synthetic corpus, questions and fake answers."""
+    rng = random.Random(seed)
+    words = []
+    seen = set()
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+VOCABULARY = make_vocabulary()
+
+
+def make_document(number, words, seed=0):
+    """Text of one synthetic document: sentences of vocabulary words, one paragraph per 100 words."""
+    rng = random.Random(f"{seed}-{number}")
+    paragraphs = [f"Document {number} of the synthetic course handbook."]
+    written = 0
+    while written < words:
+        sentences = []
+        for _ in range(10):
+            length = rng.randint(6, 14)
+            sentences.append(" ".join(rng.choice(VOCABULARY) for _ in range(length)).capitalize() + ".")
+            written += length
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+
+def write_corpus(directory, documents, words_per_document, seed=0):
+    """Write ``documents`` synthetic .txt files into ``directory``; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for number in range(documents):
+        path = os.path.join(directory, f"doc_{number:04d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(make_document(number, words_per_document, seed))
+        paths.append(path)
+    return paths
+
+
+def modify_document(path, revision):
+    """Append a sentence to a document so its size and hash change, as an edited upload would."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(f"\n\nRevision {revision} adds {' '.join(VOCABULARY[revision % 100:revision % 100 + 8])}.")
+
+
+def make_questions(count, seed=0, follow_up_every=0):
+    """Distinct questions; every ``follow_up_every``-th one is a follow-up that needs the chat history."""
+    questions = []
+    for number in range(count):
+        first = VOCABULARY[(seed * 7919 + number) % len(VOCABULARY)]
+        second = VOCABULARY[(seed * 104729 + number * 31) % len(VOCABULARY)]
+        if follow_up_every and number % follow_up_every == follow_up_every - 1:
+            questions.append(f"And what about {first} {second} in part {seed}.{number}?")
+        else:
+            questions.append(f"What does the handbook say about {first} {second} in part {seed}.{number}?")
+    return questions
+
+
+def make_history(turns, seed=0):
+    """``turns`` synthetic (question, answer) pairs for prefilling a session."""
+    questions = make_questions(turns, seed=seed + 1000)
+    return [(question, " ".join(VOCABULARY[(number * 13 + offset) % len(VOCABULARY)] for offset in range(40)))
+            for number, question in enumerate(questions)]
@@ -0,0 +1,46 @@
+import time
+import asyncio
+import hashlib
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from .corpus import VOCABULARY
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model that answers after ``latency`` seconds.
+
+    Like ChatGroq(streaming=True), it reports every word of the answer through
+    ``on_llm_new_token``, so the streaming endpoint behaves as in production.
+    """
+
+    latency: float = 0.02
+    answer_words: int = 40
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "benchmark-fake"
+
+    def _answer(self, messages):
+        seed = int(hashlib.sha256(messages[-1].content.encode("utf-8")).hexdigest()[:8], 16)
+        words = [VOCABULARY[(seed + number * 7) % len(VOCABULARY)] for number in range(self.answer_words)]
+        return [words[0]] + [f" {word}" for word in words[1:]]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        tokens = self._answer(messages)
+        if run_manager:
+            for token in tokens:
+                run_manager.on_llm_new_token(token)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        tokens = self._answer(messages)
+        if run_manager:
+            for token in tokens:
+                await run_manager.on_llm_new_token(token)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
@@ -0,0 +1,162 @@
+"""Offline end-to-end benchmarks for the chat backend.
+
+Runs text extraction, vector store builds, ``process_user_input`` and the Flask
+endpoints against a synthetic corpus, a fake LLM with fixed latency and an
+in-memory Supabase client, then reports throughput and p50/p95/p99 latency per
+stage. Nothing touches the network.
+
+    python -m benchmarks.run                      # compare against benchmarks/baseline.json
+    python -m benchmarks.run --update-baseline    # record a new baseline on this machine
+    python -m benchmarks.run --quick --no-compare # smoke run
+"""
+import os
+import sys
+import json
+import shutil
+import atexit
+import logging
+import argparse
+import tempfile
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "baseline.json")
+DEFAULT_CONFIG = {
+    "documents": [20, 100],
+    "words_per_document": 1500,
+    "history_turns": [0, 5, 20],
+    "clients": [1, 4],
+    "repeats": 30,
+    "llm_latency_ms": 20,
+}
+QUICK_CONFIG = dict(DEFAULT_CONFIG, documents=[5], words_per_document=300, history_turns=[0, 5], clients=[1], repeats=5)
+# A metric regresses when it is worse than the baseline by this fraction and by at least MIN_REGRESSION_MS per call
+REGRESSION_TOLERANCE = 0.5
+MIN_REGRESSION_MS = 2.0
+
+
+def summarize(samples, busy_seconds):
+    """Throughput and latency percentiles (in milliseconds) for one stage's samples."""
+    latencies = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "throughput_per_s": round(len(samples) / busy_seconds, 3) if busy_seconds > 0 else None,
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance=REGRESSION_TOLERANCE, min_delta_ms=MIN_REGRESSION_MS):
+    """Return a message for every stage whose p50, p95 or throughput regressed against the baseline."""
+    regressions = []
+    for stage, expected in baseline.items():
+        actual = results.get(stage)
+        if actual is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if actual[metric] > expected[metric] * (1 + tolerance) and actual[metric] - expected[metric] > min_delta_ms:
+                regressions.append(f"{stage}: {metric} {actual[metric]:.2f} > baseline {expected[metric]:.2f}")
+        if actual["throughput_per_s"] and expected["throughput_per_s"]:
+            # Compared as time per call, so the absolute floor applies to throughput too
+            actual_ms, expected_ms = 1000 / actual["throughput_per_s"], 1000 / expected["throughput_per_s"]
+            if actual_ms > expected_ms * (1 + tolerance) and actual_ms - expected_ms > min_delta_ms:
+                regressions.append(f"{stage}: throughput {actual['throughput_per_s']:.1f}/s "
+                                   f"< baseline {expected['throughput_per_s']:.1f}/s")
+    return regressions
+
+
+def format_report(results):
+    lines = [f"{'stage':<62} {'n':>4} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+    for stage, stats in results.items():
+        lines.append(f"{stage:<62} {stats['count']:>4} {stats['throughput_per_s'] or 0:>9.1f} "
+                     f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+    return "\n".join(lines)
+
+
+def prepare_workdir(keep=False):
+    """Run from a scratch directory so indexes, manifests, logs and caches never touch the checkout."""
+    workdir = tempfile.mkdtemp(prefix="chat-bench-")
+    if not keep:
+        # Registered before the app's own atexit hooks, so it runs after they have saved their files.
+        atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    os.environ["WARM_UP_ON_START"] = "0"
+    os.environ.setdefault("EXTRACTION_WORKERS", "2")
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    # Extraction workers fork from a server that imports the app by module name, outside sys.path
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")]))
+    os.chdir(workdir)
+    return workdir
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks for the chat backend.")
+    parser.add_argument("--quick", action="store_true", help="small corpus and few repeats, for smoke runs")
+    parser.add_argument("--repeats", type=int, help="calls per stage")
+    parser.add_argument("--llm-latency-ms", type=float, help="latency of each fake LLM call")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="write this run's results as the baseline")
+    parser.add_argument("--no-compare", action="store_true", help="only report, never fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--min-delta-ms", type=float, default=MIN_REGRESSION_MS)
+    parser.add_argument("--output", help="also write the report as JSON to this path")
+    parser.add_argument("--keep-workdir", action="store_true", help="keep the scratch directory for inspection")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = dict(QUICK_CONFIG if args.quick else DEFAULT_CONFIG)
+    if args.repeats:
+        config["repeats"] = args.repeats
+    if args.llm_latency_ms is not None:
+        config["llm_latency_ms"] = args.llm_latency_ms
+    baseline_path = os.path.abspath(args.baseline)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    workdir = prepare_workdir(args.keep_workdir)
+    # Configured before the app's own basicConfig call, which then leaves it alone
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    from .stages import run_all  # imports the app, so only after the scratch directory is in place
+
+    samples = run_all(config)
+    results = {stage: summarize(latencies, busy) for stage, (latencies, busy) in samples.items()}
+    report = {"config": config, "results": results}
+    print(format_report(results))
+    if args.keep_workdir:
+        print(f"Scratch directory kept at {workdir}")
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {baseline_path}")
+        return 0
+    if args.no_compare:
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; run with --update-baseline to record one.")
+        return 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline["config"] != config:
+        print(f"Baseline was recorded with {baseline['config']}; this run used {config}. "
+              "Re-run with the same settings or --update-baseline.")
+        return 2
+    regressions = compare_to_baseline(results, baseline["results"], args.tolerance, args.min_delta_ms)
+    if regressions:
+        print("Performance regressions against the baseline:")
+        print("\n".join(f"  {message}" for message in regressions))
+        return 1
+    print(f"No regressions against {baseline_path} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
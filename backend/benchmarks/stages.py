@@ -0,0 +1,167 @@
+import os
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import app.tokens as tokens
+import app.chunking as chunking
+import app.vector_store as vector_store
+import app.chat as chat
+from app.documents import FILE_MANIFEST_PATH
+from app.extract_texts import load_hidden_documents
+from app.vector_store import load_or_build_vector_store, reload_vector_store_if_needed, VECTOR_STORE_PATH
+import main
+from tests.conftest import FakeSupabase, HashEmbeddings, WhitespaceEncoding
+from .corpus import write_corpus, modify_document, make_questions, make_history
+from .fakes import FakeChatModel
+
+EMAIL = "bench@example.com"
+
+
+def install_offline_fakes(llm_latency):
+    """Swap the tokenizer, embedding models, LLM and Supabase client for offline fakes; returns (model, supabase)."""
+    encoding = WhitespaceEncoding()
+    tokens.get_encoding = chunking.get_encoding = lambda: encoding
+    vector_store.embedder = HashEmbeddings()
+    chat.qa_cache.embedder = HashEmbeddings()
+    model = FakeChatModel(latency=llm_latency)
+    supabase = FakeSupabase()
+    main.model.set(model)
+    main.supabase.set(supabase)
+    return model, supabase
+
+
+def measure(fn, repeats, setup=None, clients=1):
+    """Call ``fn(number)`` ``repeats`` times on ``clients`` threads; returns (latencies, busy seconds).
+
+    ``setup(number)`` runs before each call and is not timed. Busy seconds are
+    the summed latencies for a single client and the wall time otherwise.
+    """
+    def timed(number):
+        if setup:
+            setup(number)
+        start = time.perf_counter()
+        fn(number)
+        return time.perf_counter() - start
+
+    if clients == 1:
+        samples = [timed(number) for number in range(repeats)]
+        return samples, sum(samples)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        samples = list(pool.map(timed, range(repeats)))
+    return samples, time.perf_counter() - start
+
+
+def reset_index():
+    shutil.rmtree(VECTOR_STORE_PATH, ignore_errors=True)
+    if os.path.exists(FILE_MANIFEST_PATH):
+        os.remove(FILE_MANIFEST_PATH)
+
+
+def bench_documents(directory, repeats):
+    """Text extraction, then cold, unchanged and one-file-changed vector store builds for one corpus."""
+    results = {"load_hidden_documents": measure(lambda _: load_hidden_documents(directory), repeats)}
+
+    clients = {}
+    def fresh_start(number):
+        reset_index()
+        clients[number] = FakeSupabase()
+    results["load_or_build_vector_store.cold"] = measure(
+        lambda number: load_or_build_vector_store(directory, clients.pop(number)), repeats, setup=fresh_start)
+
+    supabase = FakeSupabase()
+    current = {"store": load_or_build_vector_store(directory, supabase)}
+    results["load_or_build_vector_store.unchanged"] = measure(
+        lambda _: load_or_build_vector_store(directory, supabase, current=current["store"]), repeats)
+
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+    def rebuild(_):
+        current["store"] = load_or_build_vector_store(directory, supabase, current=current["store"])
+    results["load_or_build_vector_store.one_file_changed"] = measure(
+        rebuild, repeats, setup=lambda number: modify_document(paths[number % len(paths)], number))
+    return results
+
+
+def prefill_session(session_id, history):
+    chat.session_store.clear(session_id)
+    for question, answer in history:
+        chat.session_store.append(session_id, question, answer)
+
+
+def bench_process_user_input(supabase, retrieval_chain, history_turns, repeats, seed):
+    """Answer distinct questions (every other one a follow-up) in a session prefilled with ``history_turns`` turns."""
+    session_id = f"bench-history-{history_turns}"
+    history = make_history(history_turns, seed)
+    questions = make_questions(repeats, seed=seed, follow_up_every=2 if history_turns else 0)
+
+    def ask(number):
+        answer, _ = chat.process_user_input(supabase, retrieval_chain, EMAIL, "Bench", questions[number], session_id)
+        if answer.startswith("An error occurred"):
+            raise RuntimeError(f"process_user_input failed for {questions[number]!r}")
+
+    return measure(ask, repeats, setup=lambda _: prefill_session(session_id, history))
+
+
+def check_response(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.get_data(as_text=True)}")
+    if response.is_json and response.json.get("status") == "error":
+        raise RuntimeError(f"{response.request.path} failed: {response.json}")
+    return response
+
+
+def bench_endpoints(flask_app, repeats, clients, seed):
+    """Drive the Flask endpoints through test clients, ``clients`` requests at a time."""
+    questions = make_questions(repeats, seed=seed)
+    stream_questions = make_questions(repeats, seed=seed + 1)
+
+    def post(path, payload):
+        return check_response(flask_app.test_client().post(path, json=payload))
+
+    def chat_request(number):
+        post("/chat", {"email": EMAIL, "question": questions[number], "session_id": f"bench-chat-{number}"})
+
+    def stream_request(number):
+        response = post("/chat/stream", {"email": EMAIL, "question": stream_questions[number],
+                                         "session_id": f"bench-stream-{number}"})
+        if "event: done" not in response.get_data(as_text=True):
+            raise RuntimeError("/chat/stream ended without a done event")
+
+    def token_count_request(number):
+        post("/get_token_count_from_input", {"question": questions[number], "session_id": f"bench-chat-{number}"})
+
+    return {
+        "POST /chat": measure(chat_request, repeats, clients=clients),
+        "POST /chat/stream": measure(stream_request, repeats, clients=clients),
+        "POST /get_token_count_from_input": measure(token_count_request, repeats, clients=clients),
+        "GET /ready": measure(lambda _: check_response(flask_app.test_client().get("/ready")), repeats, clients=clients),
+    }
+
+
+def run_all(config):
+    """Run every stage for each corpus size, history size and client count in ``config``; returns raw samples."""
+    _, supabase = install_offline_fakes(config["llm_latency_ms"] / 1000)
+    repeats = config["repeats"]
+    samples = {}
+    directory = None
+    for documents in config["documents"]:
+        directory = f"corpus_{documents}"
+        write_corpus(directory, documents, config["words_per_document"])
+        for stage, result in bench_documents(directory, repeats).items():
+            samples[f"{stage}[documents={documents}]"] = result
+
+    # Later stages serve the largest corpus
+    reset_index()
+    if reload_vector_store_if_needed(directory, supabase) is None:
+        raise RuntimeError("No vector store could be built from the synthetic corpus.")
+    retrieval_chain = main.retrieval_chain.get()
+    for number, history_turns in enumerate(config["history_turns"]):
+        samples[f"process_user_input[history={history_turns}]"] = bench_process_user_input(
+            supabase, retrieval_chain, history_turns, repeats, seed=number + 1)
+
+    flask_app = main.create_app(warm=False)
+    for number, clients in enumerate(config["clients"]):
+        for endpoint, result in bench_endpoints(flask_app, repeats, clients, seed=100 + 10 * number).items():
+            samples[f"{endpoint}[clients={clients}]"] = result
+    main.chat_writer.get().flush()
+    return samples
@@ -1,15 +1,26 @@
 import os
 import json
+import atexit
+import time
+import itertools
 from datetime import datetime
-from flask import Flask, request, jsonify
+from threading import Thread
+from flask import Flask, Blueprint, request, jsonify, Response, stream_with_context
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import create_client
 from langchain_groq import ChatGroq
 from app.extract_texts import logger
-from app.vector_store import load_or_build_vector_store, embedder
-from app.chat import is_valid_email, process_user_input
-from app.chat import load_chat_history_from_local
-from app.chat import get_chat_history_from_supabase
+from app.lazy import LazyResource
+from app.vector_store import embedder, is_live_chunk, SnapshotRetriever, get_snapshot
+from app.vector_store import load_saved_vector_store, start_background_refresher
+from app.vector_store import SHARED_INDEX_READER, refresh_shared_vector_store, start_shared_index_watcher
+from app.chat import is_valid_email, aprocess_user_input, stream_user_input
+from app.chat import count_prompt_tokens
+from app.concurrency import llm_limiter, ServerBusy
+from app.chat import load_chat_history_from_local, chat_log, CHAT_HISTORY_PATH
+from app.chat import iter_chat_history_from_supabase
+from app.chat import seed_qa_cache, qa_cache, session_store, get_chat_writer, condenser, answer_flights
+from app.chat import embeddings as qa_embeddings
 from langchain.chains import ConversationalRetrievalChain
 #from app.extract_texts import logger, load_hidden_documents
 #from app.embeddings import store_embeddings_in_supabase
@@ -20,46 +31,141 @@ load_dotenv()
 url = os.getenv("SUPABASE_URL")
 key = os.getenv("SUPABASE_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-CHAT_HISTORY_PATH = os.getenv("CHAT_HISTORY_PATH")
 directory = os.getenv("directory")
-
-model = None
+# Number of chunks stuffed into the answer prompt
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "4"))
+# Seconds clients are asked to wait while the first snapshot is loading
+WARMUP_RETRY_AFTER_SECONDS = int(os.getenv("WARMUP_RETRY_AFTER_SECONDS", "5"))
+# Set to 0 to skip the warm-up thread when main is imported (e.g. by the offline benchmarks)
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "1") == "1"
+# Failed warm-up steps are retried after 1, 2, 4, ... seconds, up to this delay
+WARMUP_MAX_BACKOFF_SECONDS = float(os.getenv("WARMUP_MAX_BACKOFF_SECONDS", "60"))
+FLASK_DEBUG = os.getenv("FLASK_DEBUG", "0") == "1"
 
 def load_model():
-    global model
-    if model is None:
-        try:
-            model = ChatGroq(temperature=0.8, model="llama3-8b-8192")
-        except Exception as e:
-            logger.error(f"Error loading model: {e}")
-            raise ValueError("Failed to load model.")
-    return model
-    
-model = load_model()
+    try:
+        # streaming=True lets /chat/stream forward tokens as they arrive; invoke still returns the full answer
+        return ChatGroq(temperature=0.8, model="llama3-8b-8192", streaming=True)
+    except Exception as e:
+        logger.error(f"Error loading model: {e}")
+        raise ValueError("Failed to load model.")
+
+def create_retrieval_chain():
+    # The retriever always searches the current snapshot
+    retriever = SnapshotRetriever(search_kwargs={"k": RETRIEVER_K, "filter": is_live_chunk})
+    return ConversationalRetrievalChain.from_llm(model.get(), retriever=retriever)
 
-supabase: Client = create_client(url, key)
+def create_chat_writer():
+    # Turns are written to Supabase in the background; close_resources flushes the queue on shutdown
+    return get_chat_writer(supabase.get())
+
+def load_embedding_models():
+    # Loading both sentence-transformer models up front keeps the first question fast
+    embedder.embed_query("warm-up")
+    qa_embeddings.embed_query("warm-up")
+    return True
+
+def seed_past_chat_history():
+    # Past turns only seed the Q&A cache; each user's conversation lives in session_store
+    past_chat_history = load_chat_history_from_local(CHAT_HISTORY_PATH)  # Load the log's tail if it exists, else from Supabase
+    # You can still load from Supabase as a fallback if the local file doesn't exist;
+    # it is streamed page by page straight into the cache
+    if not past_chat_history:
+        past_chat_history = iter_chat_history_from_supabase(supabase.get())
+    # Embed past questions once into the persistent Q&A cache (no-op when it was loaded from disk)
+    seed_qa_cache(past_chat_history)
+    return True
+
+# Heavy dependencies are created on first use or by the warm-up thread, never at import time
+model = LazyResource("model", load_model)
+supabase = LazyResource("supabase", lambda: create_client(url, key))
+retrieval_chain = LazyResource("retrieval_chain", create_retrieval_chain)
+chat_writer = LazyResource("chat_writer", create_chat_writer)
+embedding_models = LazyResource("embedding_models", load_embedding_models)
+qa_cache_seed = LazyResource("qa_cache_seed", seed_past_chat_history)
+RESOURCES = [model, supabase, retrieval_chain, chat_writer, embedding_models, qa_cache_seed]
 
 #clean_texts = load_hidden_documents(directory)
 #store_embeddings_in_supabase(supabase, clean_texts, embedder)
 #logger.info(f"Embeddings stored in supabase")
 
-# Reload vector store if needed
-vector_store = load_or_build_vector_store(directory, supabase)
-if vector_store is None:
-    raise ValueError("Failed to initialize vector_store. Ensure vector store setup is correct.")
+def start_vector_store():
+    if SHARED_INDEX_READER:
+        # Worker processes map the builder's exported index read-only and follow new versions.
+        if refresh_shared_vector_store() is None:
+            logger.warning("No shared vector store exported yet; waiting for a builder process with VECTOR_STORE_MMAP=1.")
+        start_shared_index_watcher()
+    else:
+        # Serve the warm snapshot saved on disk right away; change detection and rebuilds happen in
+        # the background. Only when nothing has been saved yet is the first build awaited there.
+        if get_snapshot() is None:
+            load_saved_vector_store()
+        start_background_refresher(directory, supabase.get())
+
+def warm_up(max_backoff=WARMUP_MAX_BACKOFF_SECONDS):
+    """Bring up every dependency off the request path, retrying failed steps with backoff until all succeed."""
+    pending = [start_vector_store] + [resource.get for resource in RESOURCES]
+    backoff = 1.0
+    while True:
+        failed = []
+        for step in pending:
+            try:
+                step()
+            except Exception as e:
+                logger.error(f"Warm-up step failed: {e}")
+                failed.append(step)
+        if not failed:
+            return
+        logger.info(f"Retrying {len(failed)} warm-up steps in {backoff:.0f}s.")
+        time.sleep(backoff)
+        pending = failed
+        backoff = min(backoff * 2, max_backoff)
 
-# Create retrieval chain
-retrieval_chain = ConversationalRetrievalChain.from_llm(model, retriever=vector_store.as_retriever())
-# Initialize Flask app
-# Load chat history from Supabase (or local file if needed)
-chat_history = load_chat_history_from_local(CHAT_HISTORY_PATH)  # Load from local if exists, else from Supabase
-# You can still load from Supabase as a fallback if the local file doesn't exist
-if not chat_history:
-    chat_history =  get_chat_history_from_supabase(supabase)
+def is_ready():
+    return get_snapshot() is not None and model.ready and supabase.ready and retrieval_chain.ready
 
-app = Flask(__name__)
+def close_resources():
+    """Flush the chat write-behind queue, the Q&A cache and the chat log at interpreter exit."""
+    if chat_writer.ready:
+        chat_writer.get().close()
+    qa_cache.close()
+    chat_log.close()
 
-@app.route('/validate_email', methods=['POST'])
+_shutdown_hooks = {"registered": False}
+
+def register_shutdown_hooks():
+    """Register close_resources with atexit once, however many apps are created."""
+    if not _shutdown_hooks["registered"]:
+        atexit.register(close_resources)
+        _shutdown_hooks["registered"] = True
+
+bp = Blueprint("chat", __name__)
+
+def create_app(warm=True):
+    """Create the Flask app; heavy dependencies load on a background thread when ``warm`` is set."""
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    register_shutdown_hooks()
+    if warm:
+        Thread(target=warm_up, name="warm-up", daemon=True).start()
+    return app
+
+def not_ready_response():
+    """Ask the client to retry while the first vector store snapshot is still loading."""
+    response = jsonify({"status": "busy", "message": "Server is starting up, please retry shortly.",
+                        "retry_after": WARMUP_RETRY_AFTER_SECONDS})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(WARMUP_RETRY_AFTER_SECONDS)
+    return response
+
+def busy_response(e):
+    """Tell the client to back off instead of queueing behind a saturated LLM."""
+    response = jsonify({"status": "busy", "message": "Server is busy, please retry shortly.", "retry_after": e.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+@bp.route('/validate_email', methods=['POST'])
 def validate_email():
     try:
         data = request.json  # Parse JSON data
@@ -74,28 +180,33 @@ def validate_email():
         logger.error(f"Error in validate_email: {e}")
         return jsonify({"status": "error", "message": "An error occurred during email validation."})
 
-@app.route('/chat', methods=['POST'])
-def ask_question():
+@bp.route('/chat', methods=['POST'])
+async def ask_question():
+    if get_snapshot() is None:
+        return not_ready_response()
     try:
         email = request.json['email']  
         name = request.json.get('name', '')  # Default name as empty string if not provided
         user_input = request.json['question']
         start_time = request.json.get('start_time', datetime.now().isoformat())
+        session_id = request.json.get('session_id') or email
         
         logger.info(f"Received question: {user_input} from {email}")
         
         # Call the process_user_input function
-        answer, tokens_count = process_user_input(supabase, retrieval_chain, email, name, user_input,  chat_history, start_time=datetime.fromisoformat(start_time))
+        answer, tokens_count = await aprocess_user_input(supabase.get(), retrieval_chain.get(), email, name, user_input,  session_id, start_time=datetime.fromisoformat(start_time))
                               
         logger.info(f"Question processed: {user_input}")
         
-        # Include chat_history in the response for debugging
+        # Include this session's recent turns in the response for debugging
         return jsonify({
             "status": "success", 
             "answer": answer, 
             "tokens_count": tokens_count,
-            "chat_history": chat_history  # Add chat_history here to check the chat history
+            "chat_history": session_store.get(session_id)
         })
+    except ServerBusy as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Error in ask_question: {e}")
         return jsonify({
@@ -103,23 +214,110 @@ def ask_question():
             "message": "An error occurred while processing the question."
         })
     
-@app.route('/get_token_count_from_input', methods=['POST'])
-def get_token_count_from_input():
+@bp.route('/chat/stream', methods=['POST'])
+def ask_question_stream():
+    """Stream the answer as server-sent events: "token" events, then a final "done" (or "error") event."""
+    if get_snapshot() is None:
+        return not_ready_response()
     try:
         email = request.json['email']
         name = request.json.get('name', '')
         user_input = request.json['question']
-        
-        # Omit start_time unless session is being considered
-        _, tokens_count = process_user_input(supabase, retrieval_chain, email, name, user_input)
-        
-        logger.info(f"Token count for user input '{user_input}': {tokens_count}")
-        return jsonify({"status": "success", "token_count": tokens_count})
+        start_time = datetime.fromisoformat(request.json.get('start_time', datetime.now().isoformat()))
+        session_id = request.json.get('session_id') or email
+
+        logger.info(f"Received streaming question: {user_input} from {email}")
+
+        events = stream_user_input(supabase.get(), retrieval_chain.get(), email, name, user_input, session_id,
+                                   start_time=start_time)
+        # Take the LLM slot before committing to a 200 event stream.
+        first_event = next(events)
+    except ServerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        logger.error(f"Error in ask_question_stream: {e}")
+        return jsonify({"status": "error", "message": "An error occurred while processing the question."})
+
+    def generate():
+        for event, data in itertools.chain([first_event], events):
+            if event == "token":
+                data = {"token": data}
+            elif event == "done":
+                data = dict(data, chat_history=session_store.get(session_id))
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@bp.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Report semantic cache hit-rate and lookup latency for threshold tuning, and condense calls saved."""
+    return jsonify({"status": "success", "stats": qa_cache.stats(), "condense": condenser.stats()})
+
+@bp.route('/load_status', methods=['GET'])
+def load_status():
+    """Report in-flight and queued LLM calls, requests turned away or coalesced, and the Supabase write-behind queue."""
+    return jsonify({"status": "success", "llm": llm_limiter.stats(), "coalesced": answer_flights.stats(),
+                    "chat_writer": chat_writer.get().stats()})
+
+@bp.route('/index_status', methods=['GET'])
+def index_status():
+    """Report the generation and build duration of the vector store being served."""
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return not_ready_response()
+    return jsonify({
+        "status": "success",
+        "generation": snapshot.generation,
+        "build_seconds": snapshot.build_seconds,
+        "built_at": datetime.fromtimestamp(snapshot.built_at).isoformat(),
+    })
+
+@bp.route('/health', methods=['GET'])
+def health():
+    """Liveness: the process is up and serving HTTP, whatever is still loading."""
+    return jsonify({"status": "ok"})
+
+@bp.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once a vector store snapshot is served and the chain can be built, else 503."""
+    snapshot = get_snapshot()
+    response = jsonify({
+        "status": "ready" if is_ready() else "starting",
+        "vector_store": {"ready": snapshot is not None, "generation": snapshot.generation if snapshot else None},
+        "dependencies": {resource.name: resource.status() for resource in RESOURCES},
+    })
+    response.status_code = 200 if is_ready() else 503
+    return response
+
+@bp.route('/get_token_count_from_input', methods=['POST'])
+def get_token_count_from_input():
+    """Count the prompt tokens for one "question" or a batch of "questions"; never calls the LLM."""
+    try:
+        include_context = request.json.get('include_context', True)
+        session_id = request.json.get('session_id') or request.json.get('email')
+        chat_history = session_store.get(session_id) if session_id else []
+        if 'questions' in request.json:
+            results = [count_prompt_tokens(retrieval_chain.get(), question, include_context, chat_history)
+                       for question in request.json['questions']]
+            total = sum(result["total_tokens"] for result in results)
+            logger.debug(f"Token count for {len(results)} questions: {total}")
+            return jsonify({"status": "success", "results": results, "token_count": total})
+
+        user_input = request.json['question']
+        result = count_prompt_tokens(retrieval_chain.get(), user_input, include_context, chat_history)
+        logger.debug(f"Token count for user input '{user_input}': {result['total_tokens']}")
+        return jsonify({"status": "success", "token_count": result["total_tokens"], "breakdown": result})
     
     except Exception as e:
         logger.error(f"Error in get_token_count_from_input: {e}")
         return jsonify({"status": "error", "message": "An error occurred while counting tokens."})
 
+app = create_app(warm=WARM_UP_ON_START)
+
 if __name__ == '__main__':
     logger.info("Starting app...")
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=FLASK_DEBUG)
\ No newline at end of file
@@ -0,0 +1,4 @@
+-- Idempotent chat history writes: ChatTurnWriter upserts turns on turn_id.
+-- Existing rows keep a NULL turn_id; NULLs never conflict with each other.
+alter table chat_sessions_2 add column if not exists turn_id text;
+create unique index if not exists chat_sessions_2_turn_id_key on chat_sessions_2 (turn_id);
@@ -0,0 +1,200 @@
+import hashlib
+from types import SimpleNamespace
+import pytest
+from langchain_core.embeddings import Embeddings
+
+
+class FakeQuery:
+    """Chainable stand-in for a postgrest query builder over an in-memory table."""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.rows = client.tables.setdefault(table, [])
+        self.filters = []
+        self.columns = None
+        self.write = None
+        self.order_by = None
+        self.max_rows = None
+
+    def select(self, columns="*"):
+        self.columns = None if columns == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def insert(self, rows):
+        self.write = ("insert", rows if isinstance(rows, list) else [rows], None)
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self.write = ("upsert", rows if isinstance(rows, list) else [rows], on_conflict)
+        return self
+
+    def execute(self):
+        self.client.calls.append((self.table, self.write[0] if self.write else "select"))
+        if self.client.fail_next:
+            self.client.fail_next -= 1
+            raise ConnectionError("fake network error")
+        if self.write:
+            return SimpleNamespace(data=self._apply_write(*self.write))
+        rows = [row for row in self.rows if all(f(row) for f in self.filters)]
+        if self.order_by:
+            rows.sort(key=lambda row: row[self.order_by[0]], reverse=self.order_by[1])
+        if self.max_rows is not None:
+            rows = rows[:self.max_rows]
+        if self.columns:
+            rows = [{c: row.get(c) for c in self.columns} for row in rows]
+        return SimpleNamespace(data=[dict(row) for row in rows])
+
+    def _apply_write(self, kind, rows, on_conflict):
+        written = []
+        for row in rows:
+            row = dict(row)
+            if kind == "upsert":
+                key = on_conflict or "id"
+                match = next((r for r in self.rows if key in row and r.get(key) == row[key]), None)
+                if match is not None:
+                    match.update(row)
+                    written.append(dict(match))
+                    continue
+            self.client.next_id += 1
+            row.setdefault("id", self.client.next_id)
+            self.rows.append(row)
+            written.append(dict(row))
+        return written
+
+
+class FakeSupabase:
+    """In-memory Supabase client recording every executed call."""
+
+    def __init__(self, tables=None):
+        self.tables = tables or {}
+        self.calls = []
+        self.next_id = 0
+        self.fail_next = 0
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+@pytest.fixture
+def fake_supabase():
+    return FakeSupabase()
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis-py list, expiry and pipeline commands."""
+
+    def __init__(self):
+        self.lists = {}
+        self.ttls = {}
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value.encode() if isinstance(value, str) else value)
+        return len(self.lists[key])
+
+    def ltrim(self, key, start, end):
+        items = self.lists.get(key, [])
+        end = len(items) + end if end < 0 else end
+        start = max(len(items) + start, 0) if start < 0 else start
+        self.lists[key] = items[start:end + 1]
+        return True
+
+    def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def expire(self, key, seconds):
+        self.ttls[key] = seconds
+        return key in self.lists
+
+    def delete(self, key):
+        self.ttls.pop(key, None)
+        return int(self.lists.pop(key, None) is not None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self.commands.append((name, args))
+            return self
+        return queue
+
+    def execute(self):
+        results = [getattr(self.client, name)(*args) for name, args in self.commands]
+        self.commands = []
+        return results
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic offline embeddings: a text's vector is derived from its sha256 digest.
+
+    Components are centred on zero, so unrelated texts are close to orthogonal.
+    """
+
+    def __init__(self, size=16):
+        self.size = size
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [(byte - 127.5) / 127.5 for byte in digest[:self.size]]
+
+
+class WhitespaceEncoding:
+    """Offline stand-in for a tiktoken encoding where every whitespace-separated word is one token.
+
+    ``encoded`` counts the texts encoded so far.
+    """
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, text):
+        self.encoded += 1
+        return text.split()
+
+    def encode_batch(self, texts):
+        self.encoded += len(texts)
+        return [text.split() for text in texts]
+
+    def decode(self, tokens):
+        return " ".join(tokens)
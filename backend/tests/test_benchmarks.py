@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import subprocess
+from benchmarks.run import summarize, compare_to_baseline
+from benchmarks.corpus import make_questions
+from benchmarks.fakes import FakeChatModel
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def stats(p50, p95, throughput):
+    return {"count": 10, "throughput_per_s": throughput, "mean_ms": p50, "p50_ms": p50, "p95_ms": p95, "p99_ms": p95}
+
+def test_summarize_reports_percentiles_and_throughput():
+    result = summarize([i / 1000 for i in range(1, 101)], busy_seconds=2.0)
+    assert result["count"] == 100
+    assert result["throughput_per_s"] == 50
+    assert result["p50_ms"] == 50.5
+    assert 95 <= result["p95_ms"] <= 96
+    assert 99 <= result["p99_ms"] <= 100
+
+def test_compare_to_baseline_flags_only_real_regressions():
+    baseline = {"fast": stats(1.0, 1.5, 1000), "slow": stats(100, 120, 10), "gone": stats(5, 5, 200)}
+    results = {
+        "fast": stats(2.5, 3.0, 400),  # 2.5x slower but within the absolute floor
+        "slow": stats(180, 190, 5.5),
+    }
+    regressions = compare_to_baseline(results, baseline, tolerance=0.5, min_delta_ms=2.0)
+    assert regressions == [
+        "slow: p50_ms 180.00 > baseline 100.00",
+        "slow: p95_ms 190.00 > baseline 120.00",
+        "slow: throughput 5.5/s < baseline 10.0/s",
+    ]
+
+def test_fake_chat_model_is_deterministic():
+    model = FakeChatModel(latency=0, answer_words=5)
+    first = model.invoke("What is due on Friday?").content
+    assert first == model.invoke("What is due on Friday?").content
+    assert len(first.split()) == 5
+    assert model.calls == 2
+    assert len(set(make_questions(50, seed=3, follow_up_every=2))) == 50
+
+def test_quick_benchmark_runs_offline(tmp_path):
+    output = tmp_path / "report.json"
+    result = subprocess.run([sys.executable, "-m", "benchmarks.run", "--quick", "--no-compare", "--output", str(output)],
+                            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    report = json.loads(output.read_text())
+    assert set(report["results"]) >= {"load_hidden_documents[documents=5]", "process_user_input[history=5]",
+                                      "POST /chat[clients=1]", "POST /chat/stream[clients=1]"}
+    assert all(stats["count"] == 5 for stats in report["results"].values())
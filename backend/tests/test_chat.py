@@ -1,5 +1,6 @@
 import pytest
-from app.chat import is_valid_email, process_user_input
+from app.chat import is_valid_email, process_user_input, SESSION_END_MESSAGE
+from app.sessions import InMemorySessionStore
 
 def test_is_valid_email():
     valid_email = "22f1234567@ds.study.iitm.ac.in"
@@ -13,9 +14,92 @@ def test_process_user_input(mocker):
     email = "22f1234567@ds.study.iitm.ac.in"
     name = "Test User"
     user_input = "Hello"
-    chat_history = []
+
+    mocker.patch("app.chat.lookup_cached_answer", return_value=None)
+    mocker.patch("app.chat.add_to_qa_cache")
+    mocker.patch("app.chat.append_to_chat_log")
+    mocker.patch("app.chat.get_chat_writer")
+    store = mocker.patch("app.chat.session_store", InMemorySessionStore())
 
     mock_model.invoke.return_value = {"answer": "Hello, how can I help you?"}
-    answer, updated_chat_history = process_user_input(mock_supabase, mock_model, email, name, user_input, chat_history)
+    answer, tokens_count = process_user_input(mock_supabase, mock_model, email, name, user_input, email)
     assert answer == "Hello, how can I help you?"
-    assert len(updated_chat_history) == 1
\ No newline at end of file
+    assert store.get(email) == [(user_input, answer)]
+    assert store.get("someone-else") == []
+def test_count_prompt_tokens_never_calls_llm(mocker):
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain_core.documents import Document
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.retrievers import BaseRetriever
+    from app.chat import count_prompt_tokens
+
+    class StaticRetriever(BaseRetriever):
+        calls: int = 0
+
+        def _get_relevant_documents(self, query, *, run_manager):
+            self.calls += 1
+            return [Document(page_content="due Friday"), Document(page_content="room 101")]
+
+    mocker.patch("app.chat.count_tokens_batch",
+                 side_effect=lambda texts: ([len(t.split()) for t in texts], sum(len(t.split()) for t in texts)))
+    retriever = StaticRetriever()
+    model = FakeListChatModel(responses=["unused"])
+    chain = ConversationalRetrievalChain.from_llm(model, retriever=retriever)
+
+    result = count_prompt_tokens(chain, "When is it due?")
+    assert result["question_tokens"] == 4
+    assert result["context_tokens"] == 4
+    assert result["context_documents"] == 2
+    assert result["total_tokens"] > result["context_tokens"] + result["question_tokens"]
+    assert model.i == 0
+
+    without_context = count_prompt_tokens(chain, "When is it due?", include_context=False)
+    assert without_context["context_tokens"] == 0
+    assert retriever.calls == 1
+
+def test_stop_ends_session_without_llm_or_cache(mocker):
+    lookup = mocker.patch("app.chat.lookup_cached_answer", return_value="Okay, stopping.")
+    add = mocker.patch("app.chat.add_to_qa_cache")
+    store = mocker.patch("app.chat.session_store", InMemorySessionStore())
+    chain = mocker.Mock()
+    store.append("s1", "When is the quiz?", "Friday.")
+
+    answer, tokens_count = process_user_input(mocker.Mock(), chain, "a@b.c", "", " Stop ", "s1")
+    assert answer == SESSION_END_MESSAGE
+    assert tokens_count == 0
+    assert store.get("s1") == []
+    lookup.assert_not_called()
+    add.assert_not_called()
+    chain.invoke.assert_not_called()
+
+def test_cache_hit_still_records_the_turn(mocker):
+    mocker.patch("app.chat.lookup_cached_answer", return_value="Friday.")
+    add = mocker.patch("app.chat.add_to_qa_cache")
+    log = mocker.patch("app.chat.append_to_chat_log")
+    writer = mocker.patch("app.chat.get_chat_writer")
+    store = mocker.patch("app.chat.session_store", InMemorySessionStore())
+    chain = mocker.Mock()
+
+    answer, tokens_count = process_user_input(mocker.Mock(), chain, "a@b.c", "A", "When is the quiz?", "s1")
+    assert (answer, tokens_count) == ("Friday.", 0)
+    assert store.get("s1") == [("When is the quiz?", "Friday.")]
+    writer.return_value.enqueue.assert_called_once_with("a@b.c", "A", "When is the quiz?", "Friday.")
+    log.assert_called_once()
+    add.assert_not_called()
+    chain.invoke.assert_not_called()
+
+def test_follow_ups_use_the_cache_by_standalone_question(mocker):
+    lookup = mocker.patch("app.chat.lookup_cached_answer", return_value=None)
+    add = mocker.patch("app.chat.add_to_qa_cache")
+    mocker.patch("app.chat.append_to_chat_log")
+    mocker.patch("app.chat.get_chat_writer")
+    store = mocker.patch("app.chat.session_store", InMemorySessionStore())
+    store.append("s1", "What is the project report?", "A 10 page write-up.")
+    mocker.patch("app.chat.condense_question",
+                 return_value={"question": "Can you explain the project report?", "chat_history": []})
+    chain = mocker.Mock()
+    chain.invoke.return_value = {"answer": "It summarises your results."}
+
+    process_user_input(mocker.Mock(), chain, "a@b.c", "", "can you explain that?", "s1")
+    lookup.assert_called_once_with("Can you explain the project report?")
+    add.assert_called_once_with("Can you explain the project report?", "It summarises your results.")
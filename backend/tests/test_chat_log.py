@@ -0,0 +1,72 @@
+import os
+import json
+import multiprocessing
+import pytest
+from app import chat_log as chat_log_module
+from app.chat_log import ChatLog, read_tail
+
+
+def test_append_and_tail(tmp_path):
+    log = ChatLog(str(tmp_path / "chat.jsonl"))
+    for number in range(5):
+        log.append(f"q{number}", f"a{number}", email="x@y")
+    log.close()
+    tail = log.tail(2)
+    assert [(entry["question"], entry["answer"]) for entry in tail] == [("q3", "a3"), ("q4", "a4")]
+    assert tail[0]["email"] == "x@y"
+
+
+def test_tail_reads_across_blocks_and_skips_torn_line(tmp_path, mocker):
+    mocker.patch.object(chat_log_module, "TAIL_BLOCK_BYTES", 16)
+    path = tmp_path / "chat.jsonl"
+    log = ChatLog(str(path))
+    for number in range(20):
+        log.append(f"question {number}", "answer")
+    log.close()
+    with open(path, "a") as f:
+        f.write('{"question": "torn')
+    assert [entry["question"] for entry in read_tail(str(path), 3)] == ["question 17", "question 18", "question 19"]
+
+
+def test_compacts_when_file_grows(tmp_path):
+    path = tmp_path / "chat.jsonl"
+    log = ChatLog(str(path), compact_bytes=500, keep_entries=3)
+    for number in range(20):
+        log.append(f"q{number}", "a" * 20)
+    log.close()
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert len(lines) <= 10
+    assert json.loads(lines[-1])["question"] == "q19"
+
+
+def test_migrates_old_json_array(tmp_path):
+    path = tmp_path / "chat.json"
+    path.write_text(json.dumps([["q1", "a1"], ["q2", "a2"]]))
+    log = ChatLog(str(path))
+    log.append("q3", "a3")
+    log.close()
+    assert [entry["question"] for entry in log.tail(10)] == ["q1", "q2", "q3"]
+
+
+def append_turns(path, worker, count):
+    # keep_entries above the total, so compaction rewrites the file without dropping anything
+    log = ChatLog(path, fsync_every=1000, compact_bytes=2000, keep_entries=10000)
+    for number in range(count):
+        log.append(f"{worker}-{number}", "a")
+    log.close()
+
+
+@pytest.mark.skipif(chat_log_module.fcntl is None, reason="needs fcntl")
+def test_processes_compacting_one_log_never_lose_appends(tmp_path):
+    path = str(tmp_path / "chat.jsonl")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=append_turns, args=(path, worker, 100)) for worker in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+    questions = {entry["question"] for entry in read_tail(path, 10000)}
+    assert questions == {f"{worker}-{number}" for worker in range(3) for number in range(100)}
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
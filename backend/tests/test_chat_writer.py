@@ -0,0 +1,103 @@
+import time
+from app.chat_writer import ChatTurnWriter
+
+
+def test_flush_writes_in_batches(fake_supabase):
+    writer = ChatTurnWriter(fake_supabase, batch_size=2, flush_interval=60)
+    for number in range(5):
+        writer.enqueue("a@x", "A", f"q{number}", f"a{number}")
+    assert fake_supabase.tables.get("chat_sessions_2", []) == []
+    assert writer.flush()
+    rows = fake_supabase.tables["chat_sessions_2"]
+    assert [row["question"] for row in rows] == [f"q{number}" for number in range(5)]
+    assert fake_supabase.calls.count(("chat_sessions_2", "upsert")) == 3
+
+
+def test_duplicate_turns_are_written_once(fake_supabase):
+    writer = ChatTurnWriter(fake_supabase, flush_interval=60)
+    assert writer.enqueue("a@x", "A", "q", "a", turn_id="t1")
+    assert not writer.enqueue("a@x", "A", "q", "a", turn_id="t1")
+    writer.flush()
+    assert not writer.enqueue("a@x", "A", "q", "a", turn_id="t1")
+    assert len(fake_supabase.tables["chat_sessions_2"]) == 1
+    assert writer.stats()["duplicates"] == 2
+
+
+def test_failed_batch_stays_queued_and_is_retried(fake_supabase):
+    writer = ChatTurnWriter(fake_supabase, flush_interval=60, retries=2, backoff=0)
+    writer.enqueue("a@x", "A", "q", "a")
+    fake_supabase.fail_next = 2
+    assert not writer.flush()
+    assert writer.stats()["queued"] == 1
+    assert writer.flush()
+    assert len(fake_supabase.tables["chat_sessions_2"]) == 1
+
+
+def test_background_thread_flushes_on_interval_and_close(fake_supabase):
+    writer = ChatTurnWriter(fake_supabase, batch_size=100, flush_interval=0.05).start()
+    writer.enqueue("a@x", "A", "q1", "a1")
+    for _ in range(100):
+        if writer.stats()["written"]:
+            break
+        time.sleep(0.01)
+    assert writer.stats()["written"] == 1
+    writer.enqueue("a@x", "A", "q2", "a2")
+    writer.close()
+    assert len(fake_supabase.tables["chat_sessions_2"]) == 2
+
+
+def test_retry_after_committed_but_timed_out_insert_writes_no_duplicates(fake_supabase):
+    class CommitThenTimeOut:
+        """Client whose first write is applied but reported as a timeout."""
+
+        def __init__(self, client):
+            self.client = client
+            self.timeouts = 1
+
+        def table(self, name):
+            query = self.client.table(name)
+            execute = query.execute
+
+            def execute_then_time_out():
+                result = execute()
+                if self.timeouts:
+                    self.timeouts -= 1
+                    raise TimeoutError("read timed out")
+                return result
+
+            query.execute = execute_then_time_out
+            return query
+
+    writer = ChatTurnWriter(CommitThenTimeOut(fake_supabase), flush_interval=60, retries=2, backoff=0)
+    writer.enqueue("a@x", "A", "q1", "a1")
+    writer.enqueue("a@x", "A", "q2", "a2")
+    assert writer.flush()
+    rows = fake_supabase.tables["chat_sessions_2"]
+    assert [row["question"] for row in rows] == ["q1", "q2"]
+    assert len({row["turn_id"] for row in rows}) == 2
+
+
+def test_identical_turns_are_both_written(fake_supabase):
+    writer = ChatTurnWriter(fake_supabase, flush_interval=60)
+    assert writer.enqueue("a@x", "A", "q", "a")
+    assert writer.enqueue("a@x", "A", "q", "a")
+    assert writer.flush()
+    rows = fake_supabase.tables["chat_sessions_2"]
+    assert [(row["question"], row["answer"]) for row in rows] == [("q", "a"), ("q", "a")]
+    assert rows[0]["turn_id"] != rows[1]["turn_id"]
+
+
+def test_falls_back_to_insert_without_turn_id_column(fake_supabase, mocker):
+    def upsert(self, rows, on_conflict=None):
+        raise RuntimeError("{'code': 'PGRST204', 'message': \"Could not find the 'turn_id' column of "
+                           "'chat_sessions_2' in the schema cache\"}")
+
+    mocker.patch("conftest.FakeQuery.upsert", upsert)
+    writer = ChatTurnWriter(fake_supabase, flush_interval=60, retries=1, backoff=0)
+    writer.enqueue("a@x", "A", "q1", "a1")
+    assert writer.flush()
+    writer.enqueue("a@x", "A", "q2", "a2")
+    assert writer.flush()
+    rows = fake_supabase.tables["chat_sessions_2"]
+    assert [row["question"] for row in rows] == ["q1", "q2"]
+    assert all("turn_id" not in row for row in rows)
@@ -0,0 +1,32 @@
+import pytest
+import app.chunking as chunking
+from app.chunking import split_text_by_tokens, chunk_sections
+from app.extract_texts import Section
+from conftest import WhitespaceEncoding
+
+encoding = WhitespaceEncoding()
+
+
+@pytest.fixture(autouse=True)
+def offline_encoding(mocker):
+    mocker.patch.object(chunking, "get_encoding", return_value=encoding)
+
+
+def test_split_text_by_tokens_respects_size_and_overlap():
+    text = " ".join(f"word{i}" for i in range(300))
+    chunks = split_text_by_tokens(text, chunk_size=50, chunk_overlap=10)
+    assert len(chunks) > 1
+    tokens = [encoding.encode(chunk) for chunk in chunks]
+    assert all(len(chunk_tokens) <= 50 for chunk_tokens in tokens)
+    assert all(previous[-10:] == following[:10] for previous, following in zip(tokens, tokens[1:]))
+    # Every token is kept, in order
+    assert tokens[0] + [token for chunk_tokens in tokens[1:] for token in chunk_tokens[10:]] == text.split()
+
+
+def test_chunk_ids_are_stable_and_carry_metadata():
+    sections = [Section("slides.pdf", 2, "A short page about the project.")]
+    first = chunk_sections("slides.pdf", sections)
+    second = chunk_sections("slides.pdf", sections)
+    assert [doc.metadata["chunk_id"] for doc in first] == [doc.metadata["chunk_id"] for doc in second]
+    assert first[0].metadata["page"] == 2
+    assert first[0].metadata["source"] == "slides.pdf"
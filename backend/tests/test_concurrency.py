@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import pytest
+from app.concurrency import ConcurrencyLimiter, ServerBusy
+
+
+def test_rejects_immediately_when_queue_is_full():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_waiting=0, wait_timeout=1, retry_after=3)
+    limiter.acquire()
+    with pytest.raises(ServerBusy) as busy:
+        limiter.acquire()
+    assert busy.value.retry_after == 3
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_waiter_times_out_and_leaves_queue():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_waiting=1, wait_timeout=0.05)
+    limiter.acquire()
+    with pytest.raises(ServerBusy):
+        limiter.acquire()
+    stats = limiter.stats()
+    assert stats["timeouts"] == 1 and stats["waiting"] == 0
+
+
+def test_release_hands_slot_to_waiting_thread():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_waiting=1, wait_timeout=5)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def wait_for_slot():
+        limiter.acquire()
+        acquired.set()
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    while limiter.stats()["waiting"] == 0:
+        pass
+    limiter.release()
+    waiter.join(timeout=5)
+    assert acquired.is_set()
+    assert limiter.stats()["active"] == 1
+    limiter.release()
+    assert limiter.stats()["active"] == 0
+
+
+def test_async_waiters_share_slots_across_event_loops():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_waiting=1, wait_timeout=5)
+    limiter.acquire()
+    results = []
+
+    async def ask():
+        async with limiter.aslot():
+            results.append(limiter.stats()["active"])
+
+    # Flask runs each async view in its own event loop on a worker thread.
+    waiter = threading.Thread(target=asyncio.run, args=(ask(),))
+    waiter.start()
+    while limiter.stats()["waiting"] == 0:
+        pass
+    with pytest.raises(ServerBusy):
+        asyncio.run(ask())
+    limiter.release()
+    waiter.join(timeout=5)
+    assert results == [1]
+    assert limiter.stats()["active"] == 0
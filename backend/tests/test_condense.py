@@ -0,0 +1,53 @@
+import asyncio
+from langchain.chains import ConversationalRetrievalChain
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+from app.condense import QuestionCondenser, is_standalone_question
+
+HISTORY = [("When is the project due?", "Friday.")]
+
+
+class StaticRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager):
+        return [Document(page_content="The project is due on Friday.")]
+
+
+def make_chain(*responses):
+    model = FakeListChatModel(responses=list(responses))
+    return model, ConversationalRetrievalChain.from_llm(model, retriever=StaticRetriever())
+
+
+def test_is_standalone_question():
+    assert is_standalone_question("When is the machine learning project due?")
+    assert not is_standalone_question("And what about it?")
+    assert not is_standalone_question("Why?")
+
+
+def test_standalone_and_empty_history_skip_llm():
+    model, chain = make_chain("unused", "unused")
+    condenser = QuestionCondenser()
+    inputs = condenser.rewrite_inputs(chain, {"question": "Where is the exam hall located?", "chat_history": HISTORY})
+    assert inputs == {"question": "Where is the exam hall located?", "chat_history": []}
+    condenser.rewrite_inputs(chain, {"question": "And it?", "chat_history": []})
+    assert model.i == 0
+    assert condenser.stats()["saved_llm_calls"] == 1
+
+
+def test_follow_up_is_condensed_once_then_cached():
+    model, chain = make_chain("When is the project report due?")
+    condenser = QuestionCondenser()
+    inputs = {"question": "and the report for it?", "chat_history": HISTORY}
+    first = condenser.rewrite_inputs(chain, inputs)
+    second = asyncio.run(condenser.arewrite_inputs(chain, inputs))
+    assert first == second == {"question": "When is the project report due?", "chat_history": []}
+    stats = condenser.stats()
+    assert stats["llm"] == 1 and stats["cache_hit"] == 1
+
+
+def test_heuristic_mode_never_calls_llm():
+    model, chain = make_chain("unused", "unused")
+    condenser = QuestionCondenser(mode="heuristic")
+    inputs = condenser.rewrite_inputs(chain, {"question": "and for it?", "chat_history": HISTORY})
+    assert "When is the project due?" in inputs["question"]
+    assert model.i == 0
@@ -0,0 +1,23 @@
+from app import documents
+from app.documents import generate_file_hash, store_file_hashes_in_supabase
+
+
+def test_generate_file_hash_streams_in_chunks(tmpdir):
+    test_file = tmpdir.join("big.txt")
+    test_file.write("x" * 10000)
+    assert generate_file_hash(str(test_file), chunk_size=64) == generate_file_hash(str(test_file))
+
+
+def test_unchanged_files_skip_hashing(tmpdir, fake_supabase, mocker):
+    test_dir = tmpdir.mkdir("hidden_docs")
+    test_dir.join("a.txt").write("first")
+    test_dir.join("b.txt").write("second")
+    manifest_path = str(tmpdir.join("manifest.json"))
+
+    changed = store_file_hashes_in_supabase(str(test_dir), fake_supabase, manifest_path=manifest_path)
+    assert sorted(changed) == ["a.txt", "b.txt"]
+    assert fake_supabase.calls.count(("file_hashes", "upsert")) == 1
+
+    spy = mocker.spy(documents, "generate_file_hash")
+    assert store_file_hashes_in_supabase(str(test_dir), fake_supabase, manifest_path=manifest_path) == []
+    assert spy.call_count == 0
@@ -0,0 +1,41 @@
+from app.embedding_cache import EmbeddingCache, CachedEmbeddings
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_unchanged_texts_are_not_re_embedded(tmpdir):
+    model = CountingEmbedder()
+    embedder = CachedEmbeddings(model, EmbeddingCache(str(tmpdir), "org/model"))
+    assert embedder.embed_documents(["ab", "abc", "ab"]) == [[2.0, 1.0], [3.0, 1.0], [2.0, 1.0]]
+    assert model.embedded == ["ab", "abc"]
+
+    # A fresh process reads the same files back through the memory map.
+    model = CountingEmbedder()
+    embedder = CachedEmbeddings(model, EmbeddingCache(str(tmpdir), "org/model"))
+    assert embedder.embed_documents(["abc", "abcd"]) == [[3.0, 1.0], [4.0, 1.0]]
+    assert model.embedded == ["abcd"]
+
+
+def test_processes_sharing_a_cache_never_overwrite_rows(tmpdir):
+    # Two caches over one directory stand in for two worker processes that both loaded it empty.
+    first = EmbeddingCache(str(tmpdir), "org/model")
+    second = EmbeddingCache(str(tmpdir), "org/model")
+    first.put_many(["a", "b"], [[1.0, 1.0], [2.0, 2.0]])
+    second.put_many(["c", "a"], [[3.0, 3.0], [1.0, 1.0]])
+    first.put_many(["d"], [[4.0, 4.0]])
+
+    assert second.get_many(["a", "c"]) == {"a": [1.0, 1.0], "c": [3.0, 3.0]}
+    reloaded = EmbeddingCache(str(tmpdir), "org/model")
+    assert len(reloaded) == 4
+    assert reloaded.get_many(["a", "b", "c", "d"]) == {
+        "a": [1.0, 1.0], "b": [2.0, 2.0], "c": [3.0, 3.0], "d": [4.0, 4.0]}
@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+import pytest
+from app.embedding_service import BatchingEmbeddings
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def test_model_is_loaded_lazily():
+    loaded = []
+    embedder = BatchingEmbeddings("fake", loader=lambda name: loaded.append(name) or FakeModel())
+    assert loaded == []
+    assert embedder.embed_query("abc") == [3.0]
+    assert loaded == ["fake"]
+
+
+def test_concurrent_calls_share_a_batch():
+    model = FakeModel()
+    embedder = BatchingEmbeddings("fake", loader=lambda name: model, batch_window_ms=200)
+    texts = ["a" * i for i in range(1, 9)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(embedder.embed_query, texts))
+
+    assert results == [[float(len(text))] for text in texts]
+    assert len(model.calls) < len(texts)
+
+
+def test_queries_are_not_queued_behind_bulk_calls():
+    order = []
+    release = Event()
+
+    class SlowModel(FakeModel):
+        def embed_documents(self, texts):
+            order.append(len(texts))
+            if len(order) == 1:
+                release.wait(5)
+            return super().embed_documents(texts)
+
+    model = SlowModel()
+    embedder = BatchingEmbeddings("fake", loader=lambda name: model, batch_window_ms=0, max_batch_size=4)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        bulk = pool.submit(embedder.embed_documents, ["a" * i for i in range(1, 13)])
+        while not order:
+            time.sleep(0.001)
+        query = pool.submit(embedder.embed_query, "query")
+        time.sleep(0.05)
+        release.set()
+        assert query.result() == [5.0]
+        assert bulk.result() == [[float(i)] for i in range(1, 13)]
+
+    # The query ran right after the bulk slice in progress, not after the whole call
+    assert order == [4, 1, 4, 4]
+
+
+def test_failed_bulk_slice_fails_the_call():
+    class FailingModel(FakeModel):
+        def embed_documents(self, texts):
+            if texts == ["c", "d"]:
+                raise RuntimeError("model crashed")
+            return super().embed_documents(texts)
+
+    model = FailingModel()
+    embedder = BatchingEmbeddings("fake", loader=lambda name: model, max_batch_size=2)
+    with pytest.raises(RuntimeError, match="model crashed"):
+        embedder.embed_documents(["a", "b", "c", "d", "e", "f"])
+    assert embedder.embed_query("abc") == [3.0]
@@ -0,0 +1,42 @@
+from app.embeddings import generate_hash, fetch_existing_hashes, store_embeddings_in_supabase, upsert_with_retry
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def test_bulk_store_only_embeds_missing_texts(fake_supabase):
+    fake_supabase.tables["embeddings"] = [{"hash": generate_hash("old"), "text": "old", "embedding": [3.0]}]
+    embedder = FakeEmbedder()
+    texts = ["old"] + [f"text {i}" for i in range(25)] + ["text 0"]
+
+    report = store_embeddings_in_supabase(fake_supabase, texts, embedder, batch_size=10, max_workers=2)
+
+    assert report["existing"] == 1 and report["stored"] == 25 and report["failed"] == 0
+    assert [len(batch) for batch in embedder.batches] == [10, 10, 5]
+    assert len(fake_supabase.tables["embeddings"]) == 26
+    assert fake_supabase.calls.count(("embeddings", "select")) == 1
+    assert fake_supabase.calls.count(("embeddings", "upsert")) == 3
+
+
+def test_upsert_retries_until_success(fake_supabase, mocker):
+    mocker.patch("app.embeddings.time.sleep")
+    fake_supabase.fail_next = 2
+    assert upsert_with_retry(fake_supabase, "embeddings", [{"hash": "h", "text": "t"}], retries=3)
+    assert fake_supabase.calls == [("embeddings", "upsert")] * 3
+    assert len(fake_supabase.tables["embeddings"]) == 1
+
+
+def test_hash_lookup_pages_are_small_and_retried(fake_supabase, mocker):
+    mocker.patch("app.embeddings.time.sleep")
+    fake_supabase.tables["embeddings"] = [{"hash": generate_hash(f"text {i}")} for i in range(0, 250, 2)]
+    hashes = [generate_hash(f"text {i}") for i in range(250)]
+    fake_supabase.fail_next = 2
+
+    assert fetch_existing_hashes(fake_supabase, hashes) == set(hashes[::2])
+    assert fake_supabase.calls == [("embeddings", "select")] * 5
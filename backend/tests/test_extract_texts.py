@@ -1,6 +1,7 @@
 import os
 import pytest
-from app.extract_texts import clean_text, load_hidden_documents
+from app import extract_texts
+from app.extract_texts import clean_text, load_hidden_documents, iter_hidden_documents
 
 def test_clean_text():
     text = "This  is a   test.\nNewLine:Test"
@@ -17,4 +18,41 @@ def test_load_hidden_documents(tmpdir):
     # Load documents from the temporary directory
     documents = load_hidden_documents(str(test_dir))
     assert len(documents) == 1
-    assert documents[0] == "This is a test document."
\ No newline at end of file
+    assert documents[0] == "This is a test document."
+
+def test_load_hidden_documents_only_parses_given_files(tmpdir):
+    test_dir = tmpdir.mkdir("hidden_docs")
+    test_dir.join("changed.txt").write("Edited document.")
+    test_dir.join("unchanged.txt").write("Untouched document.")
+
+    documents = load_hidden_documents(str(test_dir), files=["changed.txt"])
+    assert documents == ["Edited document."]
+
+
+def test_iter_hidden_documents_parses_in_process_pool(tmpdir, mocker):
+    test_dir = tmpdir.mkdir("hidden_docs")
+    for i in range(6):
+        test_dir.join(f"doc{i}.txt").write(f"Document {i}." * (6 - i) * 2000)
+    pool = mocker.spy(extract_texts, "ProcessPoolExecutor")
+
+    results = list(iter_hidden_documents(str(test_dir), max_workers=3))
+    assert [result.filename for result in results] == [f"doc{i}.txt" for i in range(6)]
+    assert pool.call_args.kwargs["mp_context"].get_start_method() != "fork"
+    assert all(result.seconds >= 0 for result in results)
+
+
+def test_load_hidden_documents_reads_nested_zip_in_memory(tmpdir):
+    from io import BytesIO
+    from zipfile import ZipFile
+
+    inner = BytesIO()
+    with ZipFile(inner, "w") as archive:
+        archive.writestr("inner.txt", "Inner document.")
+    test_dir = tmpdir.mkdir("hidden_docs")
+    with ZipFile(str(test_dir.join("bundle.zip")), "w") as archive:
+        archive.writestr("notes/outer.txt", "Outer document.")
+        archive.writestr("nested.zip", inner.getvalue())
+
+    documents = load_hidden_documents(str(test_dir))
+    assert sorted(documents) == ["Inner document.", "Outer document."]
+    assert os.listdir(str(test_dir)) == ["bundle.zip"]
@@ -0,0 +1,19 @@
+import numpy as np
+from app.index_factory import build_index, evaluate_index_specs, resolve_factory_string
+
+
+def test_resolve_factory_string_scales_with_corpus():
+    assert resolve_factory_string("flat", 384, 1000) == "Flat"
+    assert resolve_factory_string("ivf_pq", 384, 100000) == "IVF1264,PQ96x8"
+    assert resolve_factory_string("IVF64,SQ8", 384, 1000) == "IVF64,SQ8"
+
+
+def test_trained_index_reports_recall_against_flat():
+    rng = np.random.default_rng(0)
+    vectors = rng.random((2000, 32), dtype="float32")
+    index, config = build_index(vectors, "ivf_flat")
+    assert config["trained_on"] == 2000 and index.ntotal == 2000
+
+    report = {row["spec"]: row for row in evaluate_index_specs(vectors, vectors[:50], specs=["flat", "sq8", "hnsw"])}
+    assert report["flat"]["recall@4"] == 1.0
+    assert report["sq8"]["memory_bytes"] < report["flat"]["memory_bytes"]
@@ -0,0 +1,35 @@
+import pytest
+from app.lazy import LazyResource
+
+
+def test_factory_runs_once_on_first_use():
+    calls = []
+    resource = LazyResource("thing", lambda: calls.append(1) or "value")
+    assert not resource.ready
+    assert resource.get() == "value"
+    assert resource.get() == "value"
+    assert calls == [1]
+    assert resource.status()["ready"] is True
+
+
+def test_failure_is_reported_and_retried():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("down")
+        return "up"
+
+    resource = LazyResource("service", factory)
+    with pytest.raises(ConnectionError):
+        resource.get()
+    assert resource.status() == {"ready": False, "seconds": None, "error": "down"}
+    assert resource.get() == "up"
+    assert resource.status()["error"] is None
+
+
+def test_set_skips_factory():
+    resource = LazyResource("model", lambda: pytest.fail("factory should not run"))
+    resource.set("fake")
+    assert resource.get() == "fake"
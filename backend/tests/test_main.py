@@ -0,0 +1,34 @@
+import os
+os.environ.setdefault("WARM_UP_ON_START", "0")  # importing main must not start the warm-up thread
+import main
+
+
+def test_create_app_registers_shutdown_hooks_once(mocker):
+    mocker.patch.dict(main._shutdown_hooks, {"registered": False})
+    register = mocker.patch("main.atexit.register")
+    main.create_app(warm=False)
+    main.create_app(warm=False)
+    register.assert_called_once_with(main.close_resources)
+
+
+def test_warm_up_retries_failed_steps_with_backoff(mocker):
+    sleep = mocker.patch("main.time.sleep")
+    start = mocker.patch("main.start_vector_store", side_effect=[RuntimeError("supabase down"), RuntimeError("again"), None])
+    resource = mocker.Mock()
+    mocker.patch("main.RESOURCES", [resource])
+
+    main.warm_up(max_backoff=1.5)
+    assert start.call_count == 3
+    resource.get.assert_called_once()
+    assert [call.args[0] for call in sleep.call_args_list] == [1.0, 1.5]
+
+
+def test_stream_returns_json_error_when_a_dependency_fails(mocker):
+    mocker.patch("main.get_snapshot", return_value=object())
+    mocker.patch.object(main.supabase, "get", side_effect=RuntimeError("supabase down"))
+    client = main.app.test_client()
+
+    response = client.post("/chat/stream", json={"email": "a@x.com", "question": "When is the viva?"})
+    assert response.is_json
+    assert response.json == {"status": "error", "message": "An error occurred while processing the question."}
+    assert client.post("/chat", json={"email": "a@x.com", "question": "When is the viva?"}).json == response.json
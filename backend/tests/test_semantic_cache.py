@@ -0,0 +1,96 @@
+import os
+import time
+import threading
+import pytest
+from app.semantic_cache import SemanticCache
+
+
+class KeywordEmbedder:
+    """Deterministic embedder: one dimension per known keyword."""
+    vocabulary = ["project", "deadline", "grading", "viva", "report"]
+
+    def embed_query(self, text):
+        words = text.lower().split()
+        return [float(sum(word.startswith(v) for word in words)) for v in self.vocabulary]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_lookup_uses_cosine_similarity():
+    cache = SemanticCache(KeywordEmbedder(), similarity_threshold=0.9)
+    cache.add("project deadline", "It is due on Friday.")
+    cache.add("grading of viva", "The viva carries 20 marks.")
+
+    assert cache.lookup("deadline for the project")[0] == "It is due on Friday."
+    assert cache.lookup("report") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == pytest.approx(0.5)
+
+
+def test_size_bound_evicts_least_recently_used():
+    cache = SemanticCache(KeywordEmbedder(), max_entries=2)
+    cache.add("project", "a")
+    cache.add("deadline", "b")
+    cache.lookup("project")
+    cache.add("grading", "c")
+
+    assert len(cache) == 2
+    assert cache.lookup("deadline") is None
+    assert cache.lookup("project")[0] == "a"
+
+
+def test_switches_to_ann_index_and_persists(tmpdir):
+    path = str(tmpdir.join("qa_cache"))
+    cache = SemanticCache(KeywordEmbedder(), path=path, ann_min_size=2)
+    cache.add("project", "a")
+    assert cache.index_type == "flat"
+    cache.add("viva", "b")
+    assert cache.index_type == "hnsw"
+    cache.save()
+
+    reloaded = SemanticCache(KeywordEmbedder(), path=path, ann_min_size=2)
+    assert len(reloaded) == 2
+    assert reloaded.lookup("viva")[0] == "b"
+
+
+
+def test_add_persists_on_the_background_saver(tmpdir, mocker):
+    path = str(tmpdir.join("qa_cache"))
+    cache = SemanticCache(KeywordEmbedder(), path=path, persist_every=2, persist_interval=60)
+    saved_on = []
+    save = cache.save
+    mocker.patch.object(cache, "save", side_effect=lambda: (saved_on.append(threading.current_thread().name), save()))
+    cache.add("project", "a")
+    cache.add("viva", "b")
+    for _ in range(100):
+        if saved_on:
+            break
+        time.sleep(0.01)
+    assert saved_on == ["qa-cache-saver"]
+    cache.add("report", "c")
+    cache.close()
+
+    reloaded = SemanticCache(KeywordEmbedder(), path=path)
+    assert len(reloaded) == 3
+    assert reloaded.lookup("report")[0] == "c"
+
+
+def test_failed_save_keeps_the_last_complete_pair(tmpdir, mocker):
+    path = str(tmpdir.join("qa_cache"))
+    cache = SemanticCache(KeywordEmbedder(), path=path, persist_interval=60)
+    cache.add("project", "a")
+    cache.save()
+    cache.add("viva", "b")
+    cache.save()
+    assert sorted(os.listdir(path))[0] == "entries.json" and len(os.listdir(path)) == 2
+
+    replace = mocker.patch("app.semantic_cache.os.replace", side_effect=OSError("disk full"))
+    cache.add("report", "c")
+    cache.save()
+    assert len(os.listdir(path)) == 2
+    assert len(SemanticCache(KeywordEmbedder(), path=path)) == 2
+    mocker.stop(replace)
+    cache.close()
+    assert len(SemanticCache(KeywordEmbedder(), path=path)) == 3
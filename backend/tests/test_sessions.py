@@ -0,0 +1,39 @@
+from app.sessions import InMemorySessionStore, RedisSessionStore
+
+
+def test_sessions_are_isolated_and_windowed():
+    store = InMemorySessionStore(window=2)
+    for number in range(3):
+        store.append("a@x", f"q{number}", f"a{number}")
+    store.append("b@x", "other", "turn")
+    assert store.get("a@x") == [("q1", "a1"), ("q2", "a2")]
+    assert store.get("b@x") == [("other", "turn")]
+    store.clear("a@x")
+    assert store.get("a@x") == []
+
+
+def test_least_recently_used_session_is_evicted():
+    store = InMemorySessionStore(max_sessions=2)
+    store.append("a", "q", "a")
+    store.append("b", "q", "a")
+    store.get("a")
+    store.append("c", "q", "a")
+    assert len(store) == 2
+    assert store.get("b") == []
+    assert store.get("a") == [("q", "a")]
+
+
+def test_idle_sessions_expire():
+    store = InMemorySessionStore(idle_seconds=0)
+    store.append("a", "q", "a")
+    assert store.get("a") == []
+
+
+def test_redis_store_trims_and_refreshes_expiry(fake_redis):
+    store = RedisSessionStore(fake_redis, window=2, idle_seconds=60)
+    for number in range(3):
+        store.append("a@x", f"q{number}", f"a{number}")
+    assert store.get("a@x") == [("q1", "a1"), ("q2", "a2")]
+    assert fake_redis.ttls["chat_session:a@x"] == 60
+    store.clear("a@x")
+    assert store.get("a@x") == []
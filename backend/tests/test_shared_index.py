@@ -0,0 +1,45 @@
+import os
+import shutil
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from app.shared_index import export_shared_index, load_shared_vector_store, current_shared_version, ReadOnlyDocstoreError
+
+
+class LengthEmbedder(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def test_exported_index_is_searchable_read_only(tmpdir):
+    root = str(tmpdir.join("shared"))
+    store = FAISS.from_texts(["short", "a much longer text"], LengthEmbedder(), metadatas=[{"n": 1}, {"n": 2}])
+    version = export_shared_index(store, root)
+    assert current_shared_version(root) == version
+
+    loaded_version, shared = load_shared_vector_store(root, LengthEmbedder())
+    assert loaded_version == version
+    result = shared.similarity_search("tiny!", k=1)[0]
+    assert result.page_content == "short" and result.metadata == {"n": 1}
+    with pytest.raises(ReadOnlyDocstoreError):
+        shared.docstore.add({"new": result})
+    with pytest.raises(PermissionError):
+        shared.docstore.delete([result.id])
+
+
+def test_retired_version_stays_readable_from_new_threads(tmpdir):
+    root = str(tmpdir.join("shared"))
+    store = FAISS.from_texts(["short", "a much longer text"], LengthEmbedder())
+    version = export_shared_index(store, root)
+    _, shared = load_shared_vector_store(root, LengthEmbedder())
+    shutil.rmtree(os.path.join(root, version))
+
+    # Flask serves each request on a new thread
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda query: shared.similarity_search(query, k=1)[0].page_content,
+                                ["tiny!", "another long query"] * 4))
+    assert results == ["short", "a much longer text"] * 4
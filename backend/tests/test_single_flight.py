@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import pytest
+from app.single_flight import SingleFlight, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question("  When is the   DEADLINE? ") == normalize_question("when is the deadline")
+
+
+def test_concurrent_duplicates_share_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "Friday."
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", compute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flights.stats()["saved_llm_calls"] < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["Friday."] * 5
+    assert len(calls) == 1
+    assert flights.stats() == {"computed": 1, "saved_llm_calls": 4, "in_flight": 0}
+
+
+def test_errors_reach_followers_and_key_is_released():
+    flights = SingleFlight()
+    future, is_leader = flights.begin("key")
+    follower, follower_is_leader = flights.begin("key")
+    assert is_leader and not follower_is_leader
+    flights.finish("key", future, error=ValueError("boom"))
+    with pytest.raises(ValueError):
+        follower.result()
+    assert flights.do("key", lambda: "fresh") == "fresh"
+
+
+def test_async_follower_joins_threaded_leader():
+    flights = SingleFlight()
+    future, _ = flights.begin("key")
+
+    async def ask():
+        return await flights.ado("key", lambda: asyncio.sleep(0, result="unused"))
+
+    threading.Timer(0.05, flights.finish, args=("key", future, "Friday.")).start()
+    assert asyncio.run(ask()) == "Friday."
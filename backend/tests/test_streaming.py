@@ -0,0 +1,73 @@
+import time
+from langchain.chains import ConversationalRetrievalChain
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import generate_from_stream
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+from app.streaming import stream_chain_answer
+
+
+class StreamingFakeChatModel(FakeListChatModel):
+    """Fake chat model that, like ChatGroq(streaming=True), streams inside invoke."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        def chunks():
+            for chunk in self._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+                yield chunk
+        return generate_from_stream(chunks())
+
+
+class StaticRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager):
+        return [Document(page_content="The project is due on Friday.")]
+
+
+def collect(stream):
+    tokens = []
+    while True:
+        try:
+            tokens.append(next(stream))
+        except StopIteration as stop:
+            return tokens, stop.value
+
+
+def test_streams_only_answer_tokens():
+    model = StreamingFakeChatModel(responses=["When is the project due?", "Friday."])
+    chain = ConversationalRetrievalChain.from_llm(model, retriever=StaticRetriever())
+
+    tokens, response = collect(stream_chain_answer(chain, {"question": "and the deadline?",
+                                                           "chat_history": [("Hi", "Hello")]}))
+    assert "".join(tokens) == "Friday."
+    assert response["answer"] == "Friday."
+
+
+def test_disconnect_keeps_llm_slot_until_answer_finishes(mocker):
+    from app.chat import stream_user_input
+    from app.concurrency import ConcurrencyLimiter
+    from app.sessions import InMemorySessionStore
+
+    limiter = mocker.patch("app.chat.llm_limiter", ConcurrencyLimiter(max_concurrent=1, max_waiting=0))
+    store = mocker.patch("app.chat.session_store", InMemorySessionStore())
+    mocker.patch("app.chat.lookup_cached_answer", return_value=None)
+    mocker.patch("app.chat.add_to_qa_cache")
+    mocker.patch("app.chat.append_to_chat_log")
+    mocker.patch("app.chat.get_chat_writer")
+    active_at_end = []
+
+    class SlowModel(StreamingFakeChatModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            time.sleep(0.05)
+            active_at_end.append(limiter.stats()["active"])
+            return result
+
+    chain = ConversationalRetrievalChain.from_llm(SlowModel(responses=["Friday at noon."]), retriever=StaticRetriever())
+    events = stream_user_input(mocker.Mock(), chain, "a@b.c", "", "When is the project due?", "s1")
+    assert next(events)[0] == "token"
+    events.close()
+
+    assert active_at_end == [1]
+    assert limiter.stats()["active"] == 0
+    assert store.get("s1") == [("When is the project due?", "Friday at noon.")]
@@ -0,0 +1,43 @@
+from app.supabase_reader import iter_table_rows
+from app.documents import load_file_hashes_from_supabase
+from app.chat import iter_chat_history_from_supabase
+from app.semantic_cache import SemanticCache
+
+
+def test_keyset_pages_cover_every_row_once(fake_supabase):
+    fake_supabase.tables["chat_sessions_2"] = [
+        {"id": number, "question": f"q{number}", "answer": f"a{number}", "timestamp": f"2024-01-{number:02d} 10:00"}
+        for number in range(1, 11)
+    ]
+    rows = iter_table_rows(fake_supabase, "chat_sessions_2", columns="question", page_size=3)
+    assert [row["question"] for row in rows] == [f"q{number}" for number in range(1, 11)]
+    # 3 + 3 + 3 + 1 rows; the short last page ends the scan
+    assert fake_supabase.calls.count(("chat_sessions_2", "select")) == 4
+
+
+def test_projection_and_since_filter(fake_supabase):
+    fake_supabase.tables["chat_sessions_2"] = [
+        {"id": number, "question": f"q{number}", "answer": "a", "timestamp": f"2024-01-{number:02d} 10:00"}
+        for number in range(1, 6)
+    ]
+    rows = list(iter_table_rows(fake_supabase, "chat_sessions_2", columns="question", since="2024-01-04",
+                                since_column="timestamp"))
+    assert rows == [{"question": "q4", "id": 4}, {"question": "q5", "id": 5}]
+
+
+def test_loaders_consume_pages(fake_supabase):
+    fake_supabase.tables["file_hashes"] = [{"filename": f"f{n}.pdf", "hash": f"h{n}", "id": n} for n in range(5)]
+    fake_supabase.tables["chat_sessions_2"] = [{"id": n, "question": f"q{n}", "answer": f"a{n}"} for n in range(5)]
+    assert load_file_hashes_from_supabase(fake_supabase) == {f"f{n}.pdf": f"h{n}" for n in range(5)}
+    history = iter_chat_history_from_supabase(fake_supabase, page_size=2)
+    assert next(history) == ("q0", "a0")
+    assert list(history) == [(f"q{n}", f"a{n}") for n in range(1, 5)]
+
+
+def test_seed_accepts_a_stream_in_batches(mocker):
+    embedder = mocker.Mock()
+    embedder.embed_documents.side_effect = lambda texts: [[1.0, float(len(t))] for t in texts]
+    cache = SemanticCache(embedder, path=None)
+    cache.seed(((f"q{n}", f"a{n}") for n in range(5)), batch_size=2)
+    assert embedder.embed_documents.call_count == 3
+    assert len(cache._entries) == 5
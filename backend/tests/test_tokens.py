@@ -0,0 +1,26 @@
+import pytest
+from app import tokens
+from conftest import WhitespaceEncoding
+
+
+@pytest.fixture
+def encoding(mocker):
+    fake = WhitespaceEncoding()
+    mocker.patch("app.tokens.get_encoding", return_value=fake)
+    tokens._history_memo.clear()
+    return fake
+
+
+def test_count_tokens_batch_returns_counts_and_total(encoding):
+    assert tokens.count_tokens_batch(["one two", "three", ""]) == ([2, 1, 0], 3)
+    assert tokens.count_tokens_batch([]) == ([], 0)
+
+
+def test_history_counts_only_new_turns(encoding):
+    history = [("what is due", "the report"), ("when", "friday")]
+    assert tokens.count_tokens_in_chat_history(history) == 7
+    encoded = encoding.encoded
+
+    history.append(("where", "room 101"))
+    assert tokens.count_tokens_in_chat_history(history) == 10
+    assert encoding.encoded - encoded == 2
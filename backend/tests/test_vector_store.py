@@ -1,22 +1,116 @@
-import os
 import pytest
-from app.vector_store import create_vector_store, get_file_mod_times, reload_vector_store_if_needed
+from langchain_core.documents import Document
+import app.chunking as chunking
+import app.vector_store as vector_store
+from app.documents import scan_directory
+from app.index_factory import BENCHMARK_SPECS, apply_search_params, removes_by_position
+from app.vector_store import create_vector_store, reload_vector_store_if_needed, get_snapshot
+from conftest import HashEmbeddings, WhitespaceEncoding
+
+
+@pytest.fixture(autouse=True)
+def offline_vector_store(mocker, tmp_path, monkeypatch):
+    # The index and file manifest are saved relative to the working directory.
+    monkeypatch.chdir(tmp_path)
+    mocker.patch.object(vector_store, "embedder", HashEmbeddings())
+    mocker.patch.object(chunking, "get_encoding", return_value=WhitespaceEncoding())
+    mocker.patch.dict(vector_store.in_memory_store, {"snapshot": None, "shared_version": None})
 
 def test_create_vector_store():
     document_texts = ["This is a test document."]
     vector_store = create_vector_store(document_texts)
     assert vector_store is not None
+    assert vector_store.index.ntotal == 1
 
-def test_get_file_mod_times(tmpdir):
+def test_scan_directory(tmpdir):
     test_dir = tmpdir.mkdir("hidden_docs")
     test_file = test_dir.join("test.txt")
     test_file.write("This is a test document.")
-    mod_times = get_file_mod_times(str(test_dir))
-    assert len(mod_times) == 1
+    manifest = scan_directory(str(test_dir), {})
+    assert len(manifest) == 1
+    assert manifest["test.txt"]["sha256"]
 
-def test_reload_vector_store_if_needed(tmpdir):
+def test_reload_vector_store_if_needed(tmpdir, fake_supabase):
     test_dir = tmpdir.mkdir("hidden_docs")
     test_file = test_dir.join("test.txt")
     test_file.write("This is a test document.")
-    vector_store = reload_vector_store_if_needed(str(test_dir))
-    assert vector_store is not None
\ No newline at end of file
+    vector_store = reload_vector_store_if_needed(str(test_dir), fake_supabase)
+    assert vector_store is not None
+    assert get_snapshot().generation == 1
+    # Nothing changed, so the snapshot being served is kept
+    assert reload_vector_store_if_needed(str(test_dir), fake_supabase) is vector_store
+    assert get_snapshot().generation == 1
+
+def test_failed_update_is_retried(tmpdir, fake_supabase, mocker):
+    test_dir = tmpdir.mkdir("hidden_docs")
+    test_file = test_dir.join("test.txt")
+    test_file.write("This is a test document.")
+    store = vector_store.load_or_build_vector_store(str(test_dir), fake_supabase)
+    test_file.write("The deadline moved to Monday.")
+
+    failing_update = mocker.patch.object(vector_store, "update_vector_store", side_effect=RuntimeError("embedder down"))
+    with pytest.raises(RuntimeError):
+        vector_store.load_or_build_vector_store(str(test_dir), fake_supabase, current=store)
+    # Supabase still holds the hash of the indexed version
+    assert fake_supabase.calls.count(("file_hashes", "upsert")) == 1
+
+    mocker.stop(failing_update)
+    updated = vector_store.load_or_build_vector_store(str(test_dir), fake_supabase, current=store)
+    assert updated is not store
+    texts = [doc.page_content for doc in updated.docstore._dict.values()]
+    assert "The deadline moved to Monday." in texts
+    assert fake_supabase.calls.count(("file_hashes", "upsert")) == 2
+
+@pytest.mark.parametrize("spec", BENCHMARK_SPECS)
+def test_update_vector_store_keeps_retrieval_correct(spec, tmpdir):
+    documents = [Document(page_content=f"doc {i}", metadata={"file": "a.txt" if i < 3 else "b.txt", "chunk_id": f"id{i}"})
+                 for i in range(400)]
+    manifest = {"files": {"a.txt": ["id0", "id1", "id2"], "b.txt": [f"id{i}" for i in range(3, 400)]},
+                "tombstones": []}
+    store = create_vector_store(documents, manifest, spec=spec)
+    test_dir = tmpdir.mkdir("hidden_docs")
+    test_dir.join("a.txt").write("new text")
+
+    store = vector_store.update_vector_store(store, manifest, str(test_dir), {"a.txt"}, set())
+    # Search exhaustively, so only the label -> chunk mapping can make results wrong
+    apply_search_params(store.index, {"nprobe": 4096, "ef_search": 1024})
+
+    live = [doc.page_content for doc in store.similarity_search("doc 0", k=400, fetch_k=store.index.ntotal,
+                                                                  filter=vector_store.is_live_chunk)]
+    assert sorted(live) == sorted(["new text"] + [f"doc {i}" for i in range(3, 400)])
+    if spec != "ivf_pq":  # PQ codes are too lossy for exact nearest neighbours
+        for query in ["doc 399", "doc 5", "new text"]:
+            assert store.similarity_search(query, k=1, filter=vector_store.is_live_chunk)[0].page_content == query
+
+@pytest.mark.parametrize("spec", BENCHMARK_SPECS)
+def test_unchanged_chunks_of_modified_files_are_kept_without_rebuilding(spec, tmpdir, mocker):
+    test_dir = tmpdir.mkdir("hidden_docs")
+    words = [f"w{i}" for i in range(1000)]
+    test_dir.join("a.txt").write(" ".join(words))
+    chunks = chunking.load_document_chunks(str(test_dir))
+    filler = [Document(page_content=f"doc {i}", metadata={"file": "b.txt", "chunk_id": f"id{i}"}) for i in range(400)]
+    manifest = {"files": {"a.txt": [chunk.metadata["chunk_id"] for chunk in chunks],
+                          "b.txt": [f"id{i}" for i in range(400)]}, "tombstones": []}
+    store = create_vector_store(chunks + filler, manifest, spec=spec)
+    original_ids = manifest["files"]["a.txt"]
+    compact = mocker.spy(vector_store, "compact_vector_store")
+    embed = mocker.spy(vector_store.embedder, "embed_documents")
+
+    # Only the last window changes, so only it is embedded again
+    test_dir.join("a.txt").write(" ".join(words[:-1] + ["changed"]))
+    store = vector_store.update_vector_store(store, manifest, str(test_dir), {"a.txt"}, set())
+    assert manifest["files"]["a.txt"][:-1] == original_ids[:-1]
+    assert [len(texts) for (texts,), _ in embed.call_args_list] == [1]
+    changed_id = manifest["files"]["a.txt"][-1]
+
+    # Reverting brings a tombstoned chunk back without embedding it; removed chunks are embedded again
+    test_dir.join("a.txt").write(" ".join(words))
+    store = vector_store.update_vector_store(store, manifest, str(test_dir), {"a.txt"}, set())
+    assert manifest["files"]["a.txt"] == original_ids
+    assert len(embed.call_args_list) == (2 if removes_by_position(store.index) else 1)
+    assert manifest["tombstones"] == ([] if removes_by_position(store.index) else [changed_id])
+    compact.assert_not_called()
+
+    apply_search_params(store.index, {"nprobe": 4096, "ef_search": 1024})
+    live = store.similarity_search("w0", k=store.index.ntotal, fetch_k=store.index.ntotal, filter=vector_store.is_live_chunk)
+    assert sorted(doc.metadata["chunk_id"] for doc in live if doc.metadata["file"] == "a.txt") == sorted(original_ids)